@@ -0,0 +1,22 @@
+"""
+Offline harness for running Profiler outside Kodi.
+
+    python -m bench.run --addons 50 --out results.json
+    python -m bench.run --addons 50 --compare results.json
+
+bench.harness installs fake xbmc/xbmcgui/xbmcvfs/xbmcaddon modules
+(bench/kodistubs) backed by a temp tree, bench.synth generates synthetic
+userdata, bench.run times backup / restore / install per phase.
+
+    python -m bench.fakeb2 --port 8765 --fail-rate 0.05
+    python -m bench.b2bench --size-mb 64 --threads 1,2,4 --latency-ms 30
+
+bench.fakeb2 is a local B2 stand-in with injectable latency, bandwidth caps
+and 503/timeout faults (set Profiler's "API URL" setting to its address);
+bench.b2bench measures upload/download throughput and retries against it.
+    python -m bench.startup --repeat 7 --out startup.json
+
+bench.startup times menu-open latency and the service's start-up cost in
+fresh interpreters, so import-time regressions show up.
+Not shipped in the add-on's runtime path; nothing under resources/ imports it.
+"""
@@ -0,0 +1,159 @@
+"""
+B2 transfer benchmark against the local fake server (bench.fakeb2):
+
+    upload_simple       one b2_upload_file of the whole archive
+    upload_large_<n>    large-file upload with n parts in flight
+    download            download_to_file() in Range chunks
+
+Each phase reports seconds, MB/s, server requests and the faults that were
+injected (and survived through retries), and checks the bytes round-trip.
+
+    python -m bench.b2bench --size-mb 64 --threads 1,2,4 --latency-ms 30 --fail-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+
+
+def _parse(argv):
+    p = argparse.ArgumentParser(prog="python -m bench.b2bench", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--size-mb", type=float, default=32)
+    p.add_argument("--part-mb", type=float, default=5, help="large-file part size (also the server minimum)")
+    p.add_argument("--threads", default="1,2,4", help="comma separated large-file concurrency levels")
+    p.add_argument("--chunk-mb", type=float, default=8, help="download Range chunk size")
+    p.add_argument("--latency-ms", type=float, default=0)
+    p.add_argument("--bandwidth-kbps", type=float, default=0)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--timeout-rate", type=float, default=0.0)
+    p.add_argument("--hang-s", type=float, default=2.0, help="how long an injected timeout hangs")
+    p.add_argument("--client-timeout", type=float, default=1.0, help="B2Client socket timeout")
+    p.add_argument("--backoff-s", type=float, default=0.05, help="first retry backoff")
+    p.add_argument("--retries", type=int, default=6)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="", help="write results JSON here")
+    p.add_argument("--verbose", action="store_true")
+    return p.parse_args(argv)
+
+
+def run(args) -> dict:
+    root = tempfile.mkdtemp(prefix="profiler-b2bench-")
+    state = harness.install(root, verbose=args.verbose)
+
+    from bench import fakeb2
+    from resources.lib import b2 as b2mod
+    from resources.lib.log import flush as flush_log
+
+    b2mod.RETRY_BACKOFF_S = args.backoff_s
+    b2mod.RETRIES = args.retries
+    part_size = int(args.part_mb * 1024 * 1024)
+
+    server = fakeb2.start(latency_ms=args.latency_ms, bandwidth_kbps=args.bandwidth_kbps,
+                          fail_rate=args.fail_rate, timeout_rate=args.timeout_rate, hang_s=args.hang_s,
+                          min_part_size=part_size, seed=args.seed)
+    try:
+        src = os.path.join(root, "archive.zip")
+        with open(src, "wb") as f:
+            f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+        size = os.path.getsize(src)
+        with open(src, "rb") as f:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+
+        client = b2mod.B2Client("bench", "bench", api_base=server.url, timeout=args.client_timeout)
+        client.authorize()
+        bucket_id = b2mod.with_retries(lambda: client.get_bucket_id("bench"), "List buckets")
+        results = {}
+
+        def phase(name, fn):
+            before = json.loads(json.dumps(server.state.stats))
+            flush_log(notify=False)
+            warned = len([1 for lvl, _ in state.LOG if lvl >= 2])
+            t0 = time.perf_counter()
+            error = ""
+            try:
+                fn()
+            except Exception as e:
+                error = str(e)
+            wall = time.perf_counter() - t0
+            flush_log(notify=False)
+            after = server.state.stats
+            results[name] = {
+                "seconds": round(wall, 3),
+                "mb_per_s": round(size / 1048576 / wall, 2) if wall and not error else 0.0,
+                "requests": sum(after["requests"].values()) - sum(before["requests"].values()),
+                "faults": {k: after["faults"][k] - before["faults"][k] for k in after["faults"]},
+                "retries": len([1 for lvl, _ in state.LOG if lvl >= 2]) - warned,
+                "error": error,
+            }
+            r = results[name]
+            status = f"FAILED: {error}" if error else f"{r['mb_per_s']:7.2f} MB/s"
+            print(f"{name:18s} {wall:8.3f}s  {status}  ({r['requests']} requests, "
+                  f"{sum(r['faults'].values())} faults, {r['retries']} retries)")
+
+        def check_remote():
+            v = server.state.latest(bucket_id, "bench/archive.zip")
+            if v is None or hashlib.sha1(v["data"]).hexdigest() != sha1:
+                raise RuntimeError("uploaded bytes differ")
+            if b2mod.with_retries(lambda: client.latest_sha1(bucket_id, "bench/archive.zip"), "List") != sha1:
+                raise RuntimeError("latest_sha1 does not match")
+
+        def upload_simple():
+            with open(src, "rb") as f:
+                data = f.read()
+
+            def send():
+                up = client.get_upload_url(bucket_id)
+                return client.upload_file(up["uploadUrl"], up["authorizationToken"], "bench/archive.zip", data, sha1=sha1)
+
+            b2mod.with_retries(send, "Upload")
+            check_remote()
+
+        phase("upload_simple", upload_simple)
+
+        for n in [int(x) for x in args.threads.split(",") if x.strip()]:
+            def upload_large(n=n):
+                client.upload_large_file(bucket_id, "bench/archive.zip", src, sha1=sha1, part_size=part_size, threads=n)
+                check_remote()
+            phase(f"upload_large_{n}", upload_large)
+
+        dst = os.path.join(root, "download.zip")
+
+        def download():
+            client.download_to_file("bench", "bench/archive.zip", dst, chunk_size=int(args.chunk_mb * 1024 * 1024))
+            with open(dst, "rb") as f:
+                if hashlib.sha1(f.read()).hexdigest() != sha1:
+                    raise RuntimeError("downloaded bytes differ")
+
+        phase("download", download)
+
+        return {
+            "schema": 1,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "verbose")},
+            "bytes": size,
+            "phases": results,
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    args = _parse(argv if argv is not None else sys.argv[1:])
+    result = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"results: {args.out}")
+    return 1 if any(p["error"] for p in result["phases"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
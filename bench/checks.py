@@ -0,0 +1,98 @@
+"""
+End-to-end correctness checks on the fake Kodi, for restore paths the
+benchmark doesn't cover. Each check gets a fresh tree and exits non-zero
+on the first mismatch.
+
+    profile_delta   restore one secondary profile from a backup whose
+                    shared (deduped) file is delta-encoded against a base
+
+    python -m bench.checks
+    python -m bench.checks profile_delta
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from bench import harness
+
+SHARED = "addon_data/plugin.shared/cache.bin"
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _profiles_xml(path: str, names):
+    rows = "".join(f'<profile><name>{n}</name><directory pathversion="1">profiles/{n}/</directory></profile>'
+                   for n in names)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0"?>\n<profiles><lastloaded>0</lastloaded>'
+                '<profile><name>Master user</name><directory pathversion="1">special://masterprofile/</directory></profile>'
+                f"{rows}</profiles>")
+
+
+def profile_delta(root: str):
+    state = harness.install(root, settings={"all_profiles": "true", "delta_min_size_mb": "0"})
+    from bench import synth
+    synth.generate(state, addons=5, median_kb=8)
+
+    import xbmcaddon
+    from resources.lib.journal import RestoreJournal
+    from resources.lib.paths import master, temp
+    from resources.lib.workflow_backup import find_base_backup
+    from resources.lib.workflow_backup_local import backup_local
+    from resources.lib.workflow_restore_pipeline import restore_pipelined
+
+    # The same file in master and both profiles: stored once (master's copy)
+    shared = os.urandom(2 * 1024 * 1024)
+    for rel in (SHARED, f"profiles/Kids/{SHARED}", f"profiles/Guest/{SHARED}"):
+        _write(master(rel), shared)
+    _profiles_xml(master("profiles.xml"), ("Kids", "Guest"))
+    backup_local(build_name="base")
+
+    # A small change everywhere, so the kept copy becomes a delta against base
+    changed = bytearray(shared)
+    changed[100000:100016] = b"x" * 16
+    for rel in (SHARED, f"profiles/Kids/{SHARED}", f"profiles/Guest/{SHARED}"):
+        _write(master(rel), bytes(changed))
+    xbmcaddon.Addon().setSetting("delta_base", "base")
+    zip_path = backup_local(build_name="inc")
+
+    shutil.rmtree(master("profiles"))
+    journal = RestoreJournal()
+    journal.begin({"kind": "local", "zip": "inc.zip"})
+    restore_pipelined(zip_path, temp("profiler/restore_staging"), overwrite_xml=True, journal=journal,
+                      find_base=find_base_backup, profiles=["profiles/Kids"])
+    journal.finish()
+
+    kid = master(f"profiles/Kids/{SHARED}")
+    if not os.path.isfile(kid) or open(kid, "rb").read() != bytes(changed):
+        raise AssertionError("Kids' shared file was not rebuilt from the delta")
+    if os.path.exists(master("profiles/Guest")):
+        raise AssertionError("Guest was restored but not chosen")
+
+
+CHECKS = {"profile_delta": profile_delta}
+
+
+def main(argv=None) -> int:
+    names = (argv if argv is not None else sys.argv[1:]) or list(CHECKS)
+    for name in names:
+        root = tempfile.mkdtemp(prefix="profiler-check-")
+        try:
+            CHECKS[name](root)
+            print(f"{name:20s} ok")
+        except AssertionError as e:
+            print(f"{name:20s} FAILED: {e}")
+            return 1
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
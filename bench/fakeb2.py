@@ -0,0 +1,538 @@
+"""
+Local stand-in for the Backblaze B2 native API (v2), enough for B2Client:
+authorize, list_buckets, list_file_names / list_file_versions (with
+pagination), get_upload_url + upload_file, the large-file calls (start,
+get_upload_part_url, upload_part, finish, cancel), delete_file_version and
+downloads by name / id with Range support.
+
+Files live in memory. Faults are injectable so throughput, concurrency and
+retry behaviour can be measured on one box:
+
+    latency_ms      delay before every response
+    bandwidth_kbps  shared cap on request + response bodies (one pipe)
+    fail_rate       fraction of requests answered 503 service_unavailable
+    timeout_rate    fraction of requests that hang for hang_s, then drop
+                    the connection without a response
+
+authorize is never faulted, so a run can always start. Point the add-on (or
+B2Client(api_base=...)) at the printed URL; any key id / key is accepted.
+
+    python -m bench.fakeb2 --port 8765 --latency-ms 40 --fail-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API = "/b2api/v2/"
+CHUNK = 64 * 1024
+
+
+class Pacer:
+    """Global byte-rate cap shared by every connection (0 = unlimited)."""
+
+    def __init__(self, kbps: float = 0):
+        self.rate = kbps * 1024
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def take(self, n: int) -> None:
+        if self.rate <= 0 or n <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + n / self.rate
+            wait = self._next - now
+        time.sleep(wait)
+
+
+class B2Error(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status, self.code, self.message = status, code, message
+
+
+class FakeB2State:
+    def __init__(self, buckets=("bench",), latency_ms: float = 0, bandwidth_kbps: float = 0,
+                 fail_rate: float = 0.0, timeout_rate: float = 0.0, hang_s: float = 5.0,
+                 min_part_size: int = 5 * 1024 * 1024, seed: int = 1):
+        self.buckets = {f"bucket{i + 1}": name for i, name in enumerate(buckets)}
+        self.latency_s = latency_ms / 1000.0
+        self.pacer = Pacer(bandwidth_kbps)
+        self.fail_rate = fail_rate
+        self.timeout_rate = timeout_rate
+        self.hang_s = hang_s
+        self.min_part_size = min_part_size
+        self.account_token = "fake-account-token"
+        self.versions = []  # dicts; "data" holds the bytes
+        self.large = {}  # fileId -> pending large file
+        self.upload_tokens = {}  # token -> bucketId / large fileId
+        self.stats = {"requests": {}, "faults": {"503": 0, "timeout": 0}, "bytes_in": 0, "bytes_out": 0}
+        self._seq = 0
+        self._random = random.Random(seed)
+        self.lock = threading.RLock()
+
+    # --- helpers ---
+
+    def next_id(self, kind: str) -> str:
+        with self.lock:
+            self._seq += 1
+            return f"4_z{kind}_{self._seq:08d}"
+
+    def count(self, op: str) -> None:
+        with self.lock:
+            self.stats["requests"][op] = self.stats["requests"].get(op, 0) + 1
+
+    def roll_fault(self) -> str:
+        with self.lock:
+            r = self._random.random()
+            if r < self.fail_rate:
+                self.stats["faults"]["503"] += 1
+                return "503"
+            if r < self.fail_rate + self.timeout_rate:
+                self.stats["faults"]["timeout"] += 1
+                return "timeout"
+        return ""
+
+    def bucket_name(self, bucket_id: str) -> str:
+        if bucket_id not in self.buckets:
+            raise B2Error(400, "bad_request", f"Invalid bucketId: {bucket_id}")
+        return self.buckets[bucket_id]
+
+    def bucket_id(self, bucket_name: str) -> str:
+        for bid, name in self.buckets.items():
+            if name == bucket_name:
+                return bid
+        raise B2Error(404, "not_found", f"Bucket does not exist: {bucket_name}")
+
+    @staticmethod
+    def public(v: dict) -> dict:
+        return {k: val for k, val in v.items() if k != "data" and not k.startswith("_")}
+
+    def add_version(self, bucket_id: str, name: str, data: bytes, content_type: str, sha1: str,
+                    file_info: dict = None, file_id: str = "") -> dict:
+        v = {
+            "accountId": "fakeaccount",
+            "action": "upload",
+            "bucketId": bucket_id,
+            "contentLength": len(data),
+            "contentSha1": sha1,
+            "contentType": content_type,
+            "fileId": file_id or self.next_id("file"),
+            "fileInfo": dict(file_info or {}),
+            "fileName": name,
+            "uploadTimestamp": int(time.time() * 1000),
+            "data": data,
+        }
+        with self.lock:
+            self._seq += 1
+            v["_order"] = self._seq
+            self.versions.append(v)
+        return v
+
+    def sorted_versions(self, bucket_id: str) -> list:
+        """Name ascending, newest first within a name (B2 order)."""
+        with self.lock:
+            vs = [v for v in self.versions if v["bucketId"] == bucket_id]
+        return sorted(vs, key=lambda v: (v["fileName"], -v["_order"]))
+
+    def latest(self, bucket_id: str, name: str):
+        for v in self.sorted_versions(bucket_id):
+            if v["fileName"] == name:
+                return v if v["action"] == "upload" else None
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeB2/1"
+    state: FakeB2State = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- plumbing ---
+
+    def _read_body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        parts = []
+        while n > 0:
+            buf = self.rfile.read(min(CHUNK, n))
+            if not buf:
+                break
+            self.state.pacer.take(len(buf))
+            parts.append(buf)
+            n -= len(buf)
+        data = b"".join(parts)
+        with self.state.lock:
+            self.state.stats["bytes_in"] += len(data)
+        return data
+
+    def _send(self, status: int, body: bytes, headers: dict = None, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        view = memoryview(body)
+        for i in range(0, len(body), CHUNK):
+            piece = view[i:i + CHUNK]
+            self.state.pacer.take(len(piece))
+            self.wfile.write(piece)
+        with self.state.lock:
+            self.state.stats["bytes_out"] += len(body)
+
+    def _json(self, obj, status: int = 200):
+        self._send(status, json.dumps(obj).encode("utf-8"))
+
+    def _error(self, e: B2Error):
+        self._json({"status": e.status, "code": e.code, "message": e.message}, e.status)
+
+    def _check_token(self, expected: str):
+        if self.headers.get("Authorization") != expected:
+            raise B2Error(401, "bad_auth_token", "Invalid authorization token")
+
+    def _handle(self, method: str):
+        url = urllib.parse.urlsplit(self.path)
+        path, query = url.path, urllib.parse.parse_qs(url.query)
+        op = path[len(API):] if path.startswith(API) else path.split("/")[1] if "/" in path else path
+        self.state.count(op)
+
+        try:
+            if path == API + "b2_authorize_account":
+                return self._authorize()
+            if path == "/_fake/stats":
+                with self.state.lock:
+                    return self._json(dict(self.state.stats, files=len(self.state.versions)))
+
+            if self.state.latency_s:
+                time.sleep(self.state.latency_s)
+            fault = self.state.roll_fault()
+            if fault == "timeout":
+                self._read_body()
+                time.sleep(self.state.hang_s)
+                self.close_connection = True
+                return
+            if fault == "503":
+                self._read_body()
+                raise B2Error(503, "service_unavailable", "Injected fault")
+
+            if method == "GET" and path.startswith("/file/"):
+                return self._download_by_name(urllib.parse.unquote(path[len("/file/"):]))
+            if method == "GET" and path == API + "b2_download_file_by_id":
+                self._check_token(self.state.account_token)
+                return self._download(self._by_id((query.get("fileId") or [""])[0]))
+            if method == "POST" and path.startswith("/upload/"):
+                return self._upload_file(path)
+            if method == "POST" and path.startswith("/upload_part/"):
+                return self._upload_part(path)
+            if method == "POST" and path.startswith(API):
+                self._check_token(self.state.account_token)
+                body = json.loads(self._read_body().decode("utf-8") or "{}")
+                fn = getattr(self, "_api_" + op[len("b2_"):], None) if op.startswith("b2_") else None
+                if fn is None:
+                    raise B2Error(404, "not_found", f"Unknown API: {op}")
+                return self._json(fn(body))
+            raise B2Error(404, "not_found", f"No route: {method} {path}")
+        except B2Error as e:
+            self._error(e)
+        except (ValueError, KeyError) as e:
+            self._error(B2Error(400, "bad_request", str(e)))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    # --- account / buckets ---
+
+    def _authorize(self):
+        if not (self.headers.get("Authorization") or "").startswith("Basic "):
+            raise B2Error(401, "bad_auth_token", "Missing Basic authorization")
+        base = f"http://{self.headers.get('Host')}"
+        self._json({
+            "accountId": "fakeaccount",
+            "apiUrl": base,
+            "downloadUrl": base,
+            "authorizationToken": self.state.account_token,
+            "recommendedPartSize": max(self.state.min_part_size, 100 * 1024 * 1024),
+            "absoluteMinimumPartSize": self.state.min_part_size,
+        })
+
+    def _api_list_buckets(self, body):
+        out = [{"accountId": "fakeaccount", "bucketId": bid, "bucketName": name, "bucketType": "allPrivate"}
+               for bid, name in sorted(self.state.buckets.items())]
+        if body.get("bucketName"):
+            out = [b for b in out if b["bucketName"] == body["bucketName"]]
+        return {"buckets": out}
+
+    # --- listing ---
+
+    @staticmethod
+    def _max_count(body) -> int:
+        n = int(body.get("maxFileCount") or 100)
+        if not 1 <= n <= 10000:
+            raise B2Error(400, "bad_request", "maxFileCount out of range")
+        return n
+
+    def _api_list_file_names(self, body):
+        bucket_id = body["bucketId"]
+        self.state.bucket_name(bucket_id)
+        prefix, start, limit = body.get("prefix") or "", body.get("startFileName") or "", self._max_count(body)
+        names, seen = [], set()
+        for v in self.state.sorted_versions(bucket_id):
+            if v["fileName"] in seen:
+                continue
+            seen.add(v["fileName"])
+            if v["action"] == "upload" and v["fileName"].startswith(prefix) and v["fileName"] >= start:
+                names.append(v)
+        page = names[:limit]
+        nxt = names[limit]["fileName"] if len(names) > limit else None
+        return {"files": [self.state.public(v) for v in page], "nextFileName": nxt}
+
+    def _api_list_file_versions(self, body):
+        bucket_id = body["bucketId"]
+        self.state.bucket_name(bucket_id)
+        prefix, limit = body.get("prefix") or "", self._max_count(body)
+        start_name, start_id = body.get("startFileName") or "", body.get("startFileId") or ""
+        vs = [v for v in self.state.sorted_versions(bucket_id) if v["fileName"].startswith(prefix)]
+        if start_name:
+            vs = [v for v in vs if v["fileName"] >= start_name]
+            if start_id:
+                ids = [v["fileId"] for v in vs if v["fileName"] == start_name]
+                skip = ids.index(start_id) if start_id in ids else 0
+                drop = set(ids[:skip])
+                vs = [v for v in vs if v["fileId"] not in drop]
+        page = vs[:limit]
+        nxt = vs[limit] if len(vs) > limit else None
+        return {"files": [self.state.public(v) for v in page],
+                "nextFileName": nxt["fileName"] if nxt else None,
+                "nextFileId": nxt["fileId"] if nxt else None}
+
+    def _api_delete_file_version(self, body):
+        with self.state.lock:
+            for v in self.state.versions:
+                if v["fileId"] == body["fileId"] and v["fileName"] == body["fileName"]:
+                    self.state.versions.remove(v)
+                    return {"fileId": v["fileId"], "fileName": v["fileName"]}
+        raise B2Error(400, "file_not_present", f"File not present: {body['fileName']} {body['fileId']}")
+
+    # --- simple uploads ---
+
+    def _new_upload_token(self, target: str) -> str:
+        token = self.state.next_id("upload")
+        with self.state.lock:
+            self.state.upload_tokens[token] = target
+        return token
+
+    def _api_get_upload_url(self, body):
+        bucket_id = body["bucketId"]
+        self.state.bucket_name(bucket_id)
+        token = self._new_upload_token(bucket_id)
+        base = f"http://{self.headers.get('Host')}"
+        return {"bucketId": bucket_id, "uploadUrl": f"{base}/upload/{bucket_id}/{token}", "authorizationToken": token}
+
+    def _check_upload(self, path: str):
+        _, _, target, token = path.split("/", 3)
+        with self.state.lock:
+            known = self.state.upload_tokens.get(token)
+        if known != target or self.headers.get("Authorization") != token:
+            raise B2Error(401, "bad_auth_token", "Invalid upload authorization")
+        return target
+
+    def _check_sha1(self, data: bytes) -> str:
+        sha1 = (self.headers.get("X-Bz-Content-Sha1") or "").lower()
+        if sha1 != "do_not_verify" and sha1 != hashlib.sha1(data).hexdigest():
+            raise B2Error(400, "bad_request", "Sha1 did not match data received")
+        return hashlib.sha1(data).hexdigest()
+
+    def _upload_file(self, path: str):
+        bucket_id = self._check_upload(path)
+        data = self._read_body()
+        sha1 = self._check_sha1(data)
+        name = urllib.parse.unquote(self.headers.get("X-Bz-File-Name") or "")
+        if not name:
+            raise B2Error(400, "bad_request", "X-Bz-File-Name missing")
+        info = {k[len("X-Bz-Info-"):]: urllib.parse.unquote(v)
+                for k, v in self.headers.items() if k.startswith("X-Bz-Info-")}
+        v = self.state.add_version(bucket_id, name, data, self.headers.get("Content-Type") or "b2/x-auto", sha1, info)
+        self._json(self.state.public(v))
+
+    # --- large files ---
+
+    def _pending(self, file_id: str) -> dict:
+        with self.state.lock:
+            lf = self.state.large.get(file_id)
+        if lf is None:
+            raise B2Error(400, "bad_request", f"No active large file: {file_id}")
+        return lf
+
+    def _api_start_large_file(self, body):
+        bucket_id = body["bucketId"]
+        self.state.bucket_name(bucket_id)
+        file_id = self.state.next_id("large")
+        lf = {"fileId": file_id, "fileName": body["fileName"], "bucketId": bucket_id,
+              "contentType": body.get("contentType") or "b2/x-auto", "fileInfo": body.get("fileInfo") or {},
+              "parts": {}}
+        with self.state.lock:
+            self.state.large[file_id] = lf
+        return {"fileId": file_id, "fileName": lf["fileName"], "bucketId": bucket_id, "action": "start",
+                "contentType": lf["contentType"], "fileInfo": lf["fileInfo"],
+                "uploadTimestamp": int(time.time() * 1000)}
+
+    def _api_get_upload_part_url(self, body):
+        self._pending(body["fileId"])
+        token = self._new_upload_token(body["fileId"])
+        base = f"http://{self.headers.get('Host')}"
+        return {"fileId": body["fileId"], "uploadUrl": f"{base}/upload_part/{body['fileId']}/{token}",
+                "authorizationToken": token}
+
+    def _upload_part(self, path: str):
+        file_id = self._check_upload(path)
+        lf = self._pending(file_id)
+        number = int(self.headers.get("X-Bz-Part-Number") or 0)
+        if not 1 <= number <= 10000:
+            raise B2Error(400, "bad_request", "X-Bz-Part-Number out of range")
+        data = self._read_body()
+        sha1 = self._check_sha1(data)
+        with self.state.lock:
+            lf["parts"][number] = (sha1, data)
+        self._json({"fileId": file_id, "partNumber": number, "contentLength": len(data), "contentSha1": sha1})
+
+    def _api_finish_large_file(self, body):
+        lf = self._pending(body["fileId"])
+        sha1s = list(body.get("partSha1Array") or [])
+        parts = lf["parts"]
+        if sorted(parts) != list(range(1, len(sha1s) + 1)):
+            raise B2Error(400, "bad_request", "Part numbers are not 1..N")
+        if len(sha1s) < 2:
+            raise B2Error(400, "bad_request", "Large files need at least 2 parts")
+        for n, sha1 in enumerate(sha1s, start=1):
+            if parts[n][0] != sha1:
+                raise B2Error(400, "bad_request", f"Part {n} sha1 mismatch")
+            if n < len(sha1s) and len(parts[n][1]) < self.state.min_part_size:
+                raise B2Error(400, "bad_request", f"Part {n} is smaller than {self.state.min_part_size} bytes")
+        data = b"".join(parts[n][1] for n in range(1, len(sha1s) + 1))
+        with self.state.lock:
+            del self.state.large[lf["fileId"]]
+        v = self.state.add_version(lf["bucketId"], lf["fileName"], data, lf["contentType"], "none",
+                                   lf["fileInfo"], file_id=lf["fileId"])
+        return self.state.public(v)
+
+    def _api_cancel_large_file(self, body):
+        lf = self._pending(body["fileId"])
+        with self.state.lock:
+            self.state.large.pop(lf["fileId"], None)
+        return {"fileId": lf["fileId"], "fileName": lf["fileName"], "bucketId": lf["bucketId"]}
+
+    # --- downloads ---
+
+    def _by_id(self, file_id: str) -> dict:
+        with self.state.lock:
+            for v in self.state.versions:
+                if v["fileId"] == file_id:
+                    return v
+        raise B2Error(404, "not_found", f"File not present: {file_id}")
+
+    def _download_by_name(self, rest: str):
+        self._check_token(self.state.account_token)
+        bucket_name, _, name = rest.partition("/")
+        v = self.state.latest(self.state.bucket_id(bucket_name), name)
+        if v is None:
+            raise B2Error(404, "not_found", f"File not present: {name}")
+        self._download(v)
+
+    def _download(self, v: dict):
+        data, total = v["data"], len(v["data"])
+        headers = {
+            "x-bz-file-id": v["fileId"],
+            "x-bz-file-name": urllib.parse.quote(v["fileName"]),
+            "x-bz-content-sha1": v["contentSha1"],
+            "Accept-Ranges": "bytes",
+        }
+        for k, val in v["fileInfo"].items():
+            headers[f"x-bz-info-{k}"] = urllib.parse.quote(str(val))
+
+        rng = self.headers.get("Range")
+        if not rng:
+            return self._send(200, data, headers, v["contentType"])
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", rng.strip())
+        if not m or (not m.group(1) and not m.group(2)):
+            raise B2Error(400, "bad_request", f"Bad Range: {rng}")
+        if m.group(1):
+            start = int(m.group(1))
+            end = min(int(m.group(2)), total - 1) if m.group(2) else total - 1
+        else:
+            start, end = max(0, total - int(m.group(2))), total - 1
+        if start >= total or end < start:
+            raise B2Error(416, "range_not_satisfiable", f"Range {rng} outside 0-{total - 1}")
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        self._send(206, data[start:end + 1], headers, v["contentType"])
+
+
+class FakeB2Server:
+    """ThreadingHTTPServer on a background thread. .url is the api_base for B2Client."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options):
+        self.state = FakeB2State(**options)
+        handler = type("BoundHandler", (Handler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fakeb2", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start(host: str = "127.0.0.1", port: int = 0, **options) -> FakeB2Server:
+    return FakeB2Server(host, port, **options).start()
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m bench.fakeb2", description="Local fake Backblaze B2 server")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--bucket", action="append", default=[], help="bucket name (repeatable; default: bench)")
+    p.add_argument("--latency-ms", type=float, default=0)
+    p.add_argument("--bandwidth-kbps", type=float, default=0, help="shared cap, 0 = unlimited")
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.add_argument("--timeout-rate", type=float, default=0.0)
+    p.add_argument("--hang-s", type=float, default=5.0)
+    p.add_argument("--min-part-mb", type=float, default=5.0)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args(argv)
+
+    server = FakeB2Server(args.host, args.port, buckets=tuple(args.bucket or ["bench"]),
+                          latency_ms=args.latency_ms, bandwidth_kbps=args.bandwidth_kbps,
+                          fail_rate=args.fail_rate, timeout_rate=args.timeout_rate, hang_s=args.hang_s,
+                          min_part_size=int(args.min_part_mb * 1024 * 1024), seed=args.seed)
+    print(f"Fake B2 at {server.url}  (set 'API URL' in Profiler settings, any key)")
+    for bid, name in sorted(server.state.buckets.items()):
+        print(f"  bucket {name}: id {bid}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+STUBS_DIR = os.path.join(BENCH_DIR, "kodistubs")
+
+
+def _setting_defaults() -> dict:
+    """id -> default from resources/settings.xml, so code sees a fresh install."""
+    out = {}
+    tree = ET.parse(os.path.join(REPO_ROOT, "resources", "settings.xml"))
+    for s in tree.iter("setting"):
+        if s.get("id"):
+            out[s.get("id")] = s.get("default", "")
+    return out
+
+
+def install(root: str, clock_scale: float = 0.0, verbose: bool = False, settings: dict = None):
+    """
+    Put the fake Kodi modules first on sys.path and point special:// at root.
+    Must run before anything from resources.lib is imported. Returns the
+    shared state module (_kodistate) for scripting the fake Kodi.
+    """
+    for p in (STUBS_DIR, REPO_ROOT):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+
+    import _kodistate
+    _kodistate.reset(root, clock_scale=clock_scale)
+    _kodistate.VERBOSE = verbose
+    _kodistate.SETTINGS.update(_setting_defaults())
+    _kodistate.SETTINGS.update(settings or {})
+    return _kodistate
@@ -0,0 +1,198 @@
+"""
+Shared state behind the fake Kodi modules: the temp tree special:// paths map
+to, add-on settings, scripted dialog answers, a virtual clock for
+xbmc.sleep(), and an in-memory add-on registry answering JSON-RPC.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+
+ROOT = ""
+VERBOSE = False
+LOG = []
+
+# xbmcaddon.Addon() settings (all add-ons share one dict)
+SETTINGS = {}
+
+# Scripted dialog answers, consumed in order; DEFAULTS when a queue is empty
+ANSWERS = {"select": [], "yesno": [], "input": [], "ok": [], "multiselect": []}
+DEFAULTS = {"select": -1, "yesno": False, "input": "", "ok": True, "multiselect": None}
+
+PLAYING = False
+IDLE_S = 3600
+
+
+def answer(kind: str):
+    queue = ANSWERS.get(kind) or []
+    return queue.pop(0) if queue else DEFAULTS.get(kind)
+
+
+def special_roots() -> dict:
+    return {
+        "special://profile": os.path.join(ROOT, "userdata"),
+        "special://masterprofile": os.path.join(ROOT, "userdata"),
+        "special://userdata": os.path.join(ROOT, "userdata"),
+        "special://home": os.path.join(ROOT, "home"),
+        "special://temp": os.path.join(ROOT, "temp"),
+        "special://xbmc": os.path.join(ROOT, "xbmc"),
+    }
+
+
+def translate(path: str) -> str:
+    for prefix, real in special_roots().items():
+        if path.startswith(prefix):
+            rest = path[len(prefix):].lstrip("/")
+            return os.path.join(real, *rest.split("/")) if rest else real
+    return path
+
+
+class VirtualClock:
+    """
+    xbmc.sleep()/waitForAbort() advance virtual time; only `scale` of it is
+    really slept. Fixed settle delays (10s after UpdateAddonRepos...) are
+    counted without dominating a benchmark.
+    """
+
+    def __init__(self, scale: float = 0.0):
+        self.scale = scale
+        self.virtual_s = 0.0
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds: float):
+        with self._lock:
+            self.virtual_s += seconds
+        if self.scale > 0:
+            time.sleep(seconds * self.scale)
+
+    def now(self) -> float:
+        return self.virtual_s
+
+
+CLOCK = VirtualClock()
+
+
+class AddonRegistry:
+    """
+    Enough of Kodi's add-on manager for the installer: Addons.GetAddons,
+    Addons.Install (ready after install_latency_s of virtual time),
+    Addons.SetAddonEnabled, the Extract/InstallAddon/UpdateLocalAddons
+    builtins and a settings store.
+    """
+
+    def __init__(self):
+        self.installed = {}
+        self.unavailable = set()
+        self.pending = {}
+        self.rpc_latency_s = 0.0
+        self.install_latency_s = 2.0
+        self.kodi_settings = {"lookandfeel.skin": "skin.estuary"}
+        self.version = {"major": 21, "minor": 0}
+        self.calls = {}
+        self._lock = threading.RLock()
+
+    # --- helpers ---
+
+    def add_installed(self, addon_id: str, version: str = "1.0.0", write_files: bool = True):
+        with self._lock:
+            self.installed[addon_id] = {"addonid": addon_id, "version": version, "enabled": True}
+        if write_files:
+            d = os.path.join(ROOT, "home", "addons", addon_id)
+            os.makedirs(d, exist_ok=True)
+            with open(os.path.join(d, "addon.xml"), "w", encoding="utf-8") as f:
+                f.write(f'<addon id="{addon_id}" version="{version}"/>\n')
+
+    def _settle(self):
+        now = CLOCK.now()
+        for aid, ready in list(self.pending.items()):
+            if ready <= now:
+                del self.pending[aid]
+                self.add_installed(aid)
+
+    def _request_install(self, addon_id: str):
+        if addon_id in self.unavailable or addon_id in self.installed:
+            return
+        self.pending.setdefault(addon_id, CLOCK.now() + self.install_latency_s)
+
+    # --- JSON-RPC ---
+
+    def rpc(self, request: str) -> str:
+        req = json.loads(request)
+        method, params = req.get("method", ""), req.get("params") or {}
+        if self.rpc_latency_s:
+            time.sleep(self.rpc_latency_s)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._settle()
+            try:
+                result = self._dispatch(method, params)
+            except KeyError as e:
+                return json.dumps({"id": req.get("id"), "error": {"code": -32602, "message": f"Invalid params: {e}"}})
+        if result is None:
+            return json.dumps({"id": req.get("id"), "error": {"code": -32601, "message": "Method not found."}})
+        return json.dumps({"id": req.get("id"), "jsonrpc": "2.0", "result": result})
+
+    def _dispatch(self, method: str, params: dict):
+        if method == "Addons.GetAddons":
+            addons = sorted(self.installed.values(), key=lambda a: a["addonid"])
+            return {"addons": [dict(a) for a in addons], "limits": {"total": len(addons)}}
+        if method == "Addons.GetAddonDetails":
+            a = self.installed[params["addonid"]]
+            return {"addon": dict(a)}
+        if method == "Addons.SetAddonEnabled":
+            self.installed[params["addonid"]]["enabled"] = bool(params["enabled"])
+            return "OK"
+        if method == "Addons.Install":
+            self._request_install(params["addonid"])
+            return "OK"
+        if method == "Settings.GetSettingValue":
+            return {"value": self.kodi_settings.get(params["setting"], "")}
+        if method == "Settings.SetSettingValue":
+            self.kodi_settings[params["setting"]] = params["value"]
+            return True
+        if method == "Application.GetProperties":
+            return {"version": dict(self.version)}
+        if method == "JSONRPC.Introspect":
+            return {"methods": {}}
+        if method == "Application.Quit":
+            return "OK"
+        return None
+
+    # --- builtins ---
+
+    def builtin(self, cmd: str):
+        with self._lock:
+            name = cmd.split("(", 1)[0]
+            self.calls[f"builtin:{name}"] = self.calls.get(f"builtin:{name}", 0) + 1
+            args = [a.strip().strip('"') for a in re.findall(r'\((.*)\)', cmd)[0].split(",")] if "(" in cmd else []
+
+            if name == "Extract" and len(args) == 2 and os.path.isfile(args[0]):
+                with zipfile.ZipFile(args[0], "r") as z:
+                    z.extractall(args[1])
+            elif name == "InstallAddon" and args:
+                self._request_install(args[0])
+            elif name == "UpdateLocalAddons":
+                addons_dir = os.path.join(ROOT, "home", "addons")
+                for e in os.scandir(addons_dir) if os.path.isdir(addons_dir) else ():
+                    if os.path.isfile(os.path.join(e.path, "addon.xml")) and e.name not in self.installed:
+                        self.add_installed(e.name, write_files=False)
+
+
+REGISTRY = AddonRegistry()
+
+
+def reset(root: str, clock_scale: float = 0.0):
+    global ROOT, REGISTRY, CLOCK, PLAYING
+    ROOT = root
+    for sub in ("userdata", "home/addons/packages", "temp"):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+    SETTINGS.clear()
+    LOG.clear()
+    for q in ANSWERS.values():
+        q.clear()
+    PLAYING = False
+    REGISTRY = AddonRegistry()
+    CLOCK = VirtualClock(clock_scale)
@@ -0,0 +1,58 @@
+"""Fake xbmc module for running the add-on outside Kodi (see bench/harness.py)."""
+
+import _kodistate as _st
+
+LOGDEBUG, LOGINFO, LOGWARNING, LOGERROR, LOGFATAL = 0, 1, 2, 3, 4
+
+
+def log(msg, level=LOGDEBUG):
+    _st.LOG.append((level, msg))
+    if _st.VERBOSE:
+        print(msg)
+
+
+def sleep(ms):
+    _st.CLOCK.sleep(ms / 1000.0)
+
+
+def executebuiltin(cmd, wait=False):
+    _st.REGISTRY.builtin(cmd)
+
+
+def executeJSONRPC(request):
+    return _st.REGISTRY.rpc(request)
+
+
+def getCondVisibility(condition):
+    if condition == "System.ScreenSaverActive":
+        return False
+    if condition == "Player.Playing":
+        return _st.PLAYING
+    return False
+
+
+def getGlobalIdleTime():
+    return _st.IDLE_S
+
+
+def getInfoLabel(label):
+    return {"System.FriendlyName": "bench", "System.BuildVersion": "21.0"}.get(label, "")
+
+
+def translatePath(path):
+    return _st.translate(path)
+
+
+class Monitor:
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        if timeout:
+            _st.CLOCK.sleep(timeout)
+        return False
+
+
+class Player:
+    def isPlaying(self):
+        return _st.PLAYING
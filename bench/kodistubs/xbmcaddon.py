@@ -0,0 +1,45 @@
+"""Fake xbmcaddon module backed by the harness settings dict."""
+
+import _kodistate as _st
+
+
+class Addon:
+    def __init__(self, id=None):
+        self.id = id or "script.kodi.profiler"
+
+    def getAddonInfo(self, key):
+        return {"id": self.id, "name": "Profiler", "version": "0.0.0",
+                "path": _st.ROOT, "profile": f"special://profile/addon_data/{self.id}/"}.get(key, "")
+
+    def getSetting(self, key):
+        return str(_st.SETTINGS.get(key, ""))
+
+    def getSettingBool(self, key):
+        return str(_st.SETTINGS.get(key, "")).lower() == "true"
+
+    def getSettingInt(self, key):
+        try:
+            return int(_st.SETTINGS.get(key) or 0)
+        except ValueError:
+            return 0
+
+    def getSettingString(self, key):
+        return self.getSetting(key)
+
+    def setSetting(self, key, value):
+        _st.SETTINGS[key] = str(value)
+
+    def setSettingBool(self, key, value):
+        _st.SETTINGS[key] = "true" if value else "false"
+
+    def setSettingInt(self, key, value):
+        _st.SETTINGS[key] = str(int(value))
+
+    def setSettingString(self, key, value):
+        _st.SETTINGS[key] = str(value)
+
+    def getLocalizedString(self, id):
+        return ""
+
+    def openSettings(self):
+        pass
@@ -0,0 +1,85 @@
+"""Fake xbmcgui module: dialogs auto-answer from the harness answer queues."""
+
+import _kodistate as _st
+
+NOTIFICATION_INFO = "info"
+NOTIFICATION_WARNING = "warning"
+NOTIFICATION_ERROR = "error"
+INPUT_ALPHANUM = 0
+INPUT_NUMERIC = 1
+ALPHANUM_HIDE_INPUT = 2
+
+
+class Dialog:
+    def ok(self, heading, message=""):
+        _st.LOG.append((1, f"[dialog.ok] {heading}: {message}"))
+        return _st.answer("ok")
+
+    def yesno(self, heading, message="", *args, **kwargs):
+        return _st.answer("yesno")
+
+    def select(self, heading, items, *args, **kwargs):
+        return _st.answer("select")
+
+    def input(self, heading, defaultt="", type=INPUT_ALPHANUM, *args, **kwargs):
+        return _st.answer("input")
+
+    def multiselect(self, heading, options, *args, **kwargs):
+        return _st.answer("multiselect")
+
+    def notification(self, heading, message, icon=NOTIFICATION_INFO, time=5000, sound=True):
+        _st.LOG.append((1, f"[dialog.notification] {heading}: {message}"))
+
+    def textviewer(self, heading, text, usemono=False):
+        _st.LOG.append((1, f"[dialog.textviewer] {heading}"))
+
+
+class DialogProgress:
+    def create(self, heading, message=""):
+        pass
+
+    def update(self, percent, message=""):
+        pass
+
+    def iscanceled(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class DialogProgressBG:
+    def create(self, heading, message=""):
+        pass
+
+    def update(self, percent=0, heading="", message=""):
+        pass
+
+    def isFinished(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class ListItem:
+    def __init__(self, label="", label2="", path="", offscreen=False):
+        self._label, self._label2 = label, label2
+
+    def getLabel(self):
+        return self._label
+
+    def getLabel2(self):
+        return self._label2
+
+    def setLabel(self, label):
+        self._label = label
+
+    def setLabel2(self, label):
+        self._label2 = label
+
+    def setArt(self, art):
+        pass
+
+    def setProperty(self, key, value):
+        pass
@@ -0,0 +1,58 @@
+"""Fake xbmcvfs module: special:// paths map into the harness temp tree."""
+
+import os
+import shutil
+
+import _kodistate as _st
+
+
+def translatePath(path):
+    return _st.translate(path)
+
+
+def exists(path):
+    path = _st.translate(path)
+    if path.endswith("/"):
+        return os.path.isdir(path)
+    return os.path.exists(path)
+
+
+def listdir(path):
+    path = _st.translate(path)
+    dirs, files = [], []
+    for e in os.scandir(path):
+        (dirs if e.is_dir() else files).append(e.name)
+    return dirs, files
+
+
+def mkdirs(path):
+    os.makedirs(_st.translate(path), exist_ok=True)
+    return True
+
+
+def mkdir(path):
+    return mkdirs(path)
+
+
+def copy(src, dst):
+    dst = _st.translate(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(_st.translate(src), dst)
+    return True
+
+
+def delete(path):
+    try:
+        os.remove(_st.translate(path))
+        return True
+    except OSError:
+        return False
+
+
+def rmdir(path, force=False):
+    path = _st.translate(path)
+    try:
+        shutil.rmtree(path) if force else os.rmdir(path)
+        return True
+    except OSError:
+        return False
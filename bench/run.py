@@ -0,0 +1,199 @@
+"""
+End-to-end benchmark: generate userdata, then time per phase
+
+    backup              backup_to_b2(do_upload=False), cold file index
+    backup_incremental  the same again with nothing changed
+    restore             restore_pipelined() of the local backup onto a wiped
+                        profile, with the arguments default.do_local_restore
+                        passes (files + repo/add-on installs against the
+                        fake registry)
+
+and write the results as JSON. --compare prints the change against an
+earlier result and exits 1 if a phase got slower than --fail-over percent.
+--mem-profile adds tracemalloc/RSS peaks and top allocation sites per phase
+(and per workflow step inside it); with --mem-budget-mb the run exits 1 if
+any of them peaks over the budget.
+
+    python -m bench.run --addons 100 --out bench_output.json
+    python -m bench.run --mem-profile --mem-budget-mb 150
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+
+
+def _parse(argv):
+    p = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--addons", type=int, default=50)
+    p.add_argument("--repos", type=int, default=3)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--median-kb", type=float, default=4.0, help="median addon_data file size")
+    p.add_argument("--max-files", type=int, default=20, help="max files per add-on")
+    p.add_argument("--dbs", type=int, default=3)
+    p.add_argument("--db-rows", type=int, default=5000)
+    p.add_argument("--rpc-latency-ms", type=float, default=0.0, help="real delay per JSON-RPC call")
+    p.add_argument("--install-latency-s", type=float, default=2.0, help="virtual time until an install completes")
+    p.add_argument("--clock-scale", type=float, default=0.0, help="fraction of xbmc.sleep() really slept")
+    p.add_argument("--root", default="", help="work dir (default: a fresh temp dir, removed afterwards)")
+    p.add_argument("--out", default="", help="write results JSON here")
+    p.add_argument("--compare", default="", help="earlier results JSON to compare against")
+    p.add_argument("--fail-over", type=float, default=20.0, help="regression threshold in percent")
+    p.add_argument("--mem-profile", action="store_true", help="record memory per phase (slower)")
+    p.add_argument("--mem-budget-mb", type=float, default=0.0, help="fail if a phase peaks over this (RSS, else traced)")
+    p.add_argument("--verbose", action="store_true")
+    return p.parse_args(argv)
+
+
+class Phases:
+    def __init__(self, state):
+        self.state = state
+        self.results = {}
+
+    def run(self, name, fn):
+        from resources.lib.memprofile import phase
+        rpc_before = dict(self.state.REGISTRY.calls)
+        v0, t0 = self.state.CLOCK.now(), time.perf_counter()
+        with phase(name):
+            out = fn()
+        wall = time.perf_counter() - t0
+        calls = {k: v - rpc_before.get(k, 0) for k, v in self.state.REGISTRY.calls.items() if v != rpc_before.get(k, 0)}
+        self.results[name] = {
+            "seconds": round(wall, 4),
+            "virtual_sleep_s": round(self.state.CLOCK.now() - v0, 3),
+            "rpc_calls": calls,
+        }
+        print(f"{name:20s} {wall:8.3f}s  (+{self.results[name]['virtual_sleep_s']:.1f}s virtual sleep)")
+        return out
+
+
+def _wipe_for_restore(state):
+    """Fresh device: no addon_data (except ours), no XMLs, only the repos/add-ons Kodi ships."""
+    from resources.lib.paths import profile, home, temp
+    ours = "script.kodi.profiler"
+    addon_data = profile("addon_data")
+    for e in os.scandir(addon_data):
+        if e.name != ours:
+            shutil.rmtree(e.path)
+    for name in ("guisettings.xml", "sources.xml", "favourites.xml"):
+        if os.path.exists(profile(name)):
+            os.remove(profile(name))
+    for aid in list(state.REGISTRY.installed):
+        shutil.rmtree(home(f"addons/{aid}"), ignore_errors=True)
+    state.REGISTRY.installed.clear()
+    shutil.rmtree(temp("profiler/restore_staging"), ignore_errors=True)
+
+
+def run(args) -> dict:
+    root = args.root or tempfile.mkdtemp(prefix="profiler-bench-")
+    state = harness.install(root, clock_scale=args.clock_scale, verbose=args.verbose)
+    state.REGISTRY.rpc_latency_s = args.rpc_latency_ms / 1000.0
+    state.REGISTRY.install_latency_s = args.install_latency_s
+
+    # Only importable once the fake Kodi modules are in place
+    from bench import synth
+    from resources.lib.paths import addon_profile, temp
+    from resources.lib.workflow_backup import backup_to_b2
+    from resources.lib.workflow_backup import find_base_backup
+    from resources.lib.workflow_restore_pipeline import restore_pipelined
+    from resources.lib.journal import RestoreJournal
+    from default import fast_restore_settings
+    from resources.lib import memprofile
+
+    if args.mem_profile or args.mem_budget_mb:
+        memprofile.start(args.mem_budget_mb)
+    try:
+        t0 = time.perf_counter()
+        dataset = synth.generate(state, addons=args.addons, repos=args.repos, seed=args.seed,
+                                 median_kb=args.median_kb, max_files=args.max_files,
+                                 dbs=args.dbs, db_rows=args.db_rows)
+        dataset["generate_seconds"] = round(time.perf_counter() - t0, 3)
+        print(f"dataset: {dataset['files']} files, {dataset['bytes'] / 1048576:.1f} MB, {dataset['addons']} add-ons")
+
+        phases = Phases(state)
+        backup_kwargs = dict(build_name="bench", b2_key_id="", b2_app_key="", b2_bucket="", b2_prefix="",
+                             b2_bucket_id="", include_keymaps=True, include_adv=False, do_upload=False)
+
+        res = phases.run("backup", lambda: backup_to_b2(**backup_kwargs))
+        phases.results["backup"]["archive_bytes"] = os.path.getsize(res["zip"])
+        phases.run("backup_incremental", lambda: backup_to_b2(**backup_kwargs))
+
+        local_zip = addon_profile("backups/bench.zip")
+        os.makedirs(os.path.dirname(local_zip), exist_ok=True)
+        shutil.copyfile(res["zip"], local_zip)
+
+        _wipe_for_restore(state)
+        journal = RestoreJournal()
+        journal.begin({"kind": "local", "zip": "bench.zip"})
+        _, report = phases.run("restore", lambda: restore_pipelined(
+            local_zip, temp("profiler/restore_staging"), overwrite_xml=True, journal=journal,
+            find_base=find_base_backup, **fast_restore_settings(keep_zip=True)))
+        journal.finish()
+        phases.results["restore"]["report"] = {k: {kk: len(vv) for kk, vv in v.items()} for k, v in report.items()}
+
+        memory = memprofile.stop()
+        if memory:
+            print("\n" + memprofile.format_report(memory))
+
+        return {
+            "schema": 1,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {k: v for k, v in vars(args).items()
+                       if k not in ("out", "compare", "fail_over", "root", "verbose", "mem_profile", "mem_budget_mb")},
+            "dataset": dataset,
+            "phases": phases.results,
+            "memory": memory,
+        }
+    finally:
+        memprofile.stop()
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(result: dict, baseline: dict, fail_over: float) -> bool:
+    """Print per-phase change. Returns False if any phase regressed past fail_over percent."""
+    ok = True
+    print(f"\n{'phase':20s} {'baseline':>10s} {'now':>10s} {'change':>8s}")
+    for name, now in result["phases"].items():
+        before = (baseline.get("phases") or {}).get(name)
+        if not before:
+            continue
+        b, n = before["seconds"], now["seconds"]
+        pct = (n - b) / b * 100 if b else 0.0
+        flag = ""
+        if pct > fail_over:
+            flag, ok = "  REGRESSION", False
+        print(f"{name:20s} {b:10.3f} {n:10.3f} {pct:+7.1f}%{flag}")
+    if baseline.get("config") != result.get("config"):
+        print("note: configs differ; numbers are not directly comparable")
+    return ok
+
+
+def main(argv=None) -> int:
+    args = _parse(argv if argv is not None else sys.argv[1:])
+    result = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"results: {args.out}")
+    over = (result.get("memory") or {}).get("over_budget") or []
+    if over:
+        print(f"memory budget of {args.mem_budget_mb:g} MB exceeded in: {', '.join(over)}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.fail_over):
+            return 1
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Start-up cost benchmark, each sample in a fresh interpreter:
+
+    menu              run default.py until the menu dialog is shown
+    service_idle      service.py on a start with nothing pending
+    service_pending   service.py with pending_finalize set (the post-restore start)
+
+Reports milliseconds (median of --repeat runs, excluding interpreter and
+harness start-up), how many resources.lib modules were imported, and the
+virtual time the service slept (xbmc.sleep is not really slept here).
+
+    python -m bench.startup --repeat 7 --out startup.json
+    python -m bench.startup --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import REPO_ROOT
+
+MODES = ("menu", "service_idle", "service_pending")
+
+# Settings each mode starts from (on top of the settings.xml defaults)
+MODE_SETTINGS = {
+    "menu": {},
+    "service_idle": {},
+    "service_pending": {"pending_finalize": "true", "pending_skin": "skin.test"},
+}
+
+
+def _parse(argv):
+    p = argparse.ArgumentParser(prog="python -m bench.startup", description=__doc__.strip().splitlines()[0])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--modes", default=",".join(MODES), help="comma separated subset of " + ", ".join(MODES))
+    p.add_argument("--out", default="", help="write results JSON here")
+    p.add_argument("--compare", default="", help="previous results JSON to diff against")
+    p.add_argument("--child", default="", help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def _child(mode: str) -> dict:
+    """One sample; runs inside the fresh interpreter."""
+    root = tempfile.mkdtemp(prefix="profiler-startup-")
+    state = harness.install(root, settings=MODE_SETTINGS[mode])
+    import xbmcgui
+
+    shown = []
+    if mode == "menu":
+        real_select = xbmcgui.Dialog.select
+
+        def select(self, heading, items, *args, **kwargs):
+            if not shown:
+                shown.append(time.perf_counter())
+            return real_select(self, heading, items, *args, **kwargs)
+
+        xbmcgui.Dialog.select = select
+        script = os.path.join(REPO_ROOT, "default.py")
+    else:
+        script = os.path.join(REPO_ROOT, "resources", "lib", "service.py")
+
+    try:
+        t0 = time.perf_counter()
+        runpy.run_path(script, run_name="__main__")
+        t1 = shown[0] if shown else time.perf_counter()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "ms": round((t1 - t0) * 1000, 2),
+        "modules": len([m for m in sys.modules if m.startswith("resources.lib.")]),
+        "virtual_sleep_s": round(state.CLOCK.now(), 2),
+    }
+
+
+def _sample(mode: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.startup", "--child", mode],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"{mode} failed:\n{proc.stderr.strip()[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(args) -> dict:
+    results = {}
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode not in MODES:
+            raise SystemExit(f"unknown mode: {mode}")
+        samples = [_sample(mode) for _ in range(max(1, args.repeat))]
+        results[mode] = {
+            "ms": round(statistics.median(s["ms"] for s in samples), 2),
+            "ms_min": min(s["ms"] for s in samples),
+            "modules": samples[-1]["modules"],
+            "virtual_sleep_s": samples[-1]["virtual_sleep_s"],
+        }
+    return {
+        "schema": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "phases": results,
+    }
+
+
+def _print(result: dict, previous: dict = None):
+    prev = (previous or {}).get("phases", {})
+    for mode, r in result["phases"].items():
+        line = (f"{mode:16s} {r['ms']:8.1f} ms  (min {r['ms_min']:.1f})  "
+                f"{r['modules']:3d} modules  slept {r['virtual_sleep_s']:.1f}s virtual")
+        if mode in prev and prev[mode]["ms"]:
+            line += f"  {(r['ms'] - prev[mode]['ms']) / prev[mode]['ms'] * 100:+.0f}% vs previous"
+        print(line)
+
+
+def main(argv=None) -> int:
+    args = _parse(argv if argv is not None else sys.argv[1:])
+    if args.child:
+        print(json.dumps(_child(args.child)))
+        return 0
+
+    result = run(args)
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    _print(result, previous)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"results: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Synthetic userdata: N add-ons with addon_data trees (log-normal file sizes,
+a mix of compressible text and incompressible blobs), SQLite databases, the
+top-level XMLs, keymaps, and installed repos/add-ons in the fake registry.
+Deterministic for a given seed.
+"""
+
+import os
+import random
+import sqlite3
+
+from resources.lib.paths import profile, home
+
+TEXT = (b"<setting id=\"%d\" value=\"lorem ipsum dolor sit amet\" />\n")
+
+
+def _file_bytes(rng: random.Random, size: int) -> bytes:
+    if rng.random() < 0.7:
+        line = TEXT % rng.randrange(1000)
+        return (line * (size // len(line) + 1))[:size]
+    return rng.randbytes(size) if hasattr(rng, "randbytes") else os.urandom(size)
+
+
+def _make_db(path: str, rng: random.Random, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (id INTEGER PRIMARY KEY, k TEXT, v TEXT)")
+    conn.executemany("INSERT INTO cache (k, v) VALUES (?, ?)",
+                     ((f"key{i}", "x" * rng.randrange(20, 400)) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def generate(state, addons: int = 50, repos: int = 3, seed: int = 1, median_kb: float = 4.0,
+             max_files: int = 20, dbs: int = 3, db_rows: int = 5000) -> dict:
+    """Populate the harness tree. Returns a summary of what was generated."""
+    rng = random.Random(seed)
+    summary = {"addons": addons, "repos": repos, "files": 0, "bytes": 0, "dbs": 0}
+
+    def write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        summary["files"] += 1
+        summary["bytes"] += len(data)
+
+    for name in ("guisettings.xml", "sources.xml", "favourites.xml"):
+        write(profile(name), _file_bytes(rng, 20000))
+    write(profile("keymaps/keyboard.xml"), b"<keymap/>\n")
+
+    repo_ids = [f"repository.bench{r}" for r in range(repos)]
+    for rid in repo_ids:
+        state.REGISTRY.add_installed(rid)
+
+    addon_ids = [f"plugin.video.bench{i:03d}" for i in range(addons)]
+    for aid in addon_ids:
+        state.REGISTRY.add_installed(aid)
+        root = profile(f"addon_data/{aid}")
+        write(os.path.join(root, "settings.xml"), _file_bytes(rng, 2000))
+        for n in range(rng.randrange(1, max_files + 1)):
+            size = int(min(8 * 1024 * 1024, rng.lognormvariate(0, 1.2) * median_kb * 1024))
+            write(os.path.join(root, "cache" if n % 3 else "", f"f{n}.dat"), _file_bytes(rng, size))
+
+    for d in range(min(dbs, addons)):
+        path = profile(f"addon_data/{addon_ids[d]}/cache.db")
+        _make_db(path, rng, db_rows)
+        summary["dbs"] += 1
+        summary["files"] += 1
+        summary["bytes"] += os.path.getsize(path)
+
+    state.REGISTRY.kodi_settings["lookandfeel.skin"] = "skin.estuary"
+    os.makedirs(home("addons/packages"), exist_ok=True)
+    return summary
@@ -2,90 +2,392 @@ import xbmc
 import xbmcaddon
 import xbmcgui
 
+import contextlib
+import json
 import os
-import glob
-
-from resources.lib.workflow_backup import backup_to_b2
-from resources.lib.workflow_restore import restore_from_b2
-from resources.lib.workflow_backup_local import backup_local
-from resources.lib.workflow_restore_local import restore_local
-from resources.lib.addon_installer import run_install
-from resources.lib.paths import profile
-from resources.lib.b2 import B2Client
-from resources.lib.log import info, warn, err, exc
-from resources.lib.jsonrpc import JsonRpc
-from resources.lib.uiwait import wait_for_modal_to_close
+import time
+
+# Only what the menu itself needs is imported here. Workflows (and B2, zip,
+# sqlite, JSON-RPC) are imported inside the action that uses them, so the
+# menu opens without paying for the ones that are not chosen.
+from resources.lib.paths import profile, temp, addon_profile
+from resources.lib.log import info, warn, err, exc, flush as flush_log
+from resources.lib import jobs
 
 ADDON = xbmcaddon.Addon()
 
 def s(id_): return ADDON.getSetting(id_)
 
+def fast_restore_settings(keep_zip: bool):
+    return {
+        "fast": s("fast_restore") == "true",
+        "priority_addons": [a.strip() for a in s("priority_addons").split(",") if a.strip()],
+        "top_addons": int(s("fast_restore_top_addons") or 5),
+        "keep_zip": keep_zip,
+    }
+
+def restore_choices(zip_path: str, journal) -> dict:
+    """
+    Ask about a backup on the UI thread, before the restore job starts:
+    which profiles (multi-profile backups) and whether to go ahead with the
+    add-on install plan. Returns extra restore_pipelined arguments; raises
+    jobs.Cancelled if the user backs out. A resumed restore isn't asked again.
+    """
+    import zipfile
+    from resources.lib.addon_installer import plan_installs
+    from resources.lib.delta import read_zip_manifest
+    from resources.lib.install_plan import describe, has_work
+
+    with zipfile.ZipFile(zip_path, "r") as z:
+        manifest = read_zip_manifest(z)
+
+    out = {}
+    listed = (manifest.get("profiles") or {}).get("list") or []
+    if listed and s("restore_profiles") == "1" and not journal.get("profiles"):
+        names = [p["name"] if p["dir"] else f"{p['name']} (master)" for p in listed]
+        chosen = xbmcgui.Dialog().multiselect("Restore which profiles?", names, preselect=list(range(len(names))))
+        if not chosen:
+            raise jobs.Cancelled("No profiles selected")
+        out["profiles"] = [listed[i]["dir"] for i in chosen]
+
+    if s("show_install_plan") != "false" and not journal.get("plan_confirmed"):
+        plan = plan_installs(manifest)
+        if has_work(plan):
+            if not xbmcgui.Dialog().yesno("Add-on install plan", describe(plan), nolabel="Cancel", yeslabel="Continue"):
+                raise jobs.Cancelled("Install plan declined")
+            journal.set("plan_confirmed", "1")
+            journal.commit()
+    return out
+
+def deferred_note():
+    from resources.lib.deferred_restore import has_plan
+    if not has_plan():
+        return ""
+    return "Remaining add-ons and data will finish restoring in the background after restart.\n\n"
+
 def main():
+    if offer_resume():
+        return
+
     choices = [
         "Local Backup",
         "Local Restore",
         "Backup to Cloud (B2)",
         "Restore from Cloud (B2)",
+        "Restore from LAN peer",
+        "Browse Backup Contents",
+        "Clean Up Old Backups",
         "Settings",
         "Debug JSONRPC"
     ]
     idx = xbmcgui.Dialog().select("Profiler", choices)
+    profiling = s("mem_profile") == "true" and 0 <= idx <= 6
+    if profiling:
+        from resources.lib import memprofile
+        memprofile.start(float(s("mem_budget_mb") or 0))
+    try:
+        with memprofile.phase(choices[idx]) if profiling else contextlib.nullcontext():
+            run_choice(idx)
+    finally:
+        if profiling:
+            save_mem_report(choices[idx])
+        flush_log()
+
+def save_mem_report(action: str):
+    """Log the memory profile of the action that just ran and keep it as cache/memprofile.json."""
+    from resources.lib import memprofile
+    report = memprofile.stop()
+    report["action"] = action
+    report["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    path = addon_profile("cache/memprofile.json")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        warn(f"Could not write {path}: {e}")
+    info(f"Memory profile ({action}):\n{memprofile.format_report(report)}")
+    if report["over_budget"]:
+        warn(f"Memory budget exceeded in: {', '.join(report['over_budget'])}", notify=True)
+
+def run_choice(idx: int):
     if idx == 0:
         try:
-            backup_local()
+            do_local_backup()
+        except jobs.Cancelled:
+            cancelled("Local backup")
         except Exception as e:
             exc(f"Restore failed: {e}")
             xbmcgui.Dialog().ok("Error", str(e))
     elif idx == 1:
         try:
             do_local_restore()
+        except jobs.Cancelled:
+            cancelled("Local restore")
         except Exception as e:
             exc(f"Restore failed: {e}")
             xbmcgui.Dialog().ok("Error", str(e))  
     elif idx == 2:
         try:
             do_backup()
+        except jobs.Cancelled:
+            cancelled("Backup")
         except Exception as e:
             exc(f"Restore failed: {e}")
             xbmcgui.Dialog().ok("Error", str(e)) 
     elif idx == 3:
         try:
             do_restore()
+        except jobs.Cancelled:
+            cancelled("Restore")
         except Exception as e:
             exc(f"Restore failed: {e}")
             xbmcgui.Dialog().ok("Error", str(e))
     elif idx == 4:
-        ADDON.openSettings()
+        try:
+            do_peer_restore()
+        except jobs.Cancelled:
+            cancelled("Restore")
+        except Exception as e:
+            exc(f"Restore failed: {e}")
+            xbmcgui.Dialog().ok("Error", str(e))
     elif idx == 5:
+        try:
+            do_contents()
+        except Exception as e:
+            exc(f"Contents query failed: {e}")
+            xbmcgui.Dialog().ok("Error", str(e))
+    elif idx == 6:
+        try:
+            do_cleanup()
+        except Exception as e:
+            exc(f"Cleanup failed: {e}")
+            xbmcgui.Dialog().ok("Error", str(e))
+    elif idx == 7:
+        ADDON.openSettings()
+    elif idx == 8:
         debug_jsonrpc()
         
+def cancelled(what: str):
+    info(f"{what} cancelled")
+    if ADDON.getSettingBool("restore_in_progress"):
+        # The journal stays, so the next start offers to resume
+        ADDON.setSettingBool("restore_in_progress", False)
+        xbmcgui.Dialog().ok("Profiler", f"{what} cancelled.\n\nRun Profiler again to resume it.")
+    else:
+        xbmcgui.Dialog().ok("Profiler", f"{what} cancelled.")
+
+def do_local_backup():
+    from resources.lib.workflow_backup_local import backup_local
+    from resources.lib.retention import run_after_backup
+
+    name = xbmcgui.Dialog().input("Build name", type=xbmcgui.INPUT_ALPHANUM)
+    if not name:
+        return
+
+    def work():
+        dst = backup_local(build_name=name)
+        run_after_backup(ADDON)
+        return dst
+
+    dst = jobs.run_with_progress("Local backup", work)
+    xbmcgui.Dialog().ok("Backup complete", f"Saved: {os.path.basename(dst)}")
+
+def offer_resume() -> bool:
+    """If a restore was interrupted (crash/power loss), offer to pick it up."""
+    from resources.lib.journal import RestoreJournal
+    journal = RestoreJournal()
+    session = journal.session()
+    if not session:
+        return False
+
+    label = session.get("remote_name") or session.get("zip") or "?"
+    msg = (
+        "A restore was interrupted before it finished:\n\n"
+        f"{label}\n\n"
+        "Resume where it left off?"
+    )
+    if not xbmcgui.Dialog().yesno("Profiler", msg):
+        journal.finish()
+        ADDON.setSettingBool("restore_in_progress", False)
+        return False
+
+    try:
+        if session.get("kind") == "local":
+            do_local_restore(resume=session)
+        elif session.get("kind") == "peer":
+            do_peer_restore(resume=session)
+        else:
+            do_restore(resume=session)
+    except jobs.Cancelled:
+        cancelled("Restore")
+    except Exception as e:
+        exc(f"Restore failed: {e}")
+        xbmcgui.Dialog().ok("Error", str(e))
+    return True
+
 def debug_jsonrpc():
+    from resources.lib.jsonrpc import JsonRpc
     rpc = JsonRpc()
     schema = rpc.introspect()
     text = str(schema)
     xbmcgui.Dialog().textviewer("JSONRPC schema", text[:100000])
 
+def _mb(n) -> str:
+    return f"{n / 1048576:.1f} MB"
+
+def do_contents():
+    from resources.lib.b2 import B2Client
+    from resources.lib.contents import refresh as refresh_contents
+
+    b2 = None
+    bucket_id = s("b2_bucket_id").strip()
+    if bucket_id and s("b2_key_id").strip():
+        try:
+            b2 = B2Client(s("b2_key_id").strip(), s("b2_app_key").strip(), api_base=s("b2_api_url").strip())
+            b2.authorize()
+        except Exception as e:
+            warn(f"B2 unavailable, indexing local backups only: {e}")
+            b2 = None
+
+    idx = refresh_contents(b2, bucket_id, s("b2_bucket_name").strip(), (s("b2_prefix") or "").strip().strip("/"))
+    try:
+        backups = idx.backups()
+        if not backups:
+            xbmcgui.Dialog().ok("Backup Contents", "No backups found.")
+            return
+
+        choice = xbmcgui.Dialog().select("Backup Contents", [
+            "Which backups include an add-on...",
+            "History of a file...",
+            "Compare two backups",
+        ])
+        if choice == 0:
+            addon_id = xbmcgui.Dialog().input("Add-on ID (e.g. plugin.video.x)", type=xbmcgui.INPUT_ALPHANUM).strip()
+            if not addon_id:
+                return
+            rows = idx.with_addon(addon_id)
+            lines = [f"{addon_id}: {len(rows)} of {len(backups)} backup(s)", ""]
+            for r in rows:
+                what = "installed" if r["kind"] else "not installed"
+                lines.append(f"{r['backup']} [{r['source']}] - {what}, settings: {r['data_files']} file(s), {_mb(r['data_size'])}")
+            xbmcgui.Dialog().textviewer("Backups with " + addon_id, "\n".join(lines))
+
+        elif choice == 1:
+            pattern = xbmcgui.Dialog().input("Path contains (e.g. addon_data/plugin.video.x/settings.xml)", type=xbmcgui.INPUT_ALPHANUM).strip()
+            if not pattern:
+                return
+            rows = idx.history(pattern)
+            lines, last = [], None
+            for r in rows[:2000]:
+                if r["path"] != last:
+                    lines += ["", r["path"]]
+                    last = r["path"]
+                mark = "changed" if r["changed"] else "same"
+                lines.append(f"  {r['backup']} [{r['source']}] {_mb(r['size'])} - {mark}")
+            xbmcgui.Dialog().textviewer("File history", "\n".join(lines).strip() or "No matching files.")
+
+        elif choice == 2:
+            labels = [label for _, label in backups]
+            a = xbmcgui.Dialog().select("Compare: older backup", labels)
+            if a < 0:
+                return
+            b = xbmcgui.Dialog().select("Compare: newer backup", labels)
+            if b < 0:
+                return
+            d = idx.diff(backups[a][0], backups[b][0])
+            lines = [f"{labels[a]}  ->  {labels[b]}", ""]
+            for title, key in (("Add-ons added", "addons_added"), ("Add-ons removed", "addons_removed"),
+                               ("Files added", "added"), ("Files removed", "removed"), ("Files changed", "changed")):
+                lines.append(f"{title} ({len(d[key])}):")
+                lines += [f"  {x}" for x in d[key][:1000]]
+                lines.append("")
+            xbmcgui.Dialog().textviewer("Backup diff", "\n".join(lines))
+    finally:
+        idx.close()
+
+def do_cleanup():
+    from resources.lib.b2 import B2Client
+    from resources.lib.retention import run_gc, format_report, policy_from_settings as retention_policy
+
+    b2, bucket_id = None, ""
+    if s("retention_remote") == "true" and s("b2_bucket_id").strip():
+        b2 = B2Client(s("b2_key_id").strip(), s("b2_app_key").strip(), api_base=s("b2_api_url").strip())
+        b2.authorize()
+        bucket_id = s("b2_bucket_id").strip()
+
+    kwargs = {
+        "b2": b2,
+        "bucket_id": bucket_id,
+        "prefix": (s("b2_prefix") or "").strip(),
+        "delta_base": s("delta_base").strip(),
+    }
+    policy = retention_policy(ADDON)
+    report = run_gc(policy, dry_run=True, **kwargs)
+    if not report["actions"]:
+        xbmcgui.Dialog().ok("Clean Up", "Nothing to clean up.")
+        return
+
+    xbmcgui.Dialog().textviewer("Clean Up (dry run)", format_report(report))
+    if not xbmcgui.Dialog().yesno("Clean Up", f"Delete {len(report['actions'])} item(s) and reclaim {_mb(report['bytes'])}?"):
+        return
+    report = run_gc(policy, dry_run=False, **kwargs)
+    xbmcgui.Dialog().textviewer("Clean Up", format_report(report))
+
 def do_backup():
+    from resources.lib.workflow_backup import backup_to_b2, cloud_backup_settings
+    from resources.lib.retention import run_after_backup
+
     name = xbmcgui.Dialog().input("Build name", type=xbmcgui.INPUT_ALPHANUM)
     if not name:
         return
 
-    res = backup_to_b2(
-        build_name=name,
-        b2_key_id=s("b2_key_id").strip(),
-        b2_app_key=s("b2_app_key").strip(),
-        b2_bucket=s("b2_bucket_name").strip(),
-        b2_prefix=s("b2_prefix").strip(),
-        b2_bucket_id=s("b2_bucket_id").strip(),
-        include_keymaps=(s("include_keymaps") == "true"),
-        include_adv=(s("include_advancedsettings") == "true"),
-    )
-    xbmcgui.Dialog().ok("Backup complete", f"Uploaded: {res['remote_name']}")
-
-def do_restore():
+    def work():
+        res = backup_to_b2(build_name=name, **cloud_backup_settings(ADDON))
+        run_after_backup(ADDON)
+        return res
+
+    res = jobs.run_with_progress("Backup to Cloud", work)
+    if res["uploaded"]:
+        xbmcgui.Dialog().ok("Backup complete", f"Uploaded: {res['remote_name']}")
+    else:
+        xbmcgui.Dialog().ok("Backup complete", f"Nothing changed since the last upload of {res['remote_name']}")
+
+def pick_remote_backup(b2, bucket_id: str, prefix: str, files) -> str:
+    """Backup picker with details from the bucket catalog (plain names if there is none)."""
+    from resources.lib.catalog import load_catalog
+    try:
+        catalog = load_catalog(b2, bucket_id, prefix)
+    except Exception as e:
+        warn(f"Backup catalog unavailable: {e}")
+        catalog = {}
+
+    # Catalogued backups newest first, then anything uploaded without one
+    files = sorted(files, key=lambda f: (catalog.get(f, {}).get("date", ""), f), reverse=True)
+    items = []
+    for f in files:
+        e = catalog.get(f)
+        li = xbmcgui.ListItem(label=e["name"] if e else os.path.basename(f))
+        if e:
+            li.setLabel2(
+                f"{e['date'][:16].replace('T', ' ')} | {e['size'] / 1048576:.1f} MB | Kodi {e['kodi_major']} | "
+                f"{e['skin']} | {e['addon_count']} add-ons" + (f" | {e['device']}" if e.get("device") else "")
+            )
+        else:
+            li.setLabel2(f)
+        items.append(li)
+
+    pick = xbmcgui.Dialog().select("Choose backup", items, useDetails=True)
+    return files[pick] if pick >= 0 else ""
+
+def do_restore(resume=None):
+    from resources.lib.b2 import B2Client
+    from resources.lib.journal import RestoreJournal
+
+    journal = RestoreJournal()
     ADDON.setSettingBool("restore_in_progress", True)
 
-    b2 = B2Client(s("b2_key_id").strip(), s("b2_app_key").strip())
+    b2 = B2Client(s("b2_key_id").strip(), s("b2_app_key").strip(), api_base=s("b2_api_url").strip())
     b2.authorize()
 
     bucket_id = s("b2_bucket_id").strip()
@@ -94,49 +396,115 @@ def do_restore():
         ADDON.setSettingBool("restore_in_progress", False)
         return
 
-    prefix = (s("b2_prefix") or "").strip().strip("/")
-    listing = b2.list_file_names(bucket_id, prefix=prefix)
-    files = [f["fileName"] for f in listing.get("files", []) if f.get("fileName", "").endswith(".zip")]
-
-    if not files:
-        xbmcgui.Dialog().ok("No backups found", "Nothing to restore in this bucket/prefix.")
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
-
-    pick = xbmcgui.Dialog().select("Choose backup", files)
-    if pick < 0:
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
+    if resume:
+        remote_name = resume["remote_name"]
+    else:
+        prefix = (s("b2_prefix") or "").strip().strip("/")
+        listing = b2.list_file_names(bucket_id, prefix=prefix)
+        files = [f["fileName"] for f in listing.get("files", []) if f.get("fileName", "").endswith(".zip")]
+
+        if not files:
+            xbmcgui.Dialog().ok("No backups found", "Nothing to restore in this bucket/prefix.")
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        remote_name = pick_remote_backup(b2, bucket_id, prefix, files)
+        if not remote_name:
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        journal.begin({"kind": "b2", "remote_name": remote_name})
+
+    restore_downloaded(journal, b2, s("b2_bucket_name"), remote_name)
+
+def do_peer_restore(resume=None):
+    from resources.lib.journal import RestoreJournal
+    from resources.lib.peer import PeerClient
+
+    if resume:
+        address, name = resume["peer"], resume["remote_name"]
+    else:
+        address = xbmcgui.Dialog().input("Device to restore from (IP or IP:port)", s("peer_address").strip(),
+                                         type=xbmcgui.INPUT_ALPHANUM).strip()
+        if not address:
+            return
+    token = s("peer_token").strip()
+    if not token:
+        token = xbmcgui.Dialog().input("Shared token", type=xbmcgui.INPUT_ALPHANUM, option=xbmcgui.ALPHANUM_HIDE_INPUT).strip()
+        if not token:
+            return
+
+    client = PeerClient(address, token)
+    if not resume:
+        backups = sorted(client.list_backups(), key=lambda b: -b["mtime"])
+        if not backups:
+            xbmcgui.Dialog().ok("LAN Restore", f"{address} has no local backups to share.")
+            return
+        labels = [f"{b['name']}  ({_mb(b['size'])}, {time.strftime('%Y-%m-%d %H:%M', time.localtime(b['mtime']))})"
+                  for b in backups]
+        pick = xbmcgui.Dialog().select(f"Restore from {address}", labels)
+        if pick < 0:
+            return
+        name = backups[pick]["name"]
+        ADDON.setSetting("peer_address", address)
+        ADDON.setSetting("peer_token", token)
+
+    journal = RestoreJournal()
+    ADDON.setSettingBool("restore_in_progress", True)
+    if not resume:
+        journal.begin({"kind": "peer", "peer": address, "remote_name": name})
+    restore_downloaded(journal, client, "", name)
+
+def restore_downloaded(journal, source, bucket_name: str, remote_name: str):
+    """
+    Second half of a B2 or LAN peer restore, once the backup is chosen.
+    source: a B2Client or peer.PeerClient (same download_to_file).
+    """
+    from resources.lib.jsonrpc import JsonRpc
+    from resources.lib.uiwait import wait_for_modal_to_close
+    from resources.lib.workflow_restore import download_backup, b2_base_finder
+    from resources.lib.workflow_restore_pipeline import restore_pipelined
 
     # Switch to Estuary first + wait for keep-change dialog to be answered
     rpc = JsonRpc()
-    rpc.set_setting("lookandfeel.skin", "skin.estuary")
-
-    xbmc.sleep(300)
-    ok = wait_for_modal_to_close(timeout_ms=30000)
-    if not ok:
-        xbmcgui.Dialog().ok("Profiler", "Please confirm the skin change to Estuary, then try again.")
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
-
-    current_skin = JsonRpc().get_setting("lookandfeel.skin").get("value")
-    if current_skin != "skin.estuary":
-        xbmcgui.Dialog().ok("Profiler", "Restore cancelled: you must switch to Estuary to continue.")
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
-
-    # Restore files from B2 zip (now returns manifest)
-    manifest = restore_from_b2(
-        remote_name=files[pick],
-        b2_key_id=s("b2_key_id"),
-        b2_app_key=s("b2_app_key"),
-        b2_bucket=s("b2_bucket_name"),
+    if not journal.done("step", "skin"):
+        rpc.set_setting("lookandfeel.skin", "skin.estuary")
+
+        xbmc.sleep(300)
+        ok = wait_for_modal_to_close(timeout_ms=30000)
+        if not ok:
+            xbmcgui.Dialog().ok("Profiler", "Please confirm the skin change to Estuary, then try again.")
+            journal.finish()
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        current_skin = JsonRpc().get_setting("lookandfeel.skin").get("value")
+        if current_skin != "skin.estuary":
+            xbmcgui.Dialog().ok("Profiler", "Restore cancelled: you must switch to Estuary to continue.")
+            journal.finish()
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        journal.mark("step", "skin")
+        journal.commit()
+
+    # Download, then restore files and install repos/add-ons in parallel stages
+    zip_path = temp("profiler/incoming/restore.zip")
+
+    jobs.run_with_progress("Downloading", download_backup, source, bucket_name, remote_name, zip_path, journal)
+    choices = restore_choices(zip_path, journal)
+    manifest, install_report = jobs.run_with_progress(
+        "Restoring",
+        restore_pipelined,
+        zip_path,
+        temp("profiler/restore_staging"),
         overwrite_xml=(s("overwrite_xml_on_restore") == "true"),
+        journal=journal,
+        find_base=b2_base_finder(source, bucket_name, remote_name),
+        **choices,
+        **fast_restore_settings(keep_zip=False),
     )
-
-    clear_gui_cache()
-
-    install_report = run_install(manifest)
+    journal.finish()
     fail_count = len(install_report["repos"]["failed"]) + len(install_report["addons"]["failed"])
     ok_count = len(install_report["repos"]["installed"]) + len(install_report["addons"]["installed"])
     skip_count = len(install_report["repos"]["skipped"]) + len(install_report["addons"]["skipped"])
@@ -160,6 +528,7 @@ def do_restore():
         "Restore complete.\n\n"
         "Kodi will restart into Estuary.\n"
         "After restart, Profiler will prompt you to switch back to your skin.\n\n"
+        f"{deferred_note()}"
         "Restart Kodi now?"
     )
 
@@ -179,53 +548,129 @@ def do_restore():
     # User chose not to restart now
     ADDON.setSettingBool("restore_in_progress", False)
     
-def do_local_restore():
+LOCAL_SORTS = [
+    ("Newest first", lambda r: -r["date"]),
+    ("Oldest first", lambda r: r["date"]),
+    ("Name", lambda r: r["name"].lower()),
+    ("Largest first", lambda r: -r["size"]),
+]
+
+def pick_local_backup():
+    """
+    Local backup picker with details, sorting and a text filter. Metadata comes
+    from the contents index, so only new/changed zips are opened.
+    Returns the zip file name, "" if cancelled, None if there are no backups.
+    """
+    from resources.lib.contents import ContentsIndex
+
+    idx = ContentsIndex()
+    try:
+        idx.index_local(profile("addon_data/script.kodi.profiler/backups"))
+        rows = idx.local_summaries()
+    finally:
+        idx.close()
+    if not rows:
+        return None
+
+    sort = int(s("local_sort") or 0) % len(LOCAL_SORTS)
+    text = ""
+    while True:
+        shown = [r for r in rows if not text or text in f"{r['name']} {r['skin']}".lower()]
+        shown.sort(key=LOCAL_SORTS[sort][1])
+
+        items = [
+            xbmcgui.ListItem(label=f"[Sort: {LOCAL_SORTS[sort][0]}]", label2="Change the order"),
+            xbmcgui.ListItem(label=f"[Filter: {text or 'none'}]", label2=f"{len(shown)} of {len(rows)} backup(s)"),
+        ]
+        for r in shown:
+            li = xbmcgui.ListItem(label=r["name"])
+            li.setLabel2(
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(r['date']))} | {_mb(r['size'])} | "
+                f"Kodi {r['kodi_major'] or '?'} | {r['skin'] or '?'} | {r['addon_count']} add-ons"
+            )
+            items.append(li)
+
+        pick = xbmcgui.Dialog().select("Choose backup", items, useDetails=True)
+        if pick < 0:
+            return ""
+        if pick == 0:
+            sort = (sort + 1) % len(LOCAL_SORTS)
+            ADDON.setSetting("local_sort", str(sort))
+        elif pick == 1:
+            text = xbmcgui.Dialog().input("Show backups containing", defaultt=text, type=xbmcgui.INPUT_ALPHANUM).strip().lower()
+        else:
+            return os.path.basename(shown[pick - 2]["path"])
+
+def do_local_restore(resume=None):
+    from resources.lib.jsonrpc import JsonRpc
+    from resources.lib.journal import RestoreJournal
+    from resources.lib.uiwait import wait_for_modal_to_close
+    from resources.lib.workflow_backup import find_base_backup
+    from resources.lib.workflow_restore_pipeline import restore_pipelined
+
+    journal = RestoreJournal()
     ADDON.setSettingBool("restore_in_progress", True)
 
-    backup_dir = profile("addon_data/script.kodi.profiler/backups")
-    files = [f for f in os.listdir(backup_dir) if f.lower().endswith(".zip")]
-    if not files:
-        xbmcgui.Dialog().ok("Local Restore", "No backups found.")
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
+    if resume:
+        zip_name = resume["zip"]
+    else:
+        zip_name = pick_local_backup()
+        if zip_name is None:
+            xbmcgui.Dialog().ok("Local Restore", "No backups found.")
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+        if not zip_name:
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
 
-    pick = xbmcgui.Dialog().select("Choose backup", files)
-    if pick < 0:
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
+        journal.begin({"kind": "local", "zip": zip_name})
 
     rpc = JsonRpc()
 
     # Switch to Estuary first so the target skin doesn't overwrite restored settings
-    rpc.set_setting("lookandfeel.skin", "skin.estuary")
-
-    xbmc.sleep(300)
-    ok = wait_for_modal_to_close(timeout_ms=30000)
-    if not ok:
-        xbmcgui.Dialog().ok(
-            "Profiler",
-            "Please confirm the skin change to Estuary, then run restore again."
-        )
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
-
-    current_skin = JsonRpc().get_setting("lookandfeel.skin").get("value")
-    if current_skin != "skin.estuary":
-        xbmcgui.Dialog().ok(
-            "Profiler",
-            "Restore cancelled.\n\nYou must switch to Estuary to continue."
-        )
-        ADDON.setSettingBool("restore_in_progress", False)
-        return
-
-    # Restore files
-    manifest = restore_local(files[pick], overwrite_xml=True)
-
-    # Clear GUI cache DBs after restoring settings
-    clear_gui_cache()
-
-    # Install repos + addons (repos currently empty in your manifest, but keep it)
-    install_report = run_install(manifest)
+    if not journal.done("step", "skin"):
+        rpc.set_setting("lookandfeel.skin", "skin.estuary")
+
+        xbmc.sleep(300)
+        ok = wait_for_modal_to_close(timeout_ms=30000)
+        if not ok:
+            xbmcgui.Dialog().ok(
+                "Profiler",
+                "Please confirm the skin change to Estuary, then run restore again."
+            )
+            journal.finish()
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        current_skin = JsonRpc().get_setting("lookandfeel.skin").get("value")
+        if current_skin != "skin.estuary":
+            xbmcgui.Dialog().ok(
+                "Profiler",
+                "Restore cancelled.\n\nYou must switch to Estuary to continue."
+            )
+            journal.finish()
+            ADDON.setSettingBool("restore_in_progress", False)
+            return
+
+        journal.mark("step", "skin")
+        journal.commit()
+
+    # Restore files + install repos/add-ons in parallel stages
+    # (GUI cache DBs are cleared after the XMLs are restored, before installs)
+    zip_path = os.path.join(profile("addon_data/script.kodi.profiler/backups"), zip_name)
+    choices = restore_choices(zip_path, journal)
+    manifest, install_report = jobs.run_with_progress(
+        "Restoring",
+        restore_pipelined,
+        zip_path,
+        temp("profiler/restore_staging"),
+        overwrite_xml=True,
+        journal=journal,
+        find_base=find_base_backup,
+        **choices,
+        **fast_restore_settings(keep_zip=True),
+    )
+    journal.finish()
 
     repo_fail = len(install_report["repos"]["failed"])
     addon_fail = len(install_report["addons"]["failed"])
@@ -253,6 +698,7 @@ def do_local_restore():
         "Restore complete.\n\n"
         "Kodi will restart into Estuary.\n"
         "On next startup, Profiler will prompt you to switch back to your skin.\n\n"
+        f"{deferred_note()}"
         "Restart Kodi now?"
     )
 
@@ -273,19 +719,7 @@ def do_local_restore():
 
     # user chose not to restart
     ADDON.setSettingBool("restore_in_progress", False)
-        
-def clear_gui_cache():
-    db_dir = profile("Database")
-    if not os.path.isdir(db_dir):
-        return
 
-    for pattern in ("Addons*.db", "ViewModes*.db"):
-        for path in glob.glob(os.path.join(db_dir, pattern)):
-            try:
-                os.remove(path)
-            except Exception:
-                pass
-                
 
 if __name__ == "__main__":
     main()
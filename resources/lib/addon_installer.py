@@ -2,13 +2,15 @@ import os
 import time
 import shutil
 import xbmc
-import xbmcgui
 import xbmcvfs
 import urllib.request
 
 from resources.lib.jsonrpc import JsonRpc
-from resources.lib.log import info, warn, err, exc
+from resources.lib.log import info, warn, err, exc, Progress
 from resources.lib.paths import temp, home
+from resources.lib import jobs
+from resources.lib.install_plan import INSTALL, UPDATE, ENABLE, SKIP, build_plan, counts, current_addons
+from resources.lib.repo_index import RepoIndex
 
 BUILTIN_REPOS = {"repository.xbmc.org"}
 
@@ -78,7 +80,7 @@ def install_repo_zip_by_extract(repo_id: str, zip_path: str, timeout_s: int = 60
     addons_dir = home("addons")
     dest_dir = os.path.join(addons_dir, repo_id)
 
-    info(f"[RepoExtract] Installing repo: {repo_id} zip={zip_path}", notify=True)
+    info(f"[RepoExtract] Installing repo: {repo_id} zip={zip_path}")
 
     if not os.path.isfile(zip_path):
         err(f"[RepoExtract] Repo zip missing: {zip_path}", notify=True)
@@ -116,7 +118,7 @@ def install_repo_zip_by_extract(repo_id: str, zip_path: str, timeout_s: int = 60
     xbmc.executebuiltin(f'EnableAddon({repo_id})')
     _sleep(500)
 
-    info(f"[RepoExtract] Repo OK: {repo_id}", notify=True)
+    info(f"[RepoExtract] Repo OK: {repo_id}")
     return True
 
 
@@ -125,7 +127,7 @@ def _download_to(url: str, dst_path: str):
     Download url -> dst_path (binary). Raises on failure.
     Uses urllib (works on Kodi Python).
     """
-    info(f"Downloading: {url} -> {dst_path}", notify=True)
+    info(f"Downloading: {url} -> {dst_path}")
     _mkdirs(os.path.dirname(dst_path))
 
     with urllib.request.urlopen(url, timeout=60) as r:
@@ -179,6 +181,60 @@ def _wait_until_installed_by_list(rpc: JsonRpc, addon_id: str, timeout_s: int =
         _sleep(1000)
 
 
+def _set_enabled(rpc: JsonRpc, addon_id: str, enabled: bool):
+    info(f"{'Enable' if enabled else 'Disable'} add-on: {addon_id}")
+    rpc.call("Addons.SetAddonEnabled", {"addonid": addon_id, "enabled": enabled})
+
+
+def apply_plan_step(rpc: JsonRpc, addon_id: str, step: dict, timeout_s: int = 60):
+    """
+    Carry out one install_plan step. Returns (outcome, why), outcome being
+    "installed", "skipped" or "failed". Updates are only reported: Kodi's
+    InstallAddon does nothing for an add-on that is already installed.
+    """
+    action = step["action"]
+    if action == SKIP:
+        return "skipped", ""
+
+    if action == UPDATE:
+        why = f"Newer version wanted: {step['have']} installed, backup had {step['want']}"
+        warn(f"{addon_id}: {why} (update it from its repository)")
+        if step.get("have_enabled") is not None and step["have_enabled"] != step["enabled"]:
+            _set_enabled(rpc, addon_id, step["enabled"])
+        return "skipped", why
+
+    if action == INSTALL:
+        info(f"Install request: {addon_id}")
+        rpc.install_addon(addon_id)  # should call InstallAddon builtin internally
+        ok, why = _wait_until_installed_by_list(rpc, addon_id, timeout_s=timeout_s)
+        if not ok:
+            return "failed", why
+
+    # Kodi enables what it installs; match the backed-up state
+    if action == ENABLE or not step["enabled"]:
+        _set_enabled(rpc, addon_id, step["enabled"])
+    return "installed", ""
+
+
+def _repo_index(rpc: JsonRpc):
+    """RepoIndex over the installed repositories; None if it can't be built."""
+    try:
+        repo_ids = [a["addonid"] for a in rpc.get_installed_addons() if a.get("addonid", "").startswith("repository.")]
+        return RepoIndex().refresh(repo_ids)
+    except Exception as e:
+        warn(f"Repository index unavailable, installing blind: {e}")
+        return None
+
+
+def _not_provided(addon_id: str, origin: str, installed_ids) -> str:
+    """Why no repository can install addon_id."""
+    if origin and origin not in installed_ids:
+        return f"Not in any installed repository (it came from {origin}, which is not installed)"
+    if origin:
+        return f"Not in any installed repository ({origin} no longer carries it)"
+    return "Not in any installed repository"
+
+
 def _validate_manifest(manifest: dict):
     repos = manifest.get("repos")
     addons = manifest.get("addons")
@@ -203,7 +259,7 @@ def _validate_manifest(manifest: dict):
             raise RuntimeError("Manifest invalid: addons list must not contain repository.* IDs")
 
 
-def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
+def _install_repos(repo_entries, timeout_per_repo_s: int = 90, journal=None):
     """
     NEW BEHAVIOUR:
     - Repo installation is ALWAYS done by extracting zip into addons folder.
@@ -217,13 +273,16 @@ def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
 
     installed, skipped, failed = [], [], []
 
-    dialog = xbmcgui.DialogProgress()
+    dialog = jobs.progress_dialog()
     dialog.create("Profiler", "Installing repositories…")
 
+    progress = Progress("Installing repos", len(repo_entries))
+
     try:
         total = len(repo_entries) or 1
 
         for i, repo in enumerate(repo_entries, start=1):
+            progress.update(len(installed), len(skipped), len(failed))
             if dialog.iscanceled():
                 warn("User cancelled repo install phase", notify=True)
                 failed.append({"id": repo.get("id", ""), "error": "User cancelled"})
@@ -242,6 +301,11 @@ def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
                 skipped.append(rid)
                 continue
 
+            if journal and journal.done("repo", rid):
+                info(f"Skip repo (done before interruption): {rid}")
+                skipped.append(rid)
+                continue
+
             # If already installed and folder exists, skip
             if rid in installed_ids and _exists(home(f"addons/{rid}/addon.xml")):
                 info(f"Skip repo (already installed): {rid}")
@@ -253,16 +317,16 @@ def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
                 local_zip = ""
                 if zip_path:
                     local_zip = zip_path
-                    info(f"Repo zip resolved: {rid} -> {local_zip}", notify=True)
+                    info(f"Repo zip resolved: {rid} -> {local_zip}")
 
                 # Fallback to zip_url
                 elif zip_url:
                     local_zip = temp(f"profiler_repo_zips/{rid}.zip")
-                    info(f"Repo zip_url fallback: {rid} -> {zip_url}", notify=True)
+                    info(f"Repo zip_url fallback: {rid} -> {zip_url}")
                     _download_to(zip_url, local_zip)
 
                 else:
-                    err(f"Repo has no zip_path or zip_url: {rid}", notify=True)
+                    err(f"Repo has no zip_path or zip_url: {rid}")
                     failed.append({"id": rid, "error": "Missing zip_path and zip_url"})
                     continue
 
@@ -270,16 +334,24 @@ def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
                 if ok:
                     installed.append(rid)
                     installed_ids.add(rid)
+                    if journal:
+                        journal.mark("repo", rid)
+                        journal.commit()
                 else:
                     failed.append({"id": rid, "error": "Extract install failed"})
 
             except Exception as e:
-                exc(f"Exception installing repo {rid}: {e}")
+                exc(f"Exception installing repo {rid}: {e}", notify=False)
                 failed.append({"id": rid, "error": str(e)})
 
+        progress.update(len(installed), len(skipped), len(failed))
+        # Cancelled from a job's dialog: stop the whole job, not just this loop
+        jobs.checkpoint()
+
         # After all repos, refresh repo contents ONCE (less DB spam)
-        xbmc.executebuiltin("UpdateAddonRepos")
-        _sleep(8000)
+        if installed:
+            xbmc.executebuiltin("UpdateAddonRepos")
+            _sleep(8000)
 
         return installed, skipped, failed
 
@@ -287,24 +359,35 @@ def _install_repos(repo_entries, timeout_per_repo_s: int = 90):
         dialog.close()
 
 
-def _install_addons(addon_ids, timeout_per_addon_s: int = 60):
+def _install_addons(addon_ids, timeout_per_addon_s: int = 60, journal=None, plan=None):
     """
     Addons still install by ID using your JsonRpc wrapper (which should fall back to InstallAddon builtin).
+    plan: install_plan.build_plan() result; add-ons it doesn't cover are
+    installed unless present. Enabled-state fixes count as installed; updates
+    are reported and counted as skipped (see apply_plan_step).
     """
     rpc = JsonRpc()
     _preflight_or_die(rpc)
 
     installed_ids = rpc.get_installed_ids()
+    plan = plan or {}
+
+    # Know up front what the repos can provide, so missing add-ons fail fast
+    todo = [a for a in addon_ids
+            if (plan.get(a) or {}).get("action", SKIP if a in installed_ids else INSTALL) == INSTALL]
+    index = _repo_index(rpc) if todo else None
 
     installed, skipped, failed = [], [], []
 
-    dialog = xbmcgui.DialogProgress()
+    dialog = jobs.progress_dialog()
     dialog.create("Profiler", "Installing add-ons…")
+    progress = Progress("Installing add-ons", len(addon_ids))
 
     try:
         total = len(addon_ids) or 1
 
         for i, aid in enumerate(addon_ids, start=1):
+            progress.update(len(installed), len(skipped), len(failed))
             if dialog.iscanceled():
                 warn("User cancelled add-on install phase", notify=True)
                 failed.append({"id": aid, "error": "User cancelled"})
@@ -313,66 +396,122 @@ def _install_addons(addon_ids, timeout_per_addon_s: int = 60):
             pct = int((i / total) * 100)
             dialog.update(pct, f"Addon ({i}/{total}): {aid}")
 
-            if aid in installed_ids:
+            step = plan.get(aid) or {"action": SKIP if aid in installed_ids else INSTALL, "enabled": True, "want": ""}
+            action = step["action"]
+            if action == INSTALL and aid in installed_ids:
+                action = SKIP
+            if action == SKIP or (journal and journal.done("addon", aid)):
                 info(f"Skip (already installed): {aid}")
                 skipped.append(aid)
                 continue
 
-            try:
-                info(f"Install request: {aid}", notify=True)
-                rpc.install_addon(aid)  # should call InstallAddon builtin internally
+            offered = index.lookup(aid) if index else None
+            if action == INSTALL and index and index.complete and offered is None:
+                why = _not_provided(aid, step.get("origin", ""), installed_ids)
+                err(f"Install failed: {aid} - {why}")
+                failed.append({"id": aid, "error": why})
+                continue
 
-                ok, why = _wait_until_installed_by_list(rpc, aid, timeout_s=timeout_per_addon_s)
-                if ok:
+            try:
+                outcome, why = apply_plan_step(rpc, aid, {**step, "action": action}, timeout_s=timeout_per_addon_s)
+                if outcome == "skipped":
+                    skipped.append(aid)
+                elif outcome == "installed":
                     installed.append(aid)
                     installed_ids.add(aid)
+                    if journal:
+                        journal.mark("addon", aid)
+                        journal.commit()
                 else:
-                    err(f"Install failed: {aid} - {why}", notify=True)
+                    err(f"Install failed: {aid} - {why}")
                     failed.append({"id": aid, "error": why})
 
             except Exception as e:
-                exc(f"Exception installing {aid}: {e}")
+                exc(f"Exception installing {aid}: {e}", notify=False)
                 failed.append({"id": aid, "error": str(e)})
 
+        progress.update(len(installed), len(skipped), len(failed))
+        jobs.checkpoint()
+
         return installed, skipped, failed
 
     finally:
         dialog.close()
 
 
-def run_install(manifest: dict):
-    _validate_manifest(manifest)
+def new_report() -> dict:
+    return {
+        "repos": {"installed": [], "skipped": [], "failed": []},
+        "addons": {"installed": [], "skipped": [], "failed": []},
+    }
 
+
+def install_repos_phase(manifest: dict, report: dict, journal=None):
+    """Install every repo by EXTRACT, filling report["repos"]."""
     repos = manifest.get("repos") or []
-    addons = manifest.get("addons") or []
+    if not repos:
+        return
 
-    info(f"run_install: repos={len(repos)} addons={len(addons)}", notify=True)
+    r_inst, r_skip, r_fail = _install_repos(repos, timeout_per_repo_s=90, journal=journal)
+    report["repos"] = {"installed": r_inst, "skipped": r_skip, "failed": r_fail}
 
-    report = {
-        "repos": {"installed": [], "skipped": [], "failed": []},
-        "addons": {"installed": [], "skipped": [], "failed": []},
-    }
+    if r_fail:
+        warn(f"{len(r_fail)} repo(s) failed to install. Some addons may not resolve.", notify=True)
 
-    # 1) Install repos by EXTRACT
-    if repos:
-        r_inst, r_skip, r_fail = _install_repos(repos, timeout_per_repo_s=90)
-        report["repos"] = {"installed": r_inst, "skipped": r_skip, "failed": r_fail}
 
-        if r_fail:
-            warn(f"{len(r_fail)} repo(s) failed to install. Some addons may not resolve.", notify=True)
+def plan_installs(manifest: dict) -> dict:
+    """The minimal install plan for manifest's add-ons against this box (see install_plan)."""
+    plan = build_plan(manifest, current_addons(JsonRpc()))
+    info("Install plan: " + ", ".join(f"{k}={v}" for k, v in counts(plan).items()))
+    return plan
 
-    # 2) Refresh repos ONCE more
-    xbmc.executebuiltin("UpdateAddonRepos")
-    _sleep(10000)  # Firestick needs longer
 
-    # 3) Install addons
-    a_inst, a_skip, a_fail = _install_addons(addons, timeout_per_addon_s=60)
+def install_addons_phase(manifest: dict, report: dict, journal=None, plan=None):
+    """Refresh repos once more, then install add-ons, filling report["addons"]."""
+    addons = manifest.get("addons") or []
+    if plan is None:
+        plan = plan_installs(manifest)
+    if all(plan.get(a, {}).get("action") == SKIP for a in addons):
+        report["addons"] = {"installed": [], "skipped": list(addons), "failed": []}
+        info("Add-ons: nothing to do")
+        return
+
+    # only installs need the repo refresh
+    if any(plan.get(a, {}).get("action", INSTALL) == INSTALL for a in addons):
+        xbmc.executebuiltin("UpdateAddonRepos")
+        _sleep(10000)  # Firestick needs longer
+
+    a_inst, a_skip, a_fail = _install_addons(addons, timeout_per_addon_s=60, journal=journal, plan=plan)
     report["addons"] = {"installed": a_inst, "skipped": a_skip, "failed": a_fail}
 
+
+def log_summary(report: dict):
     info(
         f"Install summary: repos ok={len(report['repos']['installed'])} fail={len(report['repos']['failed'])} | "
         f"addons ok={len(report['addons']['installed'])} fail={len(report['addons']['failed'])}",
         notify=True
     )
 
+
+def run_install(manifest: dict, journal=None):
+    """
+    journal: optional RestoreJournal; repos/add-ons confirmed in an earlier,
+    interrupted run are skipped.
+    """
+    _validate_manifest(manifest)
+
+    repos = manifest.get("repos") or []
+    addons = manifest.get("addons") or []
+
+    info(f"run_install: repos={len(repos)} addons={len(addons)}", notify=True)
+
+    report = new_report()
+
+    # 1) Install repos by EXTRACT
+    install_repos_phase(manifest, report, journal)
+
+    # 2) Refresh repos ONCE more, 3) Install addons
+    install_addons_phase(manifest, report, journal)
+
+    log_summary(report)
     return report
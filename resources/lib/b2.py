@@ -1,23 +1,95 @@
 import base64
+import http.client
 import hashlib
 import json
+import os
+import socket
+import threading
+import time
 from typing import Optional, Dict, Any
+import urllib.error
 import urllib.request
 import urllib.parse
 
+from resources.lib import jobs, throttle
+from resources.lib.log import info, warn
+
 from typing import Optional, Dict, Any
 
+DEFAULT_API_URL = "https://api.backblazeb2.com"
+# Overrides the default when no api_base is passed (e.g. the bench fake server)
+API_URL_ENV = "PROFILER_B2_API_URL"
+
+TIMEOUT_S = 60
+RETRIES = 4
+RETRY_BACKOFF_S = 1.0
+
+# Files at least this big go up as B2 large files, in parallel parts
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+PART_SIZE = 16 * 1024 * 1024
+UPLOAD_THREADS = 3
+
+
+class B2TransientError(RuntimeError):
+    """A 408/429/5xx or timeout: worth retrying (with a fresh upload URL for uploads)."""
+
+
+def _http_error(e: urllib.error.HTTPError, url: str) -> RuntimeError:
+    body = e.read().decode("utf-8", errors="replace")
+    cls = B2TransientError if e.code in (408, 429) or e.code >= 500 else RuntimeError
+    return cls(f"B2 HTTP {e.code} on {url}: {body}")
+
+
+def with_retries(fn, what: str, attempts: int = 0, backoff_s: float = -1):
+    """Call fn() until it doesn't raise B2TransientError, backing off exponentially."""
+    attempts = attempts or RETRIES
+    backoff_s = RETRY_BACKOFF_S if backoff_s < 0 else backoff_s
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except B2TransientError as e:
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_s * (2 ** attempt)
+            warn(f"{what}: {e}; retrying in {delay:.0f}s ({attempt + 1}/{attempts - 1})")
+            time.sleep(delay)
+
+
+class _Transport:
+    """Maps socket timeouts / connection drops to B2TransientError."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None or isinstance(exc, RuntimeError):
+            return False
+        if isinstance(exc, urllib.error.HTTPError):
+            raise _http_error(exc, self.url) from None
+        if isinstance(exc, (socket.timeout, TimeoutError, ConnectionError, urllib.error.URLError,
+                            http.client.HTTPException)):
+            raise B2TransientError(f"B2 request to {self.url} failed: {exc}") from None
+        return False
+
+
 class B2Client:
-    def __init__(self, key_id: str, app_key: str):
+    def __init__(self, key_id: str, app_key: str, api_base: str = "", timeout: float = TIMEOUT_S):
+        """api_base: scheme://host of the authorize endpoint, for a B2-compatible stand-in."""
         self.key_id = key_id
         self.app_key = app_key
+        self.api_base = (api_base or os.environ.get(API_URL_ENV) or DEFAULT_API_URL).rstrip("/")
+        self.timeout = timeout
         self.api_url = None
         self.download_url = None
         self.account_auth_token = None
         self.account_id = None
+        self.min_part_size = 5 * 1024 * 1024
 
     def _req_json(self, url: str, headers: Dict[str, str], body: Optional[Dict[str, Any]]):
-        try:
+        with _Transport(url):
             data = None
             if body is not None:
                 data = json.dumps(body).encode("utf-8")
@@ -28,24 +100,22 @@ class B2Client:
                 headers=headers,
                 method="POST" if body is not None else "GET",
             )
-            with urllib.request.urlopen(req) as resp:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
                 raw = resp.read()
                 return json.loads(raw.decode("utf-8")) if raw else {}
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"B2 HTTP {e.code} on {url}: {body}")
 
     def authorize(self):
         # b2_authorize_account :contentReference[oaicite:19]{index=19}
         creds = f"{self.key_id}:{self.app_key}".encode("utf-8")
         b64 = base64.b64encode(creds).decode("ascii")
-        url = "https://api.backblazeb2.com/b2api/v2/b2_authorize_account"
+        url = f"{self.api_base}/b2api/v2/b2_authorize_account"
         # Note: docs also describe newer API structures; v2 authorize endpoint remains valid for Native API suites. :contentReference[oaicite:20]{index=20}
         out = self._req_json(url, {"Authorization": f"Basic {b64}"}, body=None)
         self.api_url = out["apiUrl"]
         self.download_url = out["downloadUrl"]
         self.account_auth_token = out["authorizationToken"]
         self.account_id = out["accountId"]
+        self.min_part_size = int(out.get("absoluteMinimumPartSize") or self.min_part_size)
         return out
 
     def list_buckets(self):
@@ -62,44 +132,271 @@ class B2Client:
                 return b["bucketId"]
         raise RuntimeError(f"Bucket not found: {bucket_name}")
 
-    def list_file_names(self, bucket_id: str, prefix: str = ""):
+    def list_file_names(self, bucket_id: str, prefix: str = "", start_file_name: str = ""):
         # b2_list_file_names :contentReference[oaicite:22]{index=22}
         url = f"{self.api_url}/b2api/v2/b2_list_file_names"
         body = {"bucketId": bucket_id, "maxFileCount": 1000}
+        if start_file_name:
+            body["startFileName"] = start_file_name
         if prefix:
             body["prefix"] = prefix
         return self._req_json(url, {"Authorization": self.account_auth_token}, body)
 
+    def list_file_versions(self, bucket_id: str, start_file_name: str = "", max_count: int = 100,
+                           start_file_id: str = "", prefix: str = ""):
+        # b2_list_file_versions: newest version of each name comes first
+        url = f"{self.api_url}/b2api/v2/b2_list_file_versions"
+        body = {"bucketId": bucket_id, "maxFileCount": max_count}
+        if start_file_name:
+            body["startFileName"] = start_file_name
+        if start_file_id:
+            body["startFileId"] = start_file_id
+        if prefix:
+            body["prefix"] = prefix
+        return self._req_json(url, {"Authorization": self.account_auth_token}, body)
+
+    def delete_file_version(self, file_name: str, file_id: str):
+        # b2_delete_file_version
+        url = f"{self.api_url}/b2api/v2/b2_delete_file_version"
+        return self._req_json(url, {"Authorization": self.account_auth_token}, {"fileName": file_name, "fileId": file_id})
+
+    def latest_sha1(self, bucket_id: str, file_name: str) -> str:
+        """contentSha1 of the newest uploaded version of file_name, or "" if unknown."""
+        out = self.list_file_versions(bucket_id, start_file_name=file_name, max_count=1)
+        for f in out.get("files", []):
+            if f.get("fileName") != file_name or f.get("action") != "upload":
+                return ""
+            sha1 = f.get("contentSha1") or ""
+            if sha1 in ("", "none"):
+                # large files carry the whole-file hash in fileInfo instead
+                sha1 = (f.get("fileInfo") or {}).get("large_file_sha1") or ""
+            if sha1.startswith("unverified:"):
+                sha1 = sha1[len("unverified:"):]
+            return "" if sha1 == "none" else sha1
+        return ""
+
     def get_upload_url(self, bucket_id: str):
         # b2_get_upload_url :contentReference[oaicite:23]{index=23}
         url = f"{self.api_url}/b2api/v2/b2_get_upload_url"
         return self._req_json(url, {"Authorization": self.account_auth_token}, {"bucketId": bucket_id})
 
-    def upload_file(self, upload_url: str, upload_auth_token: str, file_name: str, data_bytes: bytes, content_type="application/zip"):
-        try:
+    def upload_file(self, upload_url: str, upload_auth_token: str, file_name: str, data_bytes, content_type="application/zip", sha1: str = "", on_read=None):
+        """
+        data_bytes: bytes, or a binary file streamed from its current position
+        (then sha1 is required). sha1: pass it when already known to skip
+        hashing data_bytes again. on_read: see throttle.ThrottledReader.
+        """
+        with _Transport(upload_url):
             # b2_upload_file :contentReference[oaicite:24]{index=24}
-            sha1 = hashlib.sha1(data_bytes).hexdigest()
+            body = throttle.ThrottledReader(data_bytes, on_read=on_read)
+            sha1 = sha1 or hashlib.sha1(data_bytes).hexdigest()
             headers = {
                 "Authorization": upload_auth_token,
                 "X-Bz-File-Name": urllib.parse.quote(file_name, safe="/"),
                 "Content-Type": content_type,
                 "X-Bz-Content-Sha1": sha1,
+                "Content-Length": str(len(body)),
+            }
+            req = urllib.request.Request(upload_url, data=body, headers=headers, method="POST")
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+
+    # --- large files (b2_start_large_file / b2_upload_part / b2_finish_large_file) ---
+
+    def start_large_file(self, bucket_id: str, file_name: str, content_type: str = "application/zip",
+                         file_info: Optional[Dict[str, str]] = None):
+        url = f"{self.api_url}/b2api/v2/b2_start_large_file"
+        body = {"bucketId": bucket_id, "fileName": file_name, "contentType": content_type}
+        if file_info:
+            body["fileInfo"] = file_info
+        return self._req_json(url, {"Authorization": self.account_auth_token}, body)
+
+    def get_upload_part_url(self, file_id: str):
+        url = f"{self.api_url}/b2api/v2/b2_get_upload_part_url"
+        return self._req_json(url, {"Authorization": self.account_auth_token}, {"fileId": file_id})
+
+    def upload_part(self, upload_url: str, upload_auth_token: str, part_number: int, data_bytes: bytes, sha1: str = ""):
+        with _Transport(upload_url):
+            headers = {
+                "Authorization": upload_auth_token,
+                "X-Bz-Part-Number": str(part_number),
+                "X-Bz-Content-Sha1": sha1 or hashlib.sha1(data_bytes).hexdigest(),
                 "Content-Length": str(len(data_bytes)),
             }
-            req = urllib.request.Request(upload_url, data=data_bytes, headers=headers, method="POST")
-            with urllib.request.urlopen(req) as resp:
+            req = urllib.request.Request(upload_url, data=throttle.ThrottledReader(data_bytes), headers=headers, method="POST")
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
                 return json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"B2 HTTP {e.code} on {url}: {body}")
+
+    def finish_large_file(self, file_id: str, part_sha1s):
+        url = f"{self.api_url}/b2api/v2/b2_finish_large_file"
+        return self._req_json(url, {"Authorization": self.account_auth_token},
+                              {"fileId": file_id, "partSha1Array": list(part_sha1s)})
+
+    def cancel_large_file(self, file_id: str):
+        url = f"{self.api_url}/b2api/v2/b2_cancel_large_file"
+        return self._req_json(url, {"Authorization": self.account_auth_token}, {"fileId": file_id})
+
+    def upload_large_file(self, bucket_id: str, file_name: str, path: str, sha1: str = "",
+                          part_size: int = PART_SIZE, threads: int = UPLOAD_THREADS,
+                          content_type: str = "application/zip"):
+        """
+        Upload path as a B2 large file, `threads` parts in flight, each worker
+        with its own part URL (a fresh one after a failed attempt). sha1 is
+        stored as large_file_sha1 so latest_sha1() still works.
+        """
+        size = os.path.getsize(path)
+        part_size = max(part_size, self.min_part_size)
+        parts = [(n + 1, off, min(part_size, size - off)) for n, off in enumerate(range(0, size, part_size))]
+        file_info = {"large_file_sha1": sha1} if sha1 else None
+        file_id = with_retries(lambda: self.start_large_file(bucket_id, file_name, content_type, file_info),
+                               f"Start large file {file_name}")["fileId"]
+
+        lock = threading.Lock()
+        part_sha1s = {}
+        errors = []
+        todo = list(parts)
+
+        def worker():
+            up = None
+            with open(path, "rb") as f:
+                while not errors:
+                    with lock:
+                        if not todo:
+                            return
+                        number, offset, length = todo.pop(0)
+                    f.seek(offset)
+                    data = f.read(length)
+                    throttle.disk(len(data))
+                    digest = hashlib.sha1(data).hexdigest()
+
+                    def send():
+                        nonlocal up
+                        if up is None:
+                            up = self.get_upload_part_url(file_id)
+                        try:
+                            return self.upload_part(up["uploadUrl"], up["authorizationToken"], number, data, digest)
+                        except B2TransientError:
+                            up = None
+                            raise
+
+                    try:
+                        jobs.checkpoint()
+                        with_retries(send, f"Upload {file_name} part {number}/{len(parts)}")
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        return
+                    with lock:
+                        part_sha1s[number] = digest
+                    jobs.advance(nbytes=length)
+
+        workers = [threading.Thread(target=worker, name=f"profiler-b2-part-{n}", daemon=True)
+                   for n in range(max(1, min(threads, len(parts))))]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        if errors:
+            try:
+                self.cancel_large_file(file_id)
+            except Exception as e:
+                warn(f"Could not cancel large file {file_name}: {e}")
+            raise errors[0]
+        info(f"Uploaded {file_name} as {len(parts)} parts ({size} bytes, {len(workers)} threads)")
+        return with_retries(lambda: self.finish_large_file(file_id, [part_sha1s[n] for n, _, _ in parts]),
+                            f"Finish large file {file_name}")
+
+    def upload_path(self, bucket_id: str, file_name: str, path: str, sha1: str = "",
+                    content_type: str = "application/zip"):
+        """
+        Upload a file from disk: one b2_upload_file (retried with a fresh
+        upload URL) below LARGE_FILE_THRESHOLD, a parallel large file above.
+        """
+        if os.path.getsize(path) >= max(LARGE_FILE_THRESHOLD, 2 * self.min_part_size):
+            return self.upload_large_file(bucket_id, file_name, path, sha1=sha1, content_type=content_type)
+
+        if not sha1:
+            with open(path, "rb") as f:
+                h = hashlib.sha1()
+                for buf in iter(lambda: f.read(throttle.CHUNK), b""):
+                    h.update(buf)
+            sha1 = h.hexdigest()
+
+        def on_read(n):
+            jobs.checkpoint()
+            jobs.advance(nbytes=n)
+
+        def send():
+            up = self.get_upload_url(bucket_id)
+            jobs.update(bytes_done=0)
+            with open(path, "rb") as f:
+                return self.upload_file(up["uploadUrl"], up["authorizationToken"], file_name, f, content_type,
+                                        sha1=sha1, on_read=on_read)
+
+        return with_retries(send, f"Upload {file_name}")
 
     def download_by_name(self, bucket_name: str, file_name: str) -> bytes:
-        try:
-            # b2_download_file_by_name :contentReference[oaicite:25]{index=25}
-            url = f"{self.download_url}/file/{bucket_name}/{file_name}"
+        # b2_download_file_by_name :contentReference[oaicite:25]{index=25}
+        url = f"{self.download_url}/file/{bucket_name}/{file_name}"
+        with _Transport(url):
+            req = urllib.request.Request(url, headers={"Authorization": self.account_auth_token}, method="GET")
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return throttle.read_response(resp)
+
+    def download_by_id(self, file_id: str) -> bytes:
+        # b2_download_file_by_id: a specific version, not just the newest
+        url = f"{self.download_url}/b2api/v2/b2_download_file_by_id?fileId={urllib.parse.quote(file_id)}"
+        with _Transport(url):
             req = urllib.request.Request(url, headers={"Authorization": self.account_auth_token}, method="GET")
-            with urllib.request.urlopen(req) as resp:
-                return resp.read()
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"B2 HTTP {e.code} on {url}: {body}")
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return throttle.read_response(resp)
+
+    def download_range(self, bucket_name: str, file_name: str, start: int, end: int):
+        """
+        Download bytes [start, end] of a file. Returns (data, total_size, content_sha1).
+        """
+        url = f"{self.download_url}/file/{bucket_name}/{file_name}"
+        with _Transport(url):
+            headers = {"Authorization": self.account_auth_token, "Range": f"bytes={start}-{end}"}
+            req = urllib.request.Request(url, headers=headers, method="GET")
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                data = throttle.read_response(resp)
+                total = start + len(data)
+                content_range = resp.headers.get("Content-Range", "")
+                if "/" in content_range:
+                    total = int(content_range.rsplit("/", 1)[1])
+                elif resp.status == 200:
+                    # server ignored Range and sent the whole file
+                    total = len(data)
+                    data = data[start:]
+                return data, total, resp.headers.get("x-bz-content-sha1", "")
+
+    def download_to_file(self, bucket_name: str, file_name: str, dst_path: str, start: int = 0,
+                         chunk_size: int = 8 * 1024 * 1024, on_chunk=None) -> int:
+        """
+        Download a file to dst_path in Range chunks, appending from `start`
+        (bytes already on disk from an interrupted run). on_chunk(offset, total, sha1)
+        is called after each chunk is written. Returns the final size.
+        """
+        mode = "r+b" if start and os.path.isfile(dst_path) else "wb"
+        if mode == "wb":
+            start = 0
+
+        offset = start
+        total = None
+        with open(dst_path, mode) as f:
+            f.truncate(start)
+            f.seek(start)
+            while total is None or offset < total:
+                data, total, sha1 = with_retries(
+                    lambda: self.download_range(bucket_name, file_name, offset, offset + chunk_size - 1),
+                    f"Download {file_name} @{offset}")
+                if not data:
+                    break
+                f.write(data)
+                f.flush()
+                offset += len(data)
+                if on_chunk:
+                    on_chunk(offset, total, sha1)
+        return offset
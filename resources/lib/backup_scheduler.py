@@ -0,0 +1,113 @@
+import time
+
+import xbmc
+import xbmcaddon
+
+from resources.lib.workflow_backup import backup_to_b2, cloud_backup_settings
+from resources.lib.workflow_backup_local import backup_local
+from resources.lib.deferred_restore import has_plan
+from resources.lib.journal import RestoreJournal
+from resources.lib.retention import run_after_backup
+from resources.lib.idle import is_idle, lower_thread_priority
+from resources.lib.log import info, warn, exc
+
+# How often the service re-checks "due + idle"
+CHECK_INTERVAL_S = 60
+
+# Yield to Kodi every N files even while idle
+YIELD_EVERY = 20
+
+
+class BackupAborted(Exception):
+    pass
+
+
+def _settings():
+    # Fresh object each time: Kodi caches settings per Addon() instance
+    return xbmcaddon.Addon()
+
+
+def enabled() -> bool:
+    return _settings().getSetting("auto_backup") == "true"
+
+
+def _is_due(addon, now: float) -> bool:
+    interval_h = max(1, int(addon.getSetting("auto_backup_interval_h") or 24))
+    try:
+        last = float(addon.getSetting("auto_backup_last_ts") or 0)
+    except ValueError:
+        last = 0
+    return now - last >= interval_h * 3600
+
+
+def _record(addon, status: str, now: float):
+    addon.setSetting("auto_backup_last_ts", str(int(now)))
+    addon.setSetting("auto_backup_last_run", time.strftime("%Y-%m-%d %H:%M", time.localtime(now)))
+    addon.setSetting("auto_backup_last_status", status)
+    info(f"[AutoBackup] {status}")
+
+
+def _make_tick(monitor: xbmc.Monitor, idle_s: int):
+    """
+    Called between files: yields to Kodi regularly, parks the backup while
+    the user is active/playing, and aborts on shutdown (the next run redoes
+    little thanks to the file index).
+    """
+    count = [0]
+
+    def tick():
+        count[0] += 1
+        if count[0] % YIELD_EVERY == 0 and monitor.waitForAbort(0.01):
+            raise BackupAborted()
+        while not is_idle(idle_s):
+            if monitor.waitForAbort(5):
+                raise BackupAborted()
+        if monitor.abortRequested():
+            raise BackupAborted()
+
+    return tick
+
+
+def run_once(monitor: xbmc.Monitor) -> None:
+    addon = _settings()
+    name = (addon.getSetting("auto_backup_name") or "auto").strip() or "auto"
+    idle_s = max(0, int(addon.getSetting("auto_backup_idle_min") or 10)) * 60
+    tick = _make_tick(monitor, idle_s)
+    now = time.time()
+
+    try:
+        if addon.getSetting("auto_backup_target") == "1":
+            res = backup_to_b2(build_name=name, tick=tick, **cloud_backup_settings(addon))
+            verb = "uploaded" if res["uploaded"] else "unchanged"
+            _record(addon, f"OK: {verb} {res['remote_name']}", now)
+        else:
+            dst = backup_local(build_name=name, tick=tick)
+            _record(addon, f"OK: {dst}", now)
+        run_after_backup(addon)
+    except BackupAborted:
+        # leave last_ts alone so it is retried at the next idle window
+        info("[AutoBackup] interrupted (Kodi shutting down)")
+    except Exception as e:
+        exc(f"[AutoBackup] failed: {e}", notify=False)
+        _record(addon, f"Failed: {e}", now)
+
+
+def run_scheduler(monitor: xbmc.Monitor) -> None:
+    """Long-running service loop: back up whenever due and Kodi is idle."""
+    lower_thread_priority()
+    info("[AutoBackup] scheduler running")
+
+    while not monitor.abortRequested():
+        addon = _settings()
+        if addon.getSetting("auto_backup") != "true":
+            break
+
+        idle_s = max(0, int(addon.getSetting("auto_backup_idle_min") or 10)) * 60
+        if _is_due(addon, time.time()) and not has_plan() and is_idle(idle_s):
+            if addon.getSettingBool("restore_in_progress") or RestoreJournal().session():
+                warn("[AutoBackup] restore in progress or interrupted; postponing")
+            else:
+                run_once(monitor)
+
+        if monitor.waitForAbort(CHECK_INTERVAL_S):
+            break
@@ -0,0 +1,127 @@
+"""
+catalog.json.gz: a small object next to the backups describing each one
+(date, size, sha1, Kodi version, skin, add-on count, subtree sizes), so the
+restore picker needs one small download instead of opening every zip.
+
+B2 has no conditional writes, so updates are optimistic: read the newest
+version, upload the merged catalog, then check that nobody else uploaded
+between the version we read and ours. If someone did, merge theirs in and
+upload again. Entries are keyed by remote name, so merging is idempotent.
+"""
+
+import gzip
+import json
+import os
+import time
+import zipfile
+
+import xbmc
+
+from resources.lib.log import info, warn
+
+CATALOG_NAME = "catalog.json.gz"
+CATALOG_VERSION = 1
+MAX_ATTEMPTS = 5
+
+
+def catalog_name(prefix: str) -> str:
+    return ((prefix or "").strip("/") + "/" + CATALOG_NAME).lstrip("/")
+
+
+def _subtree(name: str) -> str:
+    parts = name.split("/")
+    if parts[0] == "userdata" and len(parts) > 2:
+        return "/".join(parts[:2])
+    return parts[0] if len(parts) > 1 else "(root)"
+
+
+def subtree_sizes(zip_path: str) -> dict:
+    """Uncompressed bytes per top-level subtree, from the central directory only."""
+    sizes = {}
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for m in z.infolist():
+            key = _subtree(m.filename)
+            sizes[key] = sizes.get(key, 0) + m.file_size
+    return dict(sorted(sizes.items()))
+
+
+def make_entry(build_name: str, remote_name: str, zip_path: str, sha1: str, manifest: dict) -> dict:
+    return {
+        "name": build_name,
+        "remote_name": remote_name,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "size": os.path.getsize(zip_path),
+        "sha1": sha1,
+        "kodi_major": manifest.get("kodi_major", 0),
+        "skin": manifest.get("active_skin", ""),
+        "addon_count": len(manifest.get("addons") or []),
+        "device": xbmc.getInfoLabel("System.FriendlyName") or "",
+        "subtrees": subtree_sizes(zip_path),
+        "delta_base": (manifest.get("deltas") or {}).get("base", ""),
+    }
+
+
+def _decode(raw: bytes) -> dict:
+    try:
+        data = json.loads(gzip.decompress(raw).decode("utf-8"))
+    except (OSError, ValueError) as e:
+        warn(f"Catalog unreadable, starting fresh: {e}")
+        return {}
+    return data.get("backups", {}) if isinstance(data, dict) else {}
+
+
+def _encode(backups: dict) -> bytes:
+    body = {"version": CATALOG_VERSION, "backups": dict(sorted(backups.items()))}
+    # mtime=0 keeps the gzip bytes stable for identical content
+    return gzip.compress(json.dumps(body, indent=1).encode("utf-8"), mtime=0)
+
+
+def _versions(b2, bucket_id: str, name: str, count: int = 20) -> list:
+    """Uploaded versions of name, newest first."""
+    out = b2.list_file_versions(bucket_id, start_file_name=name, max_count=count)
+    return [f for f in out.get("files", []) if f.get("fileName") == name and f.get("action") == "upload"]
+
+
+def load_catalog(b2, bucket_id: str, prefix: str) -> dict:
+    """{remote_name: entry} from the newest catalog version ({} if there is none)."""
+    versions = _versions(b2, bucket_id, catalog_name(prefix), count=1)
+    if not versions:
+        return {}
+    return _decode(b2.download_by_id(versions[0]["fileId"]))
+
+
+def update_catalog(b2, bucket_id: str, prefix: str, entry: dict) -> None:
+    """Add/replace entry in the bucket catalog, safe against concurrent writers."""
+    name = catalog_name(prefix)
+    versions = _versions(b2, bucket_id, name, count=1)
+    base_id = versions[0]["fileId"] if versions else ""
+    backups = _decode(b2.download_by_id(base_id)) if base_id else {}
+
+    backups[entry["remote_name"]] = entry
+
+    for _ in range(MAX_ATTEMPTS):
+        up = b2.get_upload_url(bucket_id)
+        res = b2.upload_file(up["uploadUrl"], up["authorizationToken"], name, _encode(backups),
+                             content_type="application/gzip")
+        mine = res.get("fileId", "")
+
+        # Everything uploaded after the version we based ours on, except ours
+        missed = []
+        for v in _versions(b2, bucket_id, name):
+            if v["fileId"] == base_id:
+                break
+            if v["fileId"] != mine:
+                missed.append(v["fileId"])
+
+        if not missed:
+            info(f"Catalog updated: {name} ({len(backups)} backups)")
+            return
+
+        warn(f"Catalog changed concurrently ({len(missed)} version(s)); merging and retrying")
+        for file_id in missed:
+            for k, v in _decode(b2.download_by_id(file_id)).items():
+                if k != entry["remote_name"]:
+                    backups.setdefault(k, v)
+        base_id = mine
+
+    raise RuntimeError(f"Catalog update kept conflicting after {MAX_ATTEMPTS} attempts")
@@ -0,0 +1,340 @@
+"""
+Local SQLite index of what every known backup contains: zip members
+(path, size, CRC, mtime) and manifest entries (add-ons, repos, skin).
+
+Built from central directories only. Local zips are opened in place; remote
+zips are read through HTTP ranges (the tail with the central directory plus
+manifest.json), so nothing is extracted or downloaded in full. Backups are
+re-indexed only when their size/mtime (local) or fileId (remote) changes.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import zipfile
+
+from resources.lib.paths import addon_profile
+from resources.lib.log import info, warn
+
+CONTENTS_DB = "cache/contents.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    source TEXT,
+    name TEXT,
+    location TEXT,
+    size INTEGER,
+    stamp TEXT,
+    date REAL,
+    kodi_major INTEGER,
+    skin TEXT
+);
+CREATE TABLE IF NOT EXISTS members (
+    backup_id INTEGER,
+    path TEXT,
+    size INTEGER,
+    hash TEXT,
+    mtime TEXT,
+    PRIMARY KEY (backup_id, path)
+);
+CREATE TABLE IF NOT EXISTS addons (
+    backup_id INTEGER,
+    addon_id TEXT,
+    kind TEXT,
+    PRIMARY KEY (backup_id, addon_id)
+);
+CREATE INDEX IF NOT EXISTS members_path ON members (path);
+CREATE INDEX IF NOT EXISTS addons_id ON addons (addon_id);
+"""
+
+
+class _RangeFile:
+    """Read-only, seekable view of a remote B2 file, fetched in cached blocks."""
+
+    BLOCK = 64 * 1024
+
+    def __init__(self, b2, bucket_name: str, file_name: str, size: int):
+        self.b2 = b2
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.size = size
+        self.pos = 0
+        self._blocks = {}
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self.pos, 2: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def _block(self, n: int) -> bytes:
+        if n not in self._blocks:
+            start = n * self.BLOCK
+            end = min(self.size, start + self.BLOCK) - 1
+            self._blocks[n], _, _ = self.b2.download_range(self.bucket_name, self.file_name, start, end)
+        return self._blocks[n]
+
+    def read(self, n: int = -1) -> bytes:
+        end = self.size if n is None or n < 0 else min(self.size, self.pos + n)
+        out = []
+        while self.pos < end:
+            block = self._block(self.pos // self.BLOCK)
+            off = self.pos % self.BLOCK
+            piece = block[off:off + (end - self.pos)]
+            if not piece:
+                break
+            out.append(piece)
+            self.pos += len(piece)
+        return b"".join(out)
+
+    def close(self):
+        self._blocks.clear()
+
+
+def _member_rows(z: zipfile.ZipFile, manifest: dict):
+    """
+    (path, size, hash, mtime); delta members are listed under the file they
+    rebuild, hashed by its CRC like whole members (SHA-1 for deltas from
+    before the manifest recorded one).
+    """
+    deltas = (manifest.get("deltas") or {}).get("files") or {}
+    rows = []
+    for m in z.infolist():
+        if m.filename.endswith("/"):
+            continue
+        rows.append((m.filename, m.file_size, f"crc:{m.CRC:08x}", "%04d-%02d-%02d %02d:%02d:%02d" % m.date_time))
+    for arc, meta in deltas.items():
+        h = f"crc:{meta['crc']}" if meta.get("crc") else f"sha1:{meta.get('sha1', '')}"
+        rows.append((arc, int(meta.get("size", 0)), h, ""))
+    rows = [r for r in rows if not r[0].startswith("deltas/")]
+    return rows
+
+
+def _differs(a: tuple, b: tuple) -> bool:
+    """(size, hash) pairs; hashes of different kinds can't be compared, so only the sizes are."""
+    if a[1].partition(":")[0] != b[1].partition(":")[0]:
+        return a[0] != b[0]
+    return a != b
+
+
+def _list_names(b2, bucket_id: str, prefix: str) -> list:
+    out, start = [], ""
+    while True:
+        page = b2.list_file_names(bucket_id, prefix=prefix, start_file_name=start)
+        out.extend(page.get("files", []))
+        start = page.get("nextFileName")
+        if not start:
+            return out
+
+
+def _read_manifest(z: zipfile.ZipFile) -> dict:
+    try:
+        return json.loads(z.read("manifest.json").decode("utf-8"))
+    except (KeyError, ValueError):
+        return {}
+
+
+class ContentsIndex:
+    def __init__(self, db_path: str = ""):
+        self.db_path = db_path or addon_profile(CONTENTS_DB)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    # --- indexing ---
+
+    def _is_current(self, key: str, stamp: str) -> bool:
+        row = self.conn.execute("SELECT stamp FROM backups WHERE key=?", (key,)).fetchone()
+        return bool(row) and row[0] == stamp
+
+    def _store(self, key, source, name, location, size, stamp, date, z: zipfile.ZipFile):
+        manifest = _read_manifest(z)
+        self._forget(key)
+        cur = self.conn.execute(
+            "INSERT INTO backups (key, source, name, location, size, stamp, date, kodi_major, skin) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, source, name, location, size, stamp, date,
+             int(manifest.get("kodi_major") or 0), manifest.get("active_skin") or ""),
+        )
+        bid = cur.lastrowid
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO members (backup_id, path, size, hash, mtime) VALUES (?, ?, ?, ?, ?)",
+            [(bid,) + r for r in _member_rows(z, manifest)],
+        )
+        ids = [(bid, a, "addon") for a in manifest.get("addons") or []]
+        ids += [(bid, r["id"], "repo") for r in manifest.get("repos") or [] if r.get("id")]
+        self.conn.executemany("INSERT OR REPLACE INTO addons (backup_id, addon_id, kind) VALUES (?, ?, ?)", ids)
+
+    def _forget(self, key: str):
+        row = self.conn.execute("SELECT id FROM backups WHERE key=?", (key,)).fetchone()
+        if row:
+            for table in ("members", "addons"):
+                self.conn.execute(f"DELETE FROM {table} WHERE backup_id=?", (row[0],))
+            self.conn.execute("DELETE FROM backups WHERE id=?", (row[0],))
+
+    def _prune(self, source: str, keep_keys) -> int:
+        keep = set(keep_keys)
+        gone = [k for (k,) in self.conn.execute("SELECT key FROM backups WHERE source=?", (source,)) if k not in keep]
+        for k in gone:
+            self._forget(k)
+        return len(gone)
+
+    def index_local(self, backup_dir: str) -> int:
+        """Index every zip in backup_dir. Returns how many were (re)indexed."""
+        keys, n = [], 0
+        for entry in sorted(os.scandir(backup_dir), key=lambda e: e.name) if os.path.isdir(backup_dir) else ():
+            if not entry.name.lower().endswith(".zip") or not entry.is_file():
+                continue
+            st = entry.stat()
+            key = f"local:{entry.name}"
+            stamp = f"{st.st_size}:{st.st_mtime_ns}"
+            keys.append(key)
+            if self._is_current(key, stamp):
+                continue
+            try:
+                with zipfile.ZipFile(entry.path, "r") as z:
+                    self._store(key, "local", entry.name[:-4], entry.path, st.st_size, stamp, st.st_mtime, z)
+                n += 1
+            except (zipfile.BadZipFile, OSError) as e:
+                warn(f"Contents index: skipping {entry.path} ({e})")
+        self._prune("local", keys)
+        self.conn.commit()
+        return n
+
+    def index_remote(self, b2, bucket_id: str, bucket_name: str, prefix: str) -> int:
+        """Index the zips under prefix in B2 via ranged reads. Returns how many were (re)indexed."""
+        keys, n = [], 0
+        for f in _list_names(b2, bucket_id, prefix):
+            name = f.get("fileName", "")
+            if not name.endswith(".zip"):
+                continue
+            key = f"b2:{name}"
+            stamp = f.get("fileId", "")
+            keys.append(key)
+            if self._is_current(key, stamp):
+                continue
+            size = int(f.get("contentLength") or 0)
+            rf = _RangeFile(b2, bucket_name, name, size)
+            try:
+                with zipfile.ZipFile(rf, "r") as z:
+                    self._store(key, "b2", os.path.basename(name)[:-4], name, size, stamp,
+                                int(f.get("uploadTimestamp") or 0) / 1000.0, z)
+                n += 1
+            except (zipfile.BadZipFile, RuntimeError) as e:
+                warn(f"Contents index: skipping b2:{name} ({e})")
+            finally:
+                rf.close()
+        self._prune("b2", keys)
+        self.conn.commit()
+        return n
+
+    # --- queries ---
+
+    def backups(self) -> list:
+        """[(key, label)] newest first."""
+        rows = self.conn.execute("SELECT key, source, name, date FROM backups ORDER BY date DESC").fetchall()
+        return [(k, f"{name} [{src}] {_fmt_date(d)}") for k, src, name, d in rows]
+
+    def local_summaries(self) -> list:
+        """Picker rows for the indexed local backups (no zip access)."""
+        rows = self.conn.execute(
+            """
+            SELECT b.name, b.location, b.date, b.size, b.kodi_major, b.skin,
+                   (SELECT COUNT(*) FROM addons a WHERE a.backup_id=b.id AND a.kind='addon')
+            FROM backups b WHERE b.source='local'
+            """
+        ).fetchall()
+        keys = ("name", "path", "date", "size", "kodi_major", "skin", "addon_count")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def with_addon(self, addon_id: str) -> list:
+        """Backups that install addon_id and/or carry its addon_data, newest first."""
+        lo, hi = _prefix_range(f"userdata/addon_data/{addon_id}/")
+        rows = self.conn.execute(
+            """
+            SELECT b.name, b.source, b.date,
+                   (SELECT kind FROM addons a WHERE a.backup_id=b.id AND a.addon_id=?),
+                   (SELECT COUNT(*) FROM members m WHERE m.backup_id=b.id AND m.path >= ? AND m.path < ?),
+                   (SELECT COALESCE(SUM(size), 0) FROM members m WHERE m.backup_id=b.id AND m.path >= ? AND m.path < ?)
+            FROM backups b ORDER BY b.date DESC
+            """,
+            (addon_id, lo, hi, lo, hi),
+        ).fetchall()
+        return [
+            {"backup": name, "source": src, "date": date, "kind": kind or "", "data_files": files, "data_size": size}
+            for name, src, date, kind, files, size in rows
+            if kind or files
+        ]
+
+    def history(self, pattern: str) -> list:
+        """Members whose path contains pattern, per backup oldest first, with a changed flag."""
+        rows = self.conn.execute(
+            "SELECT m.path, b.name, b.source, b.date, m.size, m.hash FROM members m JOIN backups b ON b.id=m.backup_id "
+            "WHERE m.path LIKE ? ESCAPE '\\' ORDER BY m.path, b.date",
+            (f"%{_like_escape(pattern)}%",),
+        ).fetchall()
+        out, last = [], {}
+        for path, name, src, date, size, h in rows:
+            prev = last.get(path)
+            out.append({"path": path, "backup": name, "source": src, "date": date, "size": size,
+                        "changed": prev is None or _differs(prev, (size, h))})
+            last[path] = (size, h)
+        return out
+
+    def diff(self, key_a: str, key_b: str) -> dict:
+        """Members and add-ons that differ going from backup A to backup B."""
+        def members(key):
+            return dict(((p, (s, h)) for p, s, h in self.conn.execute(
+                "SELECT m.path, m.size, m.hash FROM members m JOIN backups b ON b.id=m.backup_id WHERE b.key=?", (key,))))
+
+        def addon_ids(key):
+            return {a for (a,) in self.conn.execute(
+                "SELECT a.addon_id FROM addons a JOIN backups b ON b.id=a.backup_id WHERE b.key=?", (key,))}
+
+        ma, mb = members(key_a), members(key_b)
+        aa, ab = addon_ids(key_a), addon_ids(key_b)
+        return {
+            "added": sorted(p for p in mb if p not in ma),
+            "removed": sorted(p for p in ma if p not in mb),
+            "changed": sorted(p for p in ma if p in mb and _differs(ma[p], mb[p])),
+            "addons_added": sorted(ab - aa),
+            "addons_removed": sorted(aa - ab),
+        }
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _prefix_range(prefix: str):
+    # [lo, hi) bounds, so prefix lookups can use the (backup_id, path) key
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _fmt_date(ts) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts or 0))
+
+
+def refresh(b2=None, bucket_id: str = "", bucket_name: str = "", prefix: str = "") -> ContentsIndex:
+    """Open the index and bring it up to date (local backups, plus B2 when a client is given)."""
+    idx = ContentsIndex()
+    n = idx.index_local(addon_profile("backups"))
+    if b2 is not None and bucket_id:
+        try:
+            n += idx.index_remote(b2, bucket_id, bucket_name, prefix)
+        except Exception as e:
+            warn(f"Contents index: remote backups not indexed ({e})")
+    info(f"Contents index: {n} backup(s) (re)indexed")
+    return idx
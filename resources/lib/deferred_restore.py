@@ -0,0 +1,258 @@
+"""
+Tier 2 of a fast restore: whatever was not needed to make the box usable
+(remaining addon_data + remaining add-on installs) is written down as a
+plan and finished by the service after Kodi restarts, at low priority,
+pausing while something is playing. Add-ons that fail to install are
+retried on the next few starts.
+"""
+
+import json
+import os
+import shutil
+import zipfile
+
+import xbmc
+import xbmcgui
+
+from resources.lib.paths import master, temp, addon_profile
+from resources.lib.fileops import copy_file, ensure_dir
+from resources.lib.sqliteops import restore_file
+from resources.lib.delta import materialize, read_zip_manifest
+from resources.lib.journal import RestoreJournal
+from resources.lib.jsonrpc import JsonRpc
+from resources.lib.addon_installer import apply_plan_step
+from resources.lib.install_plan import SKIP, build_plan, current_addons
+from resources.lib.workflow_backup import find_base_backup
+from resources.lib.idle import lower_thread_priority
+from resources.lib.log import info, warn, exc
+
+PLAN_FILE = "cache/deferred_restore.json"
+DEFERRED_ZIP = "cache/deferred_restore.zip"
+DEFERRED_BASES = "cache/deferred_bases"
+JOURNAL_DB = "cache/deferred_journal.db"
+
+# Starts on which failed installs are retried before the plan is dropped
+MAX_ATTEMPTS = 3
+
+_CHUNK = 1024 * 1024
+
+
+def tier1_prefixes(addon_ids) -> tuple:
+    """Archive prefixes restored up front for the given tier-1 add-ons."""
+    out = ["userdata/keymaps/"]
+    for aid in addon_ids:
+        out.append(f"userdata/addon_data/{aid}/")
+    return tuple(out + [f"deltas/{p}" for p in out])
+
+
+def has_plan() -> bool:
+    return os.path.isfile(addon_profile(PLAN_FILE))
+
+
+def _tier2_bases(zip_path: str, skip_prefixes, find_base) -> dict:
+    """
+    {name: path} for the delta chain behind tier-2 delta members, resolved
+    now with the restore's own finder (which may have downloaded them).
+    Bases in special://temp are copied into the add-on profile.
+    """
+    with zipfile.ZipFile(zip_path, "r") as z:
+        deltas = read_zip_manifest(z).get("deltas") or {}
+    skip = tuple(skip_prefixes)
+    if find_base is None or not any(
+            arc.startswith("userdata/addon_data/") and not arc.startswith(skip) for arc in deltas.get("files") or {}):
+        return {}
+
+    bases, name = {}, deltas.get("base") or ""
+    while name and name not in bases:
+        try:
+            path = find_base(name)
+        except Exception as e:
+            warn(f"Delta base {name} for the background restore not found: {e}")
+            break
+        if os.path.abspath(path).startswith(temp("profiler")):
+            dst = os.path.join(addon_profile(DEFERRED_BASES), os.path.basename(path))
+            ensure_dir(os.path.dirname(dst))
+            copy_file(path, dst)
+            path = dst
+        bases[name] = path
+        with zipfile.ZipFile(path, "r") as z:
+            name = (read_zip_manifest(z).get("deltas") or {}).get("base") or ""
+    return bases
+
+
+def save_plan(zip_path: str, addons, skip_prefixes, keep_zip: bool, steps=None, find_base=None) -> None:
+    """
+    keep_zip: the zip lives somewhere permanent (local backups). Otherwise it
+    is moved into the add-on profile, since special://temp may not survive.
+    steps: the install_plan steps of those add-ons, so tier 2 applies the
+    same plan (backed-up version and enabled state) as tier 1.
+    find_base: the restore's delta base finder; the bases tier 2 needs are
+    located with it now and their paths saved in the plan.
+    """
+    bases = _tier2_bases(zip_path, skip_prefixes, find_base)
+    if not keep_zip:
+        dst = addon_profile(DEFERRED_ZIP)
+        ensure_dir(os.path.dirname(dst))
+        shutil.move(zip_path, dst)
+        zip_path = dst
+
+    plan = {"zip": zip_path, "addons": list(addons), "skip_prefixes": list(skip_prefixes),
+            "steps": {aid: step for aid, step in (steps or {}).items() if aid in set(addons)},
+            "bases": bases}
+    path = addon_profile(PLAN_FILE)
+    ensure_dir(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    RestoreJournal(addon_profile(JOURNAL_DB)).finish()
+    info(f"Deferred restore planned: {len(plan['addons'])} add-on(s) from {zip_path}")
+
+
+def clear_plan() -> None:
+    for p in (addon_profile(PLAN_FILE), addon_profile(DEFERRED_ZIP)):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    shutil.rmtree(addon_profile(DEFERRED_BASES), ignore_errors=True)
+    RestoreJournal(addon_profile(JOURNAL_DB)).finish()
+
+
+def _base_finder(plan: dict):
+    """find_base for tier 2: the bases saved with the plan, then this device's backups."""
+    bases = plan.get("bases") or {}
+
+    def find_base(name):
+        path = bases.get(name, "")
+        if path and os.path.isfile(path):
+            return path
+        return find_base_backup(name)
+
+    return find_base
+
+
+def _deferred_steps(rpc: JsonRpc, plan: dict) -> dict:
+    """The saved plan steps, re-checked against what is installed after the restart."""
+    steps = plan.get("steps") or {}
+    addon_info = {
+        aid: {"version": s.get("want", ""), "enabled": s.get("enabled", True), "origin": s.get("origin", "")}
+        for aid, s in steps.items()
+    }
+    return build_plan({"addons": plan.get("addons") or [], "addon_info": addon_info}, current_addons(rpc))
+
+
+def _wait_while_playing(monitor: xbmc.Monitor, progress, pct: int) -> bool:
+    """Block while playback is active. Returns False if Kodi is shutting down."""
+    player = xbmc.Player()
+    paused = False
+    while player.isPlaying():
+        if not paused:
+            progress.update(pct, "Profiler", "Paused during playback…")
+            paused = True
+        if monitor.waitForAbort(5):
+            return False
+    return not monitor.abortRequested()
+
+
+def run_deferred(monitor: xbmc.Monitor) -> bool:
+    """
+    Finish a planned tier-2 restore. Resumable: progress is journalled, so
+    an abort just leaves the rest for the next startup. Returns True when done.
+    """
+    path = addon_profile(PLAN_FILE)
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+
+    zip_path = plan["zip"]
+    if not os.path.isfile(zip_path):
+        warn(f"Deferred restore zip is gone ({zip_path}); dropping plan", notify=True)
+        clear_plan()
+        return True
+
+    lower_thread_priority()
+    journal = RestoreJournal(addon_profile(JOURNAL_DB))
+    skip = tuple(plan.get("skip_prefixes") or ())
+    find_base = _base_finder(plan)
+
+    progress = xbmcgui.DialogProgressBG()
+    progress.create("Profiler", "Finishing restore in the background…")
+    try:
+        tmp_dir = addon_profile("cache/deferred_tmp")
+        ensure_dir(tmp_dir)
+
+        with zipfile.ZipFile(zip_path, "r") as z:
+            deltas = (read_zip_manifest(z).get("deltas") or {}).get("files") or {}
+            members = [
+                m.filename for m in z.infolist()
+                if m.filename.startswith("userdata/addon_data/")
+                and not m.filename.endswith("/")
+                and not m.filename.startswith(skip)
+            ]
+            members += [arc for arc in deltas if arc.startswith("userdata/addon_data/") and not arc.startswith(skip)]
+
+            addons = plan.get("addons") or []
+            total = (len(members) + len(addons)) or 1
+
+            for i, arc in enumerate(members, start=1):
+                if journal.done("file", arc):
+                    continue
+                if not _wait_while_playing(monitor, progress, int(i * 100 / total)):
+                    return False
+
+                dst = master(arc[len("userdata/"):])
+                tmp = os.path.join(tmp_dir, "member.tmp")
+                if arc in deltas:
+                    materialize(zip_path, arc, tmp, find_base)
+                else:
+                    with z.open(arc) as src, open(tmp, "wb") as out:
+                        for chunk in iter(lambda: src.read(_CHUNK), b""):
+                            out.write(chunk)
+                ensure_dir(os.path.dirname(dst))
+                restore_file(tmp, dst)
+                journal.mark("file", arc)
+
+                if i % 25 == 0:
+                    progress.update(int(i * 100 / total), "Profiler", f"Restoring add-on data {i}/{len(members)}")
+                    if monitor.waitForAbort(0.05):
+                        return False
+            journal.commit()
+
+        rpc = JsonRpc()
+        steps = _deferred_steps(rpc, plan)
+        failed = 0
+        for n, aid in enumerate(addons, start=1):
+            if steps[aid]["action"] == SKIP or journal.done("addon", aid):
+                continue
+            pct = int((len(members) + n) * 100 / total)
+            if not _wait_while_playing(monitor, progress, pct):
+                return False
+
+            progress.update(pct, "Profiler", f"Installing {n}/{len(addons)}: {aid}")
+            try:
+                outcome, why = apply_plan_step(rpc, aid, steps[aid], timeout_s=60)
+                if outcome == "failed":
+                    failed += 1
+                    warn(f"Deferred install failed: {aid} - {why}")
+                    continue
+            except Exception as e:
+                failed += 1
+                exc(f"Deferred install failed: {aid}: {e}", notify=False)
+                continue
+            # Only successes: failed installs are retried on the next start
+            journal.mark("addon", aid)
+            journal.commit()
+
+        attempts = int(journal.get("attempts") or 0) + 1
+        if failed and attempts < MAX_ATTEMPTS:
+            journal.set("attempts", attempts)
+            info(f"Background restore: {failed} install failure(s), retrying on the next start", notify=True)
+            return False
+
+        journal.finish()
+        clear_plan()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        info(f"Background restore complete ({failed} install failure(s))", notify=True)
+        return True
+    finally:
+        journal.commit()
+        progress.close()
+
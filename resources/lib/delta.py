@@ -0,0 +1,313 @@
+"""
+rsync-style binary deltas for large files between backups.
+
+A delta for <arc> is stored in the new archive as deltas/<arc>.pdelta and
+describes the file as a list of "copy block N..N+k from the base" and
+"literal bytes" ops against the same path in a base backup. The manifest
+records which base backup, the chain depth and the expected size/SHA-1 of
+every reconstructed file (plus its CRC-32, so indexes can compare it with
+whole members):
+
+    "deltas": {"base": "weekly.zip", "depth": 1,
+               "files": {"userdata/addon_data/x/cache.db": {"size": .., "sha1": .., "crc": ..}}}
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+from itertools import accumulate
+from typing import Optional, Dict, Any
+
+MAGIC = b"PDLT1"
+BLOCK_SIZE = 4096
+MAX_CHAIN_GUARD = 16
+
+# Give up (store the file whole) once this share of the file is literal data.
+MAX_LITERAL_RATIO = 0.5
+
+_OP_COPY = b"C"
+_OP_DATA = b"D"
+_CHUNK = 1024 * 1024
+
+
+def delta_member(arc: str) -> str:
+    return f"deltas/{arc}.pdelta"
+
+
+# ----------------------------
+# Hashing
+# ----------------------------
+
+def _weak(block) -> tuple:
+    # rsync checksum: a = sum(x), b = sum((L - i) * x_i) == sum of prefix sums
+    return sum(block) & 0xFFFF, sum(accumulate(block)) & 0xFFFF
+
+
+def _strong(block) -> bytes:
+    return hashlib.sha1(block).digest()
+
+
+def signature(base_path: str, block_size: int = BLOCK_SIZE, tick=None) -> Dict[int, Dict[bytes, int]]:
+    """weak -> {strong: block_index} for every full block of base_path. tick: run every _CHUNK bytes."""
+    sig = {}
+    per_tick = max(1, _CHUNK // block_size)
+    with open(base_path, "rb") as f:
+        idx = 0
+        while True:
+            if tick and idx % per_tick == 0:
+                tick()
+            block = f.read(block_size)
+            if len(block) < block_size:
+                break
+            a, b = _weak(block)
+            sig.setdefault(a | (b << 16), {}).setdefault(_strong(block), idx)
+            idx += 1
+    return sig
+
+
+# ----------------------------
+# Encode / apply
+# ----------------------------
+
+def encode(base_path: str, new_path: str, out_path: str, block_size: int = BLOCK_SIZE,
+           tick=None) -> Optional[Dict[str, Any]]:
+    """
+    Write a delta turning base_path into new_path. Returns {"size", "sha1",
+    "crc", "delta_size"} or None if the delta isn't worth it (too much literal
+    data). crc is the new file's CRC-32 as 8 hex digits, like a zip member's.
+    tick: optional callable run about every _CHUNK bytes (may block or raise).
+    """
+    size = os.path.getsize(new_path)
+    if size < block_size or os.path.getsize(base_path) < block_size:
+        return None
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    if not _encode_ops(signature(base_path, block_size, tick), new_path, size, out_path, block_size, tick):
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return None
+
+    sha1, crc = _sha1_crc(new_path)
+    return {"size": size, "sha1": sha1, "crc": crc, "delta_size": os.path.getsize(out_path)}
+
+
+def _encode_ops(sig, new_path: str, size: int, out_path: str, block_size: int, tick=None) -> bool:
+    max_literal = int(size * MAX_LITERAL_RATIO)
+    literal_total = 0
+    next_tick = 0
+
+    with open(new_path, "rb") as f, open(out_path, "wb") as out:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            out.write(MAGIC + struct.pack(">IQ", block_size, size))
+
+            copy_start, copy_count = -1, 0
+
+            def flush_copy():
+                nonlocal copy_start, copy_count
+                if copy_count:
+                    out.write(_OP_COPY + struct.pack(">II", copy_start, copy_count))
+                copy_start, copy_count = -1, 0
+
+            def flush_literal(start, end):
+                nonlocal literal_total
+                if end > start:
+                    literal_total += end - start
+                    flush_copy()
+                    for i in range(start, end, _CHUNK):
+                        chunk = data[i:min(end, i + _CHUNK)]
+                        out.write(_OP_DATA + struct.pack(">I", len(chunk)) + chunk)
+
+            p = 0
+            literal_start = 0
+            a = b = 0
+            weak_valid = False
+            L = block_size
+
+            while p + L <= size:
+                if tick and p >= next_tick:
+                    tick()
+                    next_tick = p + _CHUNK
+                if not weak_valid:
+                    a, b = _weak(data[p:p + L])
+                    weak_valid = True
+
+                cands = sig.get(a | (b << 16))
+                if cands:
+                    idx = cands.get(_strong(data[p:p + L]))
+                    if idx is not None:
+                        flush_literal(literal_start, p)
+                        if copy_count and copy_start + copy_count == idx:
+                            copy_count += 1
+                        else:
+                            flush_copy()
+                            copy_start, copy_count = idx, 1
+                        p += L
+                        literal_start = p
+                        weak_valid = False
+                        continue
+
+                # miss: roll the window forward one byte
+                if p + L < size:
+                    x_out = data[p]
+                    x_in = data[p + L]
+                    a = (a - x_out + x_in) & 0xFFFF
+                    b = (b - L * x_out + a) & 0xFFFF
+                p += 1
+
+                if p - literal_start + literal_total > max_literal:
+                    return False
+                if p + L > size:
+                    break
+
+            if size - literal_start + literal_total > max_literal:
+                return False
+            flush_literal(literal_start, size)
+            flush_copy()
+        finally:
+            data.close()
+
+    return True
+
+
+def apply(base_path: str, delta_path: str, out_path: str) -> str:
+    """Rebuild a file from base + delta. Returns the SHA-1 of the output."""
+    h = hashlib.sha1()
+    with open(delta_path, "rb") as d, open(base_path, "rb") as base, open(out_path, "wb") as out:
+        if d.read(len(MAGIC)) != MAGIC:
+            raise RuntimeError(f"Not a delta file: {delta_path}")
+        block_size, size = struct.unpack(">IQ", d.read(12))
+
+        while True:
+            op = d.read(1)
+            if not op:
+                break
+            if op == _OP_COPY:
+                start, count = struct.unpack(">II", d.read(8))
+                base.seek(start * block_size)
+                remaining = count * block_size
+                while remaining > 0:
+                    chunk = base.read(min(_CHUNK, remaining))
+                    if not chunk:
+                        raise RuntimeError(f"Delta base too short for {out_path}")
+                    out.write(chunk)
+                    h.update(chunk)
+                    remaining -= len(chunk)
+            elif op == _OP_DATA:
+                (n,) = struct.unpack(">I", d.read(4))
+                chunk = d.read(n)
+                out.write(chunk)
+                h.update(chunk)
+            else:
+                raise RuntimeError(f"Corrupt delta file: {delta_path}")
+
+    if os.path.getsize(out_path) != size:
+        raise RuntimeError(f"Delta output size mismatch for {out_path}")
+    return h.hexdigest()
+
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _sha1_crc(path: str) -> tuple:
+    h, crc = hashlib.sha1(), 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return h.hexdigest(), f"{crc:08x}"
+
+
+# ----------------------------
+# Archive helpers
+# ----------------------------
+
+def read_zip_manifest(z: zipfile.ZipFile) -> dict:
+    try:
+        return json.loads(z.read("manifest.json").decode("utf-8"))
+    except KeyError:
+        return {}
+
+
+def chain_depth(zip_path: str) -> int:
+    with zipfile.ZipFile(zip_path, "r") as z:
+        return int((read_zip_manifest(z).get("deltas") or {}).get("depth", 0))
+
+
+def materialize(zip_path: str, arc: str, out_path: str, find_base, _depth: int = 0) -> bool:
+    """
+    Write the full content of <arc> as stored in zip_path to out_path,
+    following delta chains through find_base(name) -> zip path.
+    Returns False if the backup doesn't contain arc at all.
+    """
+    if _depth > MAX_CHAIN_GUARD:
+        raise RuntimeError(f"Delta chain too deep for {arc}")
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with zipfile.ZipFile(zip_path, "r") as z:
+        deltas = read_zip_manifest(z).get("deltas") or {}
+        entry = (deltas.get("files") or {}).get(arc)
+
+        if not entry:
+            try:
+                src = z.open(arc)
+            except KeyError:
+                return False
+            with src, open(out_path, "wb") as out:
+                for chunk in iter(lambda: src.read(_CHUNK), b""):
+                    out.write(chunk)
+            return True
+
+        delta_tmp = out_path + ".pdelta"
+        with z.open(delta_member(arc)) as src, open(delta_tmp, "wb") as out:
+            for chunk in iter(lambda: src.read(_CHUNK), b""):
+                out.write(chunk)
+
+    base_tmp = out_path + ".base"
+    try:
+        if not materialize(find_base(deltas["base"]), arc, base_tmp, find_base, _depth + 1):
+            raise RuntimeError(f"Delta base {deltas['base']} has no {arc}")
+        sha1 = apply(base_tmp, delta_tmp, out_path)
+    finally:
+        for p in (base_tmp, delta_tmp):
+            if os.path.exists(p):
+                os.remove(p)
+
+    if sha1 != entry.get("sha1"):
+        raise RuntimeError(f"Delta checksum mismatch for {arc}")
+    return True
+
+
+def restore_deltas(staging: str, manifest: dict, find_base) -> int:
+    """
+    Reconstruct every delta-encoded file of an extracted backup in place
+    (staging/<arc>), using the base backup named in the manifest.
+    """
+    deltas = manifest.get("deltas") or {}
+    files = deltas.get("files") or {}
+    if not files:
+        return 0
+
+    base_zip = find_base(deltas["base"])
+    for arc, entry in files.items():
+        out_path = os.path.join(staging, *arc.split("/"))
+        base_tmp = out_path + ".base"
+        try:
+            if not materialize(base_zip, arc, base_tmp, find_base):
+                raise RuntimeError(f"Delta base {deltas['base']} has no {arc}")
+            sha1 = apply(base_tmp, os.path.join(staging, *delta_member(arc).split("/")), out_path)
+        finally:
+            if os.path.exists(base_tmp):
+                os.remove(base_tmp)
+        if sha1 != entry.get("sha1"):
+            raise RuntimeError(f"Delta checksum mismatch for {arc}")
+    return len(files)
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from typing import Optional, Dict, Any
+
+
+class FileIndex:
+    """
+    Persistent file-state index (SQLite) used by incremental backups.
+
+    Keyed by archive path (e.g. "userdata/addon_data/foo/settings.xml").
+    For every file we remember the source stat (size/mtime/inode), its CRC32
+    and where its compressed bytes live in the previous archive, so an
+    unchanged file can be copied raw from that archive on the next run.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " crc INTEGER, compress_size INTEGER, header_offset INTEGER)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self._seen = set()
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    # --- meta ---
+
+    def _get_meta(self, key: str, default: str = "") -> str:
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def previous_archive(self) -> str:
+        """
+        Path of the archive the offsets refer to, or "" if it is gone or has
+        been modified since (offsets would be meaningless).
+        """
+        path = self._get_meta("archive")
+        if not path or not os.path.isfile(path):
+            return ""
+        try:
+            if os.path.getsize(path) != int(self._get_meta("archive_size", "-1")):
+                return ""
+        except (OSError, ValueError):
+            return ""
+        return path
+
+    # --- entries ---
+
+    def lookup(self, rel: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        """Return the stored entry if the file is unchanged since the last backup."""
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, inode, crc, compress_size, header_offset FROM files WHERE path=?",
+            (rel,),
+        ).fetchone()
+        if not row:
+            return None
+        size, mtime_ns, inode, crc, compress_size, header_offset = row
+        if size != st.st_size or mtime_ns != st.st_mtime_ns or inode != st.st_ino:
+            return None
+        return {"crc": crc, "compress_size": compress_size, "header_offset": header_offset}
+
+    def record(self, rel: str, st: os.stat_result, zinfo) -> None:
+        self._seen.add(rel)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, crc, compress_size, header_offset)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rel, st.st_size, st.st_mtime_ns, st.st_ino, zinfo.CRC, zinfo.compress_size, zinfo.header_offset),
+        )
+
+    def commit(self, archive_path: str) -> None:
+        """Drop entries not seen in this run and point the index at the new archive."""
+        known = [r[0] for r in self.conn.execute("SELECT path FROM files")]
+        stale = [(p,) for p in known if p not in self._seen]
+        if stale:
+            self.conn.executemany("DELETE FROM files WHERE path=?", stale)
+        self._set_meta("archive", archive_path)
+        self._set_meta("archive_size", os.path.getsize(archive_path))
+        self.conn.commit()
+        self._seen = set()
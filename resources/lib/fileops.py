@@ -2,6 +2,8 @@ import os
 import time
 import xbmcvfs
 
+from resources.lib import throttle
+
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
@@ -11,10 +13,11 @@ def copy_file(src: str, dst: str, retries: int = 5, delay: float = 0.2) -> None:
     last_err = None
     for _ in range(retries):
         try:
-            with open(src, "rb") as fsrc:
-                data = fsrc.read()
-            with open(dst, "wb") as fdst:
-                fdst.write(data)
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                for chunk in iter(lambda: fsrc.read(throttle.CHUNK), b""):
+                    # charged once for the read, once for the write
+                    throttle.disk(2 * len(chunk))
+                    fdst.write(chunk)
             return
         except Exception as e:
             last_err = e
@@ -0,0 +1,21 @@
+import os
+import threading
+
+import xbmc
+
+
+def lower_thread_priority():
+    # Linux/Android: per-thread nice via the native thread id
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except Exception:
+        pass
+
+
+def is_idle(idle_threshold_s: int) -> bool:
+    """Nothing playing, and the screensaver is up or the user has been idle long enough."""
+    if xbmc.Player().isPlaying():
+        return False
+    if xbmc.getCondVisibility("System.ScreenSaverActive"):
+        return True
+    return xbmc.getGlobalIdleTime() >= idle_threshold_s
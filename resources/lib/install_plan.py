@@ -0,0 +1,102 @@
+"""
+Minimal install plan for a restore: compare the manifest's recorded add-on
+state (addon_info: version, enabled, origin) with what this box has, so a
+re-restore onto a partly provisioned device only does the missing work.
+
+    install   not installed here
+    update    installed, but older than the backed-up version (reported
+              only: Kodi can't be asked to update a single installed add-on)
+    enable    right version, but enabled/disabled differently
+    skip      nothing to do
+
+Manifests from before addon_info only know IDs: install or skip.
+"""
+
+import re
+
+INSTALL, UPDATE, ENABLE, SKIP = "install", "update", "enable", "skip"
+ACTIONS = (INSTALL, UPDATE, ENABLE, SKIP)
+
+_LABELS = {INSTALL: "Install", UPDATE: "Newer version wanted (update manually)", ENABLE: "Enable/disable only", SKIP: "Already up to date"}
+
+
+def version_key(version: str) -> tuple:
+    """Sortable key for Kodi versions: 1.2.3, 1.2.3~beta1 (before 1.2.3), 2.0.0+matrix.1."""
+    main = (version or "").partition("+")[0]
+    main, tilde, pre = main.partition("~")
+    nums = [int(n) for n in re.findall(r"\d+", main)]
+    while nums and nums[-1] == 0:
+        nums.pop()
+    return tuple(nums), 0 if tilde else 1, pre
+
+
+def current_addons(rpc) -> dict:
+    """Installed add-ons here: {id: {"version", "enabled"}}."""
+    res = rpc.call("Addons.GetAddons", {"installed": True, "properties": ["version", "enabled"]})
+    return {
+        a["addonid"]: {"version": a.get("version") or "", "enabled": a.get("enabled", True) is not False}
+        for a in res.get("addons") or [] if a.get("addonid")
+    }
+
+
+def build_plan(manifest: dict, current: dict) -> dict:
+    """{addon id: {"action", "have", "have_enabled", "want", "enabled", "origin"}} for every add-on in the manifest."""
+    info = manifest.get("addon_info") or {}
+    plan = {}
+    for aid in manifest.get("addons") or []:
+        rec = info.get(aid) or {}
+        want = rec.get("version") or ""
+        enabled = rec.get("enabled", True) is not False
+        have = current.get(aid)
+        if have is None:
+            action = INSTALL
+        elif want and have["version"] and version_key(have["version"]) < version_key(want):
+            action = UPDATE
+        elif rec and have["enabled"] != enabled:
+            action = ENABLE
+        else:
+            action = SKIP
+        plan[aid] = {
+            "action": action,
+            "have": have["version"] if have else "",
+            "have_enabled": have["enabled"] if have else None,
+            "want": want,
+            "enabled": enabled,
+            "origin": rec.get("origin") or "",
+        }
+    return plan
+
+
+def counts(plan: dict) -> dict:
+    out = {a: 0 for a in ACTIONS}
+    for step in plan.values():
+        out[step["action"]] += 1
+    return out
+
+
+def has_work(plan: dict) -> bool:
+    """Anything the restore will actually do (updates are only reported)."""
+    return any(step["action"] in (INSTALL, ENABLE) for step in plan.values())
+
+
+def describe(plan: dict, limit: int = 6) -> str:
+    """Plan summary for a dialog: counts per action, then the first few IDs of each."""
+    lines = []
+    for action in ACTIONS:
+        ids = [aid for aid, step in plan.items() if step["action"] == action]
+        if not ids:
+            continue
+        lines.append(f"{_LABELS[action]}: {len(ids)}")
+        if action == SKIP:
+            continue
+        for aid in ids[:limit]:
+            step = plan[aid]
+            if action == UPDATE:
+                lines.append(f"  {aid} {step['have']} -> {step['want']}")
+            elif action == ENABLE:
+                lines.append(f"  {aid} ({'enable' if step['enabled'] else 'disable'})")
+            else:
+                lines.append(f"  {aid} {step['want']}".rstrip())
+        if len(ids) > limit:
+            lines.append(f"  ... and {len(ids) - limit} more")
+    return "\n".join(lines)
@@ -0,0 +1,336 @@
+"""
+Run a workflow on a worker thread and follow its progress.
+
+Workflows report through module functions that do nothing outside a job
+(like memprofile.phase), so the same code runs unchanged from the service:
+
+    with jobs.phase("Compressing", files_total=n, bytes_total=size):
+        for ...:
+            jobs.checkpoint()              # raises Cancelled once cancel() was asked
+            ...
+            jobs.advance(files=1, nbytes=st.st_size)
+
+run_with_progress() starts a job and renders its events in a DialogProgress
+(or DialogProgressBG) with a smoothed ETA; cancelling the dialog, or Kodi
+shutting down, cancels the job at its next checkpoint.
+"""
+
+import contextlib
+import threading
+import time
+
+import xbmc
+import xbmcgui
+
+from resources.lib.log import info
+
+# How often the consumer publishes events (and polls for cancel)
+POLL_S = 0.25
+# Throughput/ETA are re-sampled at most this often and smoothed (EWMA)
+SAMPLE_S = 1.0
+SMOOTHING = 0.3
+
+_ACTIVE = None
+_local = threading.local()
+
+
+class Cancelled(RuntimeError):
+    pass
+
+
+class _Phase:
+    def __init__(self, name: str, files_total: int = 0, bytes_total: int = 0):
+        self.name = name
+        self.detail = ""
+        self.files_done = self.bytes_done = 0
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.percent = None
+        self.t0 = time.monotonic()
+        self._sample = (self.t0, 0.0, 0)
+        self.rate = None       # bytes/s, smoothed
+        self.frac_rate = None  # fraction/s, smoothed
+
+    def fraction(self):
+        if self.bytes_total:
+            return min(1.0, self.bytes_done / self.bytes_total)
+        if self.files_total:
+            return min(1.0, self.files_done / self.files_total)
+        if self.percent is not None:
+            return min(1.0, self.percent / 100.0)
+        return None
+
+    def event(self, now: float) -> dict:
+        frac = self.fraction()
+        t, last_frac, last_bytes = self._sample
+        if now - t >= SAMPLE_S:
+            dt = now - t
+            rate = (self.bytes_done - last_bytes) / dt
+            self.rate = rate if self.rate is None else self.rate + SMOOTHING * (rate - self.rate)
+            if frac is not None:
+                fr = (frac - last_frac) / dt
+                self.frac_rate = fr if self.frac_rate is None else self.frac_rate + SMOOTHING * (fr - self.frac_rate)
+            self._sample = (now, frac or 0.0, self.bytes_done)
+        eta = None
+        if frac is not None and self.frac_rate and self.frac_rate > 0:
+            eta = (1.0 - frac) / self.frac_rate
+        return {
+            "phase": self.name,
+            "detail": self.detail,
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "fraction": frac,
+            "bytes_per_s": self.rate if self.bytes_done else None,
+            "eta_s": eta,
+            "elapsed_s": now - self.t0,
+        }
+
+
+class Job:
+    """
+    fn(*args, **kwargs) on a worker thread. Open phases are published as
+    event dicts (newest first) to subscribers each time publish() is called.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self._fn, self._args, self._kwargs = fn, args, kwargs
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._phases = []
+        self._subscribers = []
+        self._result = None
+        self._error = None
+        self._thread = None
+
+    def start(self) -> "Job":
+        global _ACTIVE
+        if _ACTIVE is not None:
+            raise RuntimeError("Another job is already running")
+        _ACTIVE = self
+        self._thread = threading.Thread(target=self._run, name="profiler-job", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        global _ACTIVE
+        try:
+            self._result = self._fn(*self._args, **self._kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            _ACTIVE = None
+            self._done.set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """True once fn has returned or raised."""
+        return self._done.wait(timeout)
+
+    def result(self):
+        """fn's return value; re-raises what fn raised."""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def subscribe(self, fn):
+        """fn(events) is called from publish(); events is a list of dicts, newest phase first."""
+        self._subscribers.append(fn)
+
+    def events(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [p.event(now) for p in reversed(self._phases)]
+
+    def publish(self):
+        events = self.events()
+        for fn in self._subscribers:
+            fn(events)
+
+    def _open(self, p: _Phase):
+        with self._lock:
+            self._phases.append(p)
+
+    def _close(self, p: _Phase):
+        with self._lock:
+            if p in self._phases:
+                self._phases.remove(p)
+
+    def _current(self):
+        stack = getattr(_local, "stack", None)
+        if stack:
+            return stack[-1]
+        # threads a workflow starts itself (upload parts) report to the newest phase
+        with self._lock:
+            return self._phases[-1] if self._phases else None
+
+
+def active():
+    return _ACTIVE
+
+
+def cancelled() -> bool:
+    return _ACTIVE is not None and _ACTIVE.cancelled
+
+
+def checkpoint():
+    """Raise Cancelled if the running job was cancelled; no-op otherwise."""
+    if _ACTIVE is not None and _ACTIVE.cancelled:
+        raise Cancelled("Cancelled")
+
+
+@contextlib.contextmanager
+def _job_phase(job: Job, name: str, files_total: int, bytes_total: int):
+    p = _Phase(name, files_total, bytes_total)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    job._open(p)
+    stack.append(p)
+    try:
+        yield p
+    finally:
+        stack.remove(p)
+        job._close(p)
+
+
+def phase(name: str, files_total: int = 0, bytes_total: int = 0):
+    """A named step of the running job; phases may nest and run on several threads."""
+    job = _ACTIVE
+    return _job_phase(job, name, files_total, bytes_total) if job else contextlib.nullcontext()
+
+
+def advance(files: int = 0, nbytes: int = 0):
+    job = _ACTIVE
+    p = job._current() if job else None
+    if p is not None:
+        with job._lock:
+            p.files_done += files
+            p.bytes_done += nbytes
+
+
+def update(detail: str = None, percent: float = None, files_done: int = None, files_total: int = None,
+           bytes_done: int = None, bytes_total: int = None):
+    """Set absolute values on the current phase (None leaves a field alone)."""
+    job = _ACTIVE
+    p = job._current() if job else None
+    if p is None:
+        return
+    for key, value in (("detail", detail), ("percent", percent), ("files_done", files_done),
+                       ("files_total", files_total), ("bytes_done", bytes_done), ("bytes_total", bytes_total)):
+        if value is not None:
+            setattr(p, key, value)
+
+
+class _JobDialog:
+    """DialogProgress stand-in for loops that run inside a job: create/close map to a phase."""
+
+    def __init__(self, job: Job):
+        self._job = job
+        self._cm = None
+
+    def create(self, heading, message=""):
+        self._cm = _job_phase(self._job, message or heading, 0, 0)
+        self._cm.__enter__()
+
+    def update(self, percent, message=""):
+        update(detail=message, percent=percent)
+
+    def iscanceled(self):
+        return self._job.cancelled
+
+    def close(self):
+        if self._cm:
+            self._cm.__exit__(None, None, None)
+            self._cm = None
+
+
+def progress_dialog():
+    """xbmcgui.DialogProgress, or inside a job one that reports to the job's dialog."""
+    return _JobDialog(_ACTIVE) if _ACTIVE else xbmcgui.DialogProgress()
+
+
+def _size(n) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+
+
+def _duration(s: float) -> str:
+    s = int(s + 0.5)
+    if s < 60:
+        return f"{s}s"
+    if s < 3600:
+        return f"{s // 60}m {s % 60:02d}s"
+    return f"{s // 3600}h {s % 3600 // 60:02d}m"
+
+
+def format_event(ev: dict) -> list:
+    """Up to three lines: phase + detail, counts, throughput + ETA."""
+    lines = [f"{ev['phase']}: {ev['detail']}" if ev["detail"] else ev["phase"]]
+    counts = []
+    if ev["files_total"]:
+        counts.append(f"{ev['files_done']}/{ev['files_total']} files")
+    if ev["bytes_total"]:
+        counts.append(f"{_size(ev['bytes_done'])} of {_size(ev['bytes_total'])}")
+    elif ev["bytes_done"]:
+        counts.append(_size(ev["bytes_done"]))
+    if counts:
+        lines.append(", ".join(counts))
+    speed = []
+    if ev["bytes_per_s"]:
+        speed.append(f"{_size(ev['bytes_per_s'])}/s")
+    if ev["eta_s"] is not None and ev["eta_s"] >= 1:
+        speed.append(f"about {_duration(ev['eta_s'])} left")
+    if speed:
+        lines.append(", ".join(speed))
+    return lines
+
+
+def run_with_progress(title: str, fn, *args, background: bool = False, on_event=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) as a job and show its progress until it ends.
+    background: a DialogProgressBG (no cancel button) instead of a modal
+    DialogProgress. on_event: extra subscriber, see Job.subscribe.
+    Returns fn's result; raises what fn raised (Cancelled after a cancel).
+    """
+    job = Job(fn, *args, **kwargs)
+    dialog = xbmcgui.DialogProgressBG() if background else xbmcgui.DialogProgress()
+    dialog.create("Profiler", title)
+
+    def render(events):
+        if not events:
+            return
+        ev = events[0]
+        pct = int((ev["fraction"] or 0) * 100)
+        lines = format_event(ev)
+        if background:
+            dialog.update(pct, f"Profiler: {title}", " - ".join(lines))
+        else:
+            dialog.update(pct, "\n".join(lines + [f"Also: {e['phase']}" for e in events[1:2]]))
+
+    job.subscribe(render)
+    if on_event:
+        job.subscribe(on_event)
+
+    monitor = xbmc.Monitor()
+    job.start()
+    try:
+        while not job.wait(POLL_S):
+            job.publish()
+            if not job.cancelled and ((not background and dialog.iscanceled()) or monitor.abortRequested()):
+                info(f"{title}: cancelling")
+                job.cancel()
+    finally:
+        dialog.close()
+    return job.result()
@@ -0,0 +1,97 @@
+import json
+import os
+import sqlite3
+import threading
+
+from resources.lib.paths import addon_profile
+
+JOURNAL_DB = "cache/restore_journal.db"
+
+
+class RestoreJournal:
+    """
+    Crash-safe record of a restore session in the add-on profile.
+
+    Steps are (kind, key) pairs, e.g. ("member", "userdata/sources.xml"),
+    ("file", <dst path>), ("repo", <id>), ("addon", <id>), ("step", "skin").
+    Cheap per-file marks are committed in batches; a crash only loses the
+    last batch, and every step is safe to redo. Safe to share between the
+    threads of a pipelined restore.
+    """
+
+    COMMIT_EVERY = 50
+
+    def __init__(self, db_path: str = ""):
+        self.db_path = db_path or addon_profile(JOURNAL_DB)
+        self._conn = None
+        self._pending = 0
+        self._lock = threading.RLock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS steps (kind TEXT, key TEXT, PRIMARY KEY (kind, key))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+        return self._conn
+
+    # --- session ---
+
+    def session(self) -> dict:
+        """The interrupted session, or {} if there is none."""
+        if self._conn is None and not os.path.isfile(self.db_path):
+            return {}
+        try:
+            raw = self.get("session")
+            return json.loads(raw) if raw else {}
+        except (sqlite3.Error, ValueError):
+            return {}
+
+    def begin(self, session: dict) -> None:
+        self.finish()
+        self.set("session", json.dumps(session))
+        self.commit()
+
+    def finish(self) -> None:
+        """Session completed or abandoned: drop the journal."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._pending = 0
+        for sfx in ("", "-journal", "-wal", "-shm"):
+            try:
+                os.remove(self.db_path + sfx)
+            except OSError:
+                pass
+
+    # --- meta values ---
+
+    def get(self, key: str, default: str = "") -> str:
+        with self._lock:
+            row = self._db().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key: str, value) -> None:
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- steps ---
+
+    def done(self, kind: str, key: str) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM steps WHERE kind=? AND key=?", (kind, key)).fetchone() is not None
+
+    def mark(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._db().execute("INSERT OR IGNORE INTO steps (kind, key) VALUES (?, ?)", (kind, key))
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self.commit()
+
+    def commit(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+            self._pending = 0
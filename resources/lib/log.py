@@ -1,7 +1,13 @@
-import xbmc
-import xbmcgui
+import atexit
+import queue
+import threading
 import time
 import traceback
+from collections import OrderedDict
+
+import xbmc
+import xbmcaddon
+import xbmcgui
 
 ADDON_ID = "script.kodi.profiler"
 
@@ -9,6 +15,28 @@ ADDON_ID = "script.kodi.profiler"
 _ICON_INFO = xbmcgui.NOTIFICATION_INFO
 _ICON_WARN = xbmcgui.NOTIFICATION_WARNING
 _ICON_ERR = xbmcgui.NOTIFICATION_ERROR
+_SEVERITY = {"info": 0, "warn": 1, "error": 2}
+_ICONS = {0: _ICON_INFO, 1: _ICON_WARN, 2: _ICON_ERR}
+
+# Lines wait here for the writer thread; a full queue makes callers wait
+QUEUE_MAX = 2000
+# At most one toast this often; everything in between is merged
+NOTIFY_INTERVAL_S = 4.0
+NOTIFY_MS = 5000
+# The writer thread exits after this long with nothing to do
+IDLE_EXIT_S = 10.0
+
+
+def _min_level():
+    try:
+        debug_on = xbmcaddon.Addon(ADDON_ID).getSetting("debug_logging") == "true"
+    except Exception:
+        debug_on = False
+    return xbmc.LOGDEBUG if debug_on else xbmc.LOGINFO
+
+
+# Lines below this level are dropped before they are formatted or queued
+MIN_LEVEL = _min_level()
 
 
 def _ts():
@@ -16,29 +44,162 @@ def _ts():
     return time.strftime("%Y-%m-%d %H:%M:%S")
 
 
+class _Notifier:
+    """
+    Rate-limited toasts. Messages posted under the same key replace each
+    other (a rolling summary); free-form ones are merged as "msg (+N more)".
+    The most severe pending entry is shown first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()  # key -> [severity, text, count]
+        self._last = 0.0
+
+    def post(self, text: str, severity: int, key: str = "msg"):
+        with self._lock:
+            cur = self._pending.get(key)
+            if cur is None:
+                self._pending[key] = [severity, text, 1]
+            elif severity >= cur[0] or key != "msg":
+                cur[0], cur[1], cur[2] = max(severity, cur[0]), text, cur[2] + 1
+            else:
+                cur[2] += 1
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._pending)
+
+    def due(self) -> bool:
+        with self._lock:
+            return bool(self._pending) and time.monotonic() - self._last >= NOTIFY_INTERVAL_S
+
+    def show_next(self, force: bool = False):
+        with self._lock:
+            if not self._pending or (not force and time.monotonic() - self._last < NOTIFY_INTERVAL_S):
+                return
+            key = max(self._pending, key=lambda k: self._pending[k][0])
+            severity, text, count = self._pending.pop(key)
+            self._last = time.monotonic()
+        if key == "msg" and count > 1:
+            text = f"{text} (+{count - 1} more)"
+        try:
+            xbmcgui.Dialog().notification("Profiler", text, _ICONS[severity], NOTIFY_MS)
+        except Exception:
+            pass
+
+
+class _Writer:
+    """Background thread draining the line queue into xbmc.log and showing due toasts."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_MAX)
+        self.notifier = _Notifier()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profiler-log", daemon=True)
+                try:
+                    self._thread.start()
+                except RuntimeError:
+                    # interpreter shutting down: write inline
+                    self._thread = None
+                    self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._handle(item)
+
+    def _handle(self, item):
+        kind = item[0]
+        if kind == "line":
+            xbmc.log(item[2], item[1])
+        elif kind == "flush":
+            if item[2]:
+                self.notifier.show_next(force=True)
+            item[1].set()
+
+    def put(self, item):
+        try:
+            self.queue.put(item, timeout=2.0)
+        except queue.Full:
+            # Writer is stuck; don't lose the line
+            if item[0] == "line":
+                xbmc.log(item[2], item[1])
+        self._ensure_started()
+
+    def _run(self):
+        idle_since = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=NOTIFY_INTERVAL_S / 4)
+            except queue.Empty:
+                item = None
+                # Don't outlive the script (Kodi tears the interpreter down); put() restarts us
+                if not self.notifier.pending() and (
+                        time.monotonic() - idle_since > IDLE_EXIT_S or not threading.main_thread().is_alive()):
+                    with self._lock:
+                        if self.queue.empty():
+                            self._thread = None
+                            return
+            else:
+                idle_since = time.monotonic()
+            if item is not None:
+                self._handle(item)
+            if self.notifier.due():
+                self.notifier.show_next()
+
+    def flush(self, notify: bool = False, timeout_s: float = 5.0):
+        if self.queue.empty() and not (notify and self.notifier.pending()):
+            return
+        done = threading.Event()
+        self.put(("flush", done, notify))
+        done.wait(timeout_s)
+
+
+_WRITER = _Writer()
+
+
 def log(msg, level=xbmc.LOGINFO, notify=False, notify_level="info"):
     """
-    Central logger.
+    Central logger. Lines are written by a background thread; toasts are
+    rate-limited and merged (see notify_summary).
     - level: xbmc.LOGINFO / xbmc.LOGWARNING / xbmc.LOGERROR / xbmc.LOGDEBUG
     - notify: show Kodi notification
     - notify_level: info|warn|error (controls notification icon)
     """
-    line = f"[Profiler] {_ts()} {msg}"
-    xbmc.log(line, level)
-
+    if level < MIN_LEVEL and not notify:
+        return
+    _WRITER.put(("line", level, f"[Profiler] {_ts()} {msg}"))
     if notify:
-        icon = _ICON_INFO
-        if notify_level == "warn":
-            icon = _ICON_WARN
-        elif notify_level == "error":
-            icon = _ICON_ERR
+        _WRITER.notifier.post(str(msg), _SEVERITY.get(notify_level, 0))
 
-        xbmcgui.Dialog().notification(
-            "Profiler",
-            msg,
-            icon,
-            5000
-        )
+
+def notify_summary(key: str, text: str, notify_level: str = "info"):
+    """Update a rolling toast: later calls with the same key replace the text."""
+    _WRITER.notifier.post(text, _SEVERITY.get(notify_level, 0), key=key)
+
+
+def flush(notify: bool = True):
+    """Wait until queued lines are written; notify: show the pending toast now."""
+    _WRITER.flush(notify=notify)
+
+
+atexit.register(flush)
+
+
+def debug(msg, *args):
+    """Debug line; msg % args is only formatted when debug logging is on."""
+    if xbmc.LOGDEBUG < MIN_LEVEL:
+        return
+    log(msg % args if args else msg, xbmc.LOGDEBUG)
 
 
 def info(msg, notify=False):
@@ -56,7 +217,34 @@ def err(msg, notify=False):
 def exc(msg, notify=True):
     """
     Log exception + traceback.
-    Call inside except blocks.
+    Call inside except blocks. Flushes so the traceback is never lost.
     """
     tb = traceback.format_exc()
     log(f"{msg}\n{tb}", xbmc.LOGERROR, notify=notify, notify_level="error")
+    flush(notify=False)
+
+
+class Progress:
+    """
+    Counts for a long loop, surfaced as one rolling toast instead of one per
+    item: "Installing add-ons 12/80, 2 failed".
+    """
+
+    def __init__(self, title: str, total: int):
+        self.title = title
+        self.total = total
+        self.ok = self.skipped = self.failed = 0
+        self._key = f"progress:{id(self)}"
+
+    def text(self) -> str:
+        out = f"{self.title} {self.ok + self.skipped + self.failed}/{self.total}"
+        return out + (f", {self.failed} failed" if self.failed else "")
+
+    def _post(self):
+        notify_summary(self._key, self.text(), "warn" if self.failed else "info")
+
+    def update(self, ok: int, skipped: int = 0, failed: int = 0):
+        """Set the counts so far (done = ok + skipped + failed)."""
+        if (ok, skipped, failed) != (self.ok, self.skipped, self.failed):
+            self.ok, self.skipped, self.failed = ok, skipped, failed
+            self._post()
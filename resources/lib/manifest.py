@@ -1,4 +1,33 @@
+import glob
+import os
+import re
+import sqlite3
+
 from resources.lib.jsonrpc import JsonRpc
+from resources.lib.log import debug
+from resources.lib.paths import master
+from resources.lib.sqliteops import readonly_uri
+
+
+def _addon_origins() -> dict:
+    """
+    addon ID -> repository it was installed from. JSON-RPC doesn't expose
+    this, so read it from Kodi's add-on database (best effort, read-only).
+    """
+    dbs = glob.glob(os.path.join(master("Database"), "Addons*.db"))
+    if not dbs:
+        return {}
+    newest = max(dbs, key=lambda p: int(re.sub(r"\D", "", os.path.basename(p)) or 0))
+    try:
+        conn = sqlite3.connect(readonly_uri(newest), uri=True)
+        try:
+            rows = conn.execute("SELECT addonID, origin FROM installed").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        debug("Add-on origins unavailable (%s): %s", newest, e)
+        return {}
+    return {aid: origin or "" for aid, origin in rows}
 
 
 def build_manifest() -> dict:
@@ -8,10 +37,21 @@ def build_manifest() -> dict:
     skin = rpc.call("Settings.GetSettingValue", {"setting": "lookandfeel.skin"}).get("value", "")
 
     # Installed addon IDs
-    result = rpc.call("Addons.GetAddons", {"installed": True})
+    result = rpc.call("Addons.GetAddons", {"installed": True, "properties": ["version", "enabled"]})
     addons = result.get("addons", []) or []
     addon_ids = sorted({a.get("addonid") for a in addons if a.get("addonid")})
 
+    # Version/enabled/origin per add-on, for the minimal install plan on restore
+    origins = _addon_origins()
+    addon_info = {
+        a["addonid"]: {
+            "version": a.get("version") or "",
+            "enabled": a.get("enabled", True) is not False,
+            "origin": origins.get(a["addonid"], ""),
+        }
+        for a in addons if a.get("addonid")
+    }
+
     # Separate repos vs addons
     repo_ids = sorted([
         a for a in addon_ids
@@ -40,4 +80,6 @@ def build_manifest() -> dict:
             for rid in repo_ids
         ],
         "addons": addon_ids,
+        # kept apart from "addons", which older restores expect to be plain IDs
+        "addon_info": {aid: addon_info[aid] for aid in addon_ids},
     }
@@ -0,0 +1,194 @@
+"""
+Opt-in memory profiling: tracemalloc plus sampled RSS around each workflow
+phase, with the top allocation sites near each phase's peak.
+
+Workflows wrap their steps in `with phase("zip"):`, which does nothing
+unless a profiler was started (setting mem_profile, or bench.run
+--mem-profile). Phases are opened from one thread; work other threads do
+meanwhile is counted in the phases that are open.
+"""
+
+import contextlib
+import os
+import threading
+import time
+import tracemalloc
+
+SAMPLE_S = 0.05
+TOP_SITES = 10
+# Re-snapshot allocation sites when traced memory grows this much past the last snapshot
+SNAPSHOT_STEP = 4 * 1024 * 1024
+
+_ACTIVE = None
+
+
+def rss_bytes() -> int:
+    """Resident set size from /proc (Linux/Android); 0 where unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _site(frame) -> str:
+    path = frame.filename.replace(os.sep, "/")
+    for marker in ("/resources/lib/", "/bench/"):
+        if marker in path:
+            path = path[path.index(marker) + 1:]
+            break
+    return f"{path}:{frame.lineno}"
+
+
+def _own(snapshot):
+    """Drop the profiler's own bookkeeping from a snapshot."""
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+
+
+class MemProfiler:
+    def __init__(self, budget_mb: float = 0, top: int = TOP_SITES):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.top = top
+        self.phases = {}
+        self.rss_baseline = 0
+        self._started_tracing = False
+        self._stack = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.rss_baseline = rss_bytes()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-memprofile", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        if self._started_tracing:
+            tracemalloc.stop()
+        return self.report()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_S):
+            with self._lock:
+                if not self._stack:
+                    continue
+                rss = rss_bytes()
+                traced, _ = tracemalloc.get_traced_memory()
+                snap = None
+                for cur in self._stack:
+                    cur["rss_peak"] = max(cur["rss_peak"], rss)
+                    if traced > cur["snap_at"] + SNAPSHOT_STEP:
+                        snap = snap or tracemalloc.take_snapshot()
+                        cur["snap_at"] = traced
+                        cur["peak_snapshot"] = snap
+
+    def _traced_peak(self) -> int:
+        return tracemalloc.get_traced_memory()[1]
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Nested phases are recorded as "outer/inner"; the outer peak includes them."""
+        with self._lock:
+            if self._stack:
+                parent = self._stack[-1]
+                parent["peak_acc"] = max(parent["peak_acc"], self._traced_peak())
+                name = f"{parent['name']}/{name}"
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            traced, _ = tracemalloc.get_traced_memory()
+            rss = rss_bytes()
+            self._stack.append({
+                "name": name, "t0": time.monotonic(), "rss_start": rss, "rss_peak": rss,
+                "traced_start": traced, "peak_acc": traced, "snap_at": traced,
+                "start_snapshot": tracemalloc.take_snapshot(), "peak_snapshot": None,
+            })
+        try:
+            yield
+        finally:
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            cur = self._stack.pop()
+            peak = max(cur["peak_acc"], self._traced_peak())
+            if self._stack:
+                self._stack[-1]["peak_acc"] = max(self._stack[-1]["peak_acc"], peak)
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        snap = cur["peak_snapshot"] or tracemalloc.take_snapshot()
+        stats = _own(snap).compare_to(_own(cur["start_snapshot"]), "lineno")
+        top = [
+            {"site": _site(st.traceback[0]), "size": st.size_diff, "count": st.count_diff}
+            for st in sorted(stats, key=lambda st: st.size_diff, reverse=True)[:self.top]
+            if st.size_diff > 0
+        ]
+        name = cur["name"]
+        n = 2
+        while name in self.phases:
+            name = f"{cur['name']}#{n}"
+            n += 1
+        self.phases[name] = {
+            "seconds": round(time.monotonic() - cur["t0"], 3),
+            "traced_start": cur["traced_start"],
+            "traced_end": traced,
+            "traced_peak": peak,
+            "rss_start": cur["rss_start"],
+            "rss_end": rss,
+            "rss_peak": max(cur["rss_peak"], rss),
+            "top": top,
+        }
+
+    def over_budget(self) -> list:
+        """Phases whose peak (RSS where readable, else traced) exceeded the budget."""
+        if not self.budget:
+            return []
+        return [name for name, p in self.phases.items() if (p["rss_peak"] or p["traced_peak"]) > self.budget]
+
+    def report(self) -> dict:
+        return {
+            "budget_bytes": self.budget,
+            "rss_baseline": self.rss_baseline,
+            "phases": self.phases,
+            "over_budget": self.over_budget(),
+        }
+
+
+def start(budget_mb: float = 0, top: int = TOP_SITES) -> MemProfiler:
+    global _ACTIVE
+    _ACTIVE = MemProfiler(budget_mb, top).start()
+    return _ACTIVE
+
+
+def stop() -> dict:
+    """Stop the active profiler and return its report ({} if none was running)."""
+    global _ACTIVE
+    prof, _ACTIVE = _ACTIVE, None
+    return prof.stop() if prof else {}
+
+
+def phase(name: str):
+    return _ACTIVE.phase(name) if _ACTIVE else contextlib.nullcontext()
+
+
+def format_report(report: dict) -> str:
+    mb = lambda n: f"{n / 1048576:.1f}"
+    phases = report.get("phases", {})
+    w = max([len(n) for n in phases] + [5])
+    lines = [f"{'phase':{w}s} {'seconds':>8s} {'traced pk':>9s} {'rss pk':>8s}  (MB)"]
+    for name, p in phases.items():
+        flag = "  OVER BUDGET" if name in report.get("over_budget", []) else ""
+        lines.append(f"{name:{w}s} {p['seconds']:8.2f} {mb(p['traced_peak']):>9s} {mb(p['rss_peak']):>8s}{flag}")
+        for t in p["top"][:3]:
+            lines.append(f"    {t['size'] / 1024:9.1f} KB  {t['site']}")
+    return "\n".join(lines)
@@ -0,0 +1,72 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+from resources.lib.paths import home
+
+# "<addon id>-<version>.zip"; the version is the first "-<digit>..." suffix
+_PKG_RE = re.compile(r"^(?P<id>.+?)-(?P<ver>\d[^/]*)\.zip$", re.IGNORECASE)
+
+# pkg_dir -> (dir mtime_ns, PackagesIndex)
+_CACHE: Dict[str, Tuple[int, "PackagesIndex"]] = {}
+
+
+def version_key(ver: str) -> tuple:
+    # numeric parts compare as ints, text parts (beta, rc) sort below numbers
+    return tuple((1, int(p), "") if p.isdigit() else (0, 0, p.lower()) for p in re.findall(r"\d+|[A-Za-z]+", ver))
+
+
+class PackagesIndex:
+    """
+    One scandir pass over special://home/addons/packages, mapping add-on ID to
+    its cached zips sorted newest first (parsed version, then mtime).
+    """
+
+    def __init__(self, pkg_dir: str):
+        self.pkg_dir = pkg_dir
+        self._by_id: Dict[str, List[dict]] = {}
+
+        try:
+            it = os.scandir(pkg_dir)
+        except OSError:
+            return
+
+        with it:
+            for e in it:
+                m = _PKG_RE.match(e.name)
+                if not m or not e.is_file():
+                    continue
+                try:
+                    mtime = e.stat().st_mtime
+                except OSError:
+                    continue
+                self._by_id.setdefault(m.group("id"), []).append(
+                    {"version": m.group("ver"), "mtime": mtime, "path": e.path}
+                )
+
+        for items in self._by_id.values():
+            items.sort(key=lambda x: (version_key(x["version"]), x["mtime"]), reverse=True)
+
+    def versions(self, addon_id: str) -> List[dict]:
+        return list(self._by_id.get(addon_id, []))
+
+    def latest(self, addon_id: str) -> str:
+        items = self._by_id.get(addon_id)
+        return items[0]["path"] if items else ""
+
+
+def get_packages_index(pkg_dir: str = "") -> PackagesIndex:
+    """Cached PackagesIndex, rebuilt only when the packages folder mtime changes."""
+    pkg_dir = pkg_dir or home("addons/packages")
+    try:
+        mtime_ns = os.stat(pkg_dir).st_mtime_ns
+    except OSError:
+        mtime_ns = -1
+
+    cached = _CACHE.get(pkg_dir)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+
+    index = PackagesIndex(pkg_dir)
+    _CACHE[pkg_dir] = (mtime_ns, index)
+    return index
@@ -13,7 +13,19 @@ def profile(path: str) -> str:
         path = "/" + path
     return tr("special://profile" + path)
 
+def master(path: str = "") -> str:
+    # The master profile's userdata; other profiles live under it (profiles/<name>)
+    if path and not path.startswith("/"):
+        path = "/" + path
+    return tr("special://masterprofile" + path)
+
 def temp(path: str) -> str:
     if not path.startswith("/"):
         path = "/" + path
     return tr("special://temp" + path)
+
+def addon_profile(path: str = "") -> str:
+    # This add-on's own addon_data folder (indexes, caches, local backups)
+    if path and not path.startswith("/"):
+        path = "/" + path
+    return profile("addon_data/script.kodi.profiler" + path)
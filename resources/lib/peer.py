@@ -0,0 +1,300 @@
+"""
+LAN peer mirror: one device serves its local backups over HTTP so others
+restore at LAN speed instead of pulling the archive from B2 again.
+
+    GET /backups                 JSON list of {name, size, mtime}
+    GET|HEAD /backups/<name>     the zip, with Range support
+
+Every request needs the shared token (X-Profiler-Token header). Both sides
+refuse addresses outside the local network, so the token never leaves it.
+Connections are HTTP/1.1 keep-alive; served bytes are charged to the
+network throttle like any other transfer.
+"""
+
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from resources.lib import throttle
+from resources.lib.log import debug, info, warn
+from resources.lib.paths import profile
+
+DEFAULT_PORT = 8770
+TOKEN_HEADER = "X-Profiler-Token"
+# Idle keep-alive connections are dropped after this long
+IDLE_TIMEOUT_S = 30
+TIMEOUT_S = 30
+# A dropped download resumes from where it stopped this many times
+RETRIES = 3
+
+
+def backups_dir() -> str:
+    return profile("addon_data/script.kodi.profiler/backups")
+
+
+def is_local_address(host: str) -> bool:
+    """True for private, loopback and link-local addresses (host may be a name)."""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    for ai in infos:
+        addr = ipaddress.ip_address(ai[4][0].split("%")[0])
+        if not (addr.is_private or addr.is_loopback or addr.is_link_local):
+            return False
+    return bool(infos)
+
+
+def _list_backups(root: str) -> list:
+    out = []
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return out
+    for name in sorted(names):
+        path = os.path.join(root, name)
+        if name.endswith(".zip") and os.path.isfile(path):
+            st = os.stat(path)
+            out.append({"name": name, "size": st.st_size, "mtime": int(st.st_mtime)})
+    return out
+
+
+def _parse_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=a-b" range; None if absent/unsatisfiable."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    a, _, b = header[6:].strip().partition("-")
+    try:
+        if a:
+            start, end = int(a), int(b) if b else size - 1
+        else:
+            start, end = size - int(b), size - 1
+    except ValueError:
+        return None
+    if start < 0 or start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "ProfilerPeer/1"
+    timeout = IDLE_TIMEOUT_S
+
+    def log_message(self, fmt, *args):
+        debug("[Peer] %s %s", self.client_address[0], fmt % args)
+
+    def _reply(self, code: int, body: bytes = b"", ctype: str = "text/plain; charset=utf-8", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _allowed(self) -> bool:
+        if not is_local_address(self.client_address[0]):
+            self._reply(403, b"LAN only\n")
+            return False
+        token = self.headers.get(TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode("utf-8"), self.server.token.encode("utf-8")):
+            self._reply(401, b"bad token\n")
+            return False
+        return True
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path == "/backups":
+            body = json.dumps(_list_backups(self.server.root)).encode("utf-8")
+            return self._reply(200, body, "application/json")
+        if path.startswith("/backups/"):
+            return self._send_file(path[len("/backups/"):])
+        self._reply(404, b"not found\n")
+
+    def _send_file(self, name: str):
+        full = os.path.join(self.server.root, name)
+        if os.path.basename(name) != name or not name.endswith(".zip") or not os.path.isfile(full):
+            return self._reply(404, b"no such backup\n")
+
+        with open(full, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            rng = _parse_range(self.headers.get("Range", ""), size)
+            if self.headers.get("Range") and rng is None:
+                return self._reply(416, headers={"Content-Range": f"bytes */{size}"})
+            start, end = rng or (0, size - 1)
+            length = max(0, end - start + 1)
+
+            self.send_response(206 if rng else 200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if rng:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+
+            f.seek(start)
+            left = length
+            while left > 0:
+                buf = f.read(min(throttle.CHUNK, left))
+                if not buf:
+                    break
+                throttle.net(len(buf))
+                self.wfile.write(buf)
+                left -= len(buf)
+
+
+class PeerServer:
+    def __init__(self, token: str, port: int = DEFAULT_PORT, root: str = "", host: str = "0.0.0.0"):
+        if not token:
+            raise RuntimeError("LAN peer sharing needs a shared token (set it in Profiler settings)")
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.token = token
+        self._httpd.root = root or backups_dir()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self) -> "PeerServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="profiler-peer", daemon=True)
+        self._thread.start()
+        info(f"[Peer] serving {self._httpd.root} on port {self.port}")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        info("[Peer] stopped")
+
+
+def start_from_settings(addon):
+    """Start the server if peer_serve is on; None when off or misconfigured."""
+    if addon.getSetting("peer_serve") != "true":
+        return None
+    try:
+        port = int(addon.getSetting("peer_port") or DEFAULT_PORT)
+        return PeerServer(addon.getSetting("peer_token").strip(), port).start()
+    except (RuntimeError, OSError) as e:
+        warn(f"[Peer] not serving: {e}", notify=True)
+        return None
+
+
+class PeerClient:
+    """
+    Reads backups from another device's PeerServer. download_to_file matches
+    B2Client's, so download_backup() and b2_base_finder() work with either.
+    """
+
+    def __init__(self, address: str, token: str, timeout: float = TIMEOUT_S):
+        parts = urllib.parse.urlsplit(address if "//" in address else f"http://{address}")
+        self.host = parts.hostname or ""
+        self.port = parts.port or DEFAULT_PORT
+        if not self.host:
+            raise RuntimeError(f"Invalid peer address: {address}")
+        if not is_local_address(self.host):
+            raise RuntimeError(f"{self.host} is not a local network address")
+        self.token = token
+        self.timeout = timeout
+        self._conn = None
+
+    def _request(self, path: str, headers=None, ok=(200, 206)):
+        """GET on the kept-alive connection (reconnects once if the peer closed it)."""
+        hdrs = {TOKEN_HEADER: self.token, **(headers or {})}
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("GET", urllib.parse.quote(path), headers=hdrs)
+                resp = self._conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if resp.status in ok:
+                return resp
+            body = resp.read().decode("utf-8", errors="replace").strip()
+            if resp.status == 401:
+                raise RuntimeError("The peer rejected the token")
+            raise RuntimeError(f"Peer HTTP {resp.status} on {path}: {body}")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def list_backups(self) -> list:
+        try:
+            return json.loads(self._request("/backups").read().decode("utf-8"))
+        except (http.client.HTTPException, OSError) as e:
+            raise RuntimeError(f"Peer {self.host}:{self.port} unreachable: {e}")
+
+    def download_to_file(self, _bucket_name: str, file_name: str, dst_path: str, start: int = 0,
+                         chunk_size: int = 8 * 1024 * 1024, on_chunk=None) -> int:
+        """
+        One streamed Range request from `start` (resumed after a dropped
+        connection). on_chunk(offset, total, sha1) runs every chunk_size
+        bytes and at the end; sha1 is always "".
+        """
+        mode = "r+b" if start and os.path.isfile(dst_path) else "wb"
+        if mode == "wb":
+            start = 0
+
+        offset = start
+        total = None
+        with open(dst_path, mode) as f:
+            f.truncate(start)
+            f.seek(start)
+            for attempt in range(RETRIES + 1):
+                try:
+                    resp = self._request(f"/backups/{file_name}", {"Range": f"bytes={offset}-"}, ok=(200, 206, 416))
+                    if resp.status == 200:
+                        if offset:
+                            raise RuntimeError("Peer ignored the Range header")
+                        total = int(resp.getheader("Content-Length") or 0)
+                    else:
+                        # "bytes a-b/size", or "bytes */size" when offset is already the end
+                        total = int(resp.getheader("Content-Range", "/").rsplit("/", 1)[-1] or 0)
+                    mark = offset
+                    while True:
+                        buf = resp.read(throttle.CHUNK)
+                        if not buf:
+                            break
+                        throttle.net(len(buf))
+                        f.write(buf)
+                        offset += len(buf)
+                        if on_chunk and offset - mark >= chunk_size:
+                            f.flush()
+                            mark = offset
+                            on_chunk(offset, total, "")
+                    if offset >= total:
+                        break
+                    raise http.client.IncompleteRead(b"", total - offset)
+                except (http.client.HTTPException, OSError) as e:
+                    self.close()
+                    if attempt == RETRIES:
+                        raise RuntimeError(f"Download of {file_name} from peer failed: {e}")
+                    warn(f"Peer download dropped at {offset} bytes ({e}); resuming")
+            f.flush()
+        if total is not None and offset != total:
+            raise RuntimeError(f"Peer sent {offset} of {total} bytes of {file_name}")
+        if on_chunk:
+            on_chunk(offset, total, "")
+        return offset
@@ -0,0 +1,109 @@
+"""
+Kodi's additional profiles (profiles.xml, userdata/profiles/<name>) for
+multi-profile backups.
+
+In an archive the master profile stays at userdata/ and every other profile
+sits at userdata/<its directory>, e.g. userdata/profiles/Kids/, mirroring the
+real layout under special://masterprofile. Add-ons themselves are shared by
+all profiles, so the manifest and repo bundles are stored once.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+from resources.lib.log import warn
+from resources.lib.paths import master
+
+PROFILES_XML = "profiles.xml"
+# Where Kodi creates profile directories, relative to the master profile
+PROFILES_DIR = "profiles"
+_MASTER_PREFIX = "special://masterprofile"
+
+
+def _profile_dir(directory: str):
+    """profiles.xml <directory> -> "" (master), "profiles/<name>", or None if outside userdata/profiles."""
+    d = (directory or "").strip().replace("\\", "/")
+    if d.startswith(_MASTER_PREFIX):
+        d = d[len(_MASTER_PREFIX):]
+    d = d.strip("/")
+    if not d:
+        return ""
+    parts = d.split("/")
+    if len(parts) != 2 or parts[0] != PROFILES_DIR or parts[1] in ("", ".", ".."):
+        return None
+    return d
+
+
+def parse_profiles_xml(path: str) -> list:
+    """[{"name", "dir"}] in profiles.xml order; the master profile has dir ""."""
+    out = []
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return out
+    for node in root.findall("profile"):
+        name = (node.findtext("name") or "").strip()
+        d = _profile_dir(node.findtext("directory") or "")
+        if d is None:
+            warn(f"Profile {name!r} lives outside userdata/profiles; not included")
+            continue
+        out.append({"name": name or d or "Master user", "dir": d})
+    return out
+
+
+def list_profiles() -> list:
+    """This device's profiles, master first; just the master when there is no profiles.xml."""
+    found = parse_profiles_xml(master(PROFILES_XML))
+    if not any(p["dir"] == "" for p in found):
+        found.insert(0, {"name": "Master user", "dir": ""})
+    return sorted(found, key=lambda p: p["dir"] != "")
+
+
+def arc_root(profile_dir: str) -> str:
+    return f"userdata/{profile_dir}" if profile_dir else "userdata"
+
+
+def profile_of(arcname: str):
+    """"profiles/<name>" for members of an additional profile (deltas too), else None."""
+    name = arcname[len("deltas/"):] if arcname.startswith("deltas/") else arcname
+    prefix = f"userdata/{PROFILES_DIR}/"
+    if not name.startswith(prefix):
+        return None
+    first = name[len(prefix):].split("/", 1)
+    return f"{PROFILES_DIR}/{first[0]}" if len(first) == 2 else None
+
+
+def merge_profiles_xml(src: str, dst: str, dirs) -> int:
+    """
+    Add the <profile> entries of src whose directory is in dirs to dst (or
+    write dst from src, keeping only those, when dst doesn't exist).
+    Entries dst already has are left alone. Returns how many were added.
+    """
+    src_root = ET.parse(src).getroot()
+    wanted = [n for n in src_root.findall("profile") if _profile_dir(n.findtext("directory") or "") in set(dirs)]
+
+    if os.path.isfile(dst):
+        tree = ET.parse(dst)
+        root = tree.getroot()
+    else:
+        root = ET.Element(src_root.tag, src_root.attrib)
+        for child in src_root:
+            if child.tag != "profile":
+                root.append(child)
+        master_node = next((n for n in src_root.findall("profile")
+                            if _profile_dir(n.findtext("directory") or "") == ""), None)
+        if master_node is not None:
+            root.append(master_node)
+        tree = ET.ElementTree(root)
+
+    have = {_profile_dir(n.findtext("directory") or "") for n in root.findall("profile")}
+    added = 0
+    for node in wanted:
+        d = _profile_dir(node.findtext("directory") or "")
+        if d and d not in have:
+            root.append(node)
+            have.add(d)
+            added += 1
+    if added or not os.path.isfile(dst):
+        tree.write(dst, encoding="UTF-8", xml_declaration=True)
+    return added
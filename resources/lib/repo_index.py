@@ -0,0 +1,160 @@
+"""
+Cached index of what the installed repositories offer, read from each
+repo's addons.xml(.gz) (the <info>/<datadir> URLs in its addon.xml).
+
+Lets the installer fail an add-on no repository provides straight away
+instead of after the install timeout. Indexes are kept in the add-on's
+cache and revalidated with ETag/Last-Modified, so a later restore usually
+costs one 304 per repo. A repo whose index can't be fetched (and was never
+cached) makes the answer "unknown" rather than "missing".
+"""
+
+import gzip
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from resources.lib import throttle
+from resources.lib.install_plan import version_key
+from resources.lib.log import debug, info, warn
+from resources.lib.paths import addon_profile, home, tr
+
+CACHE_FILE = "cache/repo_index.json"
+TIMEOUT_S = 15
+WORKERS = 4
+
+
+def repo_sources(repo_id: str) -> list:
+    """[{"info", "datadir", "zip"}] from the repo's addon.xml; [] if it isn't a readable repo."""
+    for base in (home(f"addons/{repo_id}"), tr(f"special://xbmc/addons/{repo_id}")):
+        path = os.path.join(base, "addon.xml")
+        if os.path.isfile(path):
+            break
+    else:
+        return []
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError) as e:
+        warn(f"Unreadable addon.xml for {repo_id}: {e}")
+        return []
+
+    out = []
+    for ext in root.findall("extension"):
+        if ext.get("point") != "xbmc.addon.repository":
+            continue
+        # Kodi 19+ wraps each source in <dir>; older repos put the tags on <extension>
+        for d in ext.findall("dir") or [ext]:
+            node = d.find("info")
+            url = (node.text or "").strip() if node is not None else ""
+            if not url:
+                continue
+            if node.get("compressed") == "true" and not url.endswith(".gz"):
+                url += ".gz"
+            data = d.find("datadir")
+            out.append({
+                "info": url,
+                "datadir": (data.text or "").strip().rstrip("/") if data is not None else "",
+                "zip": data is None or data.get("zip") == "true",
+            })
+    return out
+
+
+def _parse_addons_xml(raw: bytes) -> dict:
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    root = ET.fromstring(raw)
+    return {a.get("id"): a.get("version") or "" for a in root.findall("addon") if a.get("id")}
+
+
+class RepoIndex:
+    """Add-on ID -> best {"version", "zip", "repo"} over the given repos."""
+
+    def __init__(self, cache_path: str = ""):
+        self.cache_path = cache_path or addon_profile(CACHE_FILE)
+        self._cache = {}
+        self._provides = {}
+        self.unknown = []
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self._cache = json.load(f).get("sources") or {}
+        except (OSError, ValueError):
+            self._cache = {}
+
+    def _fetch(self, src: dict):
+        """Cache entry for one source, revalidated; None when unreachable and never cached."""
+        url = src["info"]
+        cached = self._cache.get(url)
+        headers = {"User-Agent": "Kodi-Profiler"}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            req = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(req, timeout=TIMEOUT_S) as resp:
+                raw = throttle.read_response(resp)
+                etag, modified = resp.headers.get("ETag", ""), resp.headers.get("Last-Modified", "")
+            addons = _parse_addons_xml(raw)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                debug("Repo index unchanged: %s", url)
+                return {**cached, "checked": int(time.time())}
+            warn(f"Repo index {url}: HTTP {e.code}")
+            return cached
+        except (OSError, ValueError, ET.ParseError) as e:
+            warn(f"Repo index {url} unavailable ({e}){'; using cached copy' if cached else ''}")
+            return cached
+        info(f"Repo index {url}: {len(addons)} add-on(s)")
+        return {"etag": etag, "last_modified": modified, "checked": int(time.time()),
+                "datadir": src["datadir"], "zip": src["zip"], "addons": addons}
+
+    def refresh(self, repo_ids) -> "RepoIndex":
+        """Revalidate the indexes of repo_ids (in parallel) and rebuild the lookup."""
+        sources = []
+        self.unknown = []
+        for rid in sorted(set(repo_ids)):
+            found = repo_sources(rid)
+            if not found:
+                self.unknown.append(rid)
+            sources.extend((rid, src) for src in found)
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            entries = list(pool.map(lambda rs: self._fetch(rs[1]), sources))
+
+        self._provides = {}
+        for (rid, src), entry in zip(sources, entries):
+            if entry is None:
+                if rid not in self.unknown:
+                    self.unknown.append(rid)
+                continue
+            self._cache[src["info"]] = entry
+            for aid, ver in entry["addons"].items():
+                best = self._provides.get(aid)
+                if best is None or version_key(ver) > version_key(best["version"]):
+                    zip_url = f"{entry['datadir']}/{aid}/{aid}-{ver}.zip" if entry["datadir"] and entry["zip"] else ""
+                    self._provides[aid] = {"version": ver, "zip": zip_url, "repo": rid}
+        if self.unknown:
+            info(f"Repo index unknown for: {', '.join(self.unknown)}")
+        self._save()
+        return self
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp = self.cache_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"schema": 1, "sources": self._cache}, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            warn(f"Could not save repo index cache: {e}")
+
+    @property
+    def complete(self) -> bool:
+        """Every repo's index is known, so a missing ID really is missing."""
+        return bool(self._provides) and not self.unknown
+
+    def lookup(self, addon_id: str):
+        return self._provides.get(addon_id)
@@ -0,0 +1,291 @@
+"""
+Retention: expire old local zips and remote B2 file versions by a
+keep-last / daily / weekly / monthly policy, and sweep stale temp trees
+(staging, out, restore_staging, incoming).
+
+Every run first builds a plan; dry_run just reports it (with the bytes that
+would be reclaimed). Delta bases of kept backups are never expired.
+"""
+
+import os
+import shutil
+import time
+import zipfile
+
+from resources.lib.paths import temp, addon_profile
+from resources.lib.b2 import B2Client
+from resources.lib.delta import read_zip_manifest
+from resources.lib.fileindex import FileIndex
+from resources.lib.journal import RestoreJournal
+from resources.lib.catalog import CATALOG_NAME, load_catalog
+from resources.lib.log import info, warn
+
+# Remote deletes are issued (and logged) this many at a time
+DELETE_BATCH = 50
+
+# Old versions of catalog.json.gz are only history; keep a few
+CATALOG_VERSIONS_KEPT = 3
+
+BUCKETS = (("keep_daily", "%Y-%m-%d"), ("keep_weekly", "%G-W%V"), ("keep_monthly", "%Y-%m"))
+
+
+def policy_from_settings(addon) -> dict:
+    def n(key, default):
+        try:
+            return max(0, int(addon.getSetting(key) or default))
+        except ValueError:
+            return default
+    return {
+        "keep_last": max(1, n("keep_last", 5)),
+        "keep_daily": n("keep_daily", 7),
+        "keep_weekly": n("keep_weekly", 4),
+        "keep_monthly": n("keep_monthly", 6),
+        "temp_max_age_h": n("temp_max_age_h", 24),
+    }
+
+
+def select_keep(items, policy: dict) -> set:
+    """
+    Indexes of items to keep. items: dicts with "date" (epoch seconds).
+    The newest keep_last are kept, plus the newest item of each of the last
+    keep_daily days, keep_weekly ISO weeks and keep_monthly months.
+    """
+    order = sorted(range(len(items)), key=lambda i: items[i]["date"], reverse=True)
+    keep = set(order[:max(1, policy.get("keep_last", 1))])
+    for key, fmt in BUCKETS:
+        count = policy.get(key, 0)
+        seen = set()
+        for i in order:
+            if len(seen) >= count:
+                break
+            bucket = time.strftime(fmt, time.localtime(items[i]["date"]))
+            if bucket not in seen:
+                seen.add(bucket)
+                keep.add(i)
+    return keep
+
+
+def _tree_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fn))
+            except OSError:
+                pass
+    return total
+
+
+def _delta_base_of(zip_path: str) -> str:
+    try:
+        with zipfile.ZipFile(zip_path, "r") as z:
+            return (read_zip_manifest(z).get("deltas") or {}).get("base", "")
+    except (zipfile.BadZipFile, OSError):
+        return ""
+
+
+# --- planning ---
+
+def plan_local(policy: dict, backup_dir: str = "") -> list:
+    backup_dir = backup_dir or addon_profile("backups")
+    if not os.path.isdir(backup_dir):
+        return []
+    items = []
+    for e in os.scandir(backup_dir):
+        if e.is_file() and e.name.lower().endswith(".zip"):
+            st = e.stat()
+            items.append({"name": e.name, "path": e.path, "date": st.st_mtime, "size": st.st_size})
+
+    keep = {items[i]["name"] for i in select_keep(items, policy)} if items else set()
+    by_name = {it["name"]: it for it in items}
+
+    # Kept deltas need their base (and its base...)
+    todo = list(keep)
+    while todo:
+        base = _delta_base_of(by_name[todo.pop()]["path"])
+        if base in by_name and base not in keep:
+            keep.add(base)
+            todo.append(base)
+
+    return [
+        {"kind": "local", "name": it["name"], "path": it["path"], "size": it["size"]}
+        for it in items if it["name"] not in keep
+    ]
+
+
+def _list_versions(b2, bucket_id: str, prefix: str) -> list:
+    out, start_name, start_id = [], "", ""
+    while True:
+        page = b2.list_file_versions(bucket_id, start_file_name=start_name, start_file_id=start_id,
+                                     max_count=1000, prefix=prefix)
+        out.extend(f for f in page.get("files", []) if f.get("action") == "upload")
+        start_name, start_id = page.get("nextFileName"), page.get("nextFileId")
+        if not start_name:
+            return out
+
+
+def plan_remote(b2, bucket_id: str, prefix: str, policy: dict) -> list:
+    """
+    Every uploaded version of every zip is a snapshot for the policy. If the
+    newest version of a name expires, all its versions go (so an older one
+    can't silently reappear in the restore picker).
+
+    Delta bases are found through the catalog; when it can't be read, or a
+    kept backup has no entry in it, no remote backup is expired at all.
+    """
+    prefix = (prefix or "").strip("/")
+    versions = _list_versions(b2, bucket_id, prefix + "/" if prefix else "")
+
+    # Keep the base of every kept delta backup (restore fetches the base by name)
+    try:
+        catalog = load_catalog(b2, bucket_id, prefix)
+    except Exception as e:
+        warn(f"Retention: catalog unavailable ({e}); delta bases unknown, not expiring cloud backups", notify=True)
+        return []
+
+    actions = []
+    catalog_versions = [v for v in versions if v["fileName"].endswith(CATALOG_NAME)]
+    for v in catalog_versions[CATALOG_VERSIONS_KEPT:]:
+        actions.append({"kind": "remote", "name": v["fileName"], "file_id": v["fileId"],
+                        "size": int(v.get("contentLength") or 0)})
+
+    zips = [dict(v, date=int(v.get("uploadTimestamp") or 0) / 1000.0)
+            for v in versions if v["fileName"].endswith(".zip")]
+    if not zips:
+        return actions
+
+    keep = {zips[i]["fileId"] for i in select_keep(zips, policy)}
+
+    latest = {}
+    for v in zips:
+        latest.setdefault(v["fileName"], v)  # newest first per name
+
+    dir_prefix = prefix + "/" if prefix else ""
+    todo = [n for n, v in latest.items() if v["fileId"] in keep]
+    uncatalogued = [n for n in todo if n not in catalog]
+    if uncatalogued:
+        warn(f"Retention: {len(uncatalogued)} kept cloud backup(s) missing from the catalog "
+             f"(e.g. {uncatalogued[0]}); delta bases unknown, not expiring cloud backups", notify=True)
+        return actions
+    while todo:
+        base = (catalog.get(todo.pop()) or {}).get("delta_base", "")
+        base_name = dir_prefix + base if base else ""
+        if base_name in latest and latest[base_name]["fileId"] not in keep:
+            keep.add(latest[base_name]["fileId"])
+            todo.append(base_name)
+
+    for v in zips:
+        name_expired = latest[v["fileName"]]["fileId"] not in keep
+        if name_expired or v["fileId"] not in keep:
+            actions.append({"kind": "remote", "name": v["fileName"], "file_id": v["fileId"],
+                            "size": int(v.get("contentLength") or 0)})
+    return actions
+
+
+def plan_temp(max_age_h: int, delta_base: str = "") -> list:
+    """Stale temp trees. Anything an interrupted restore or the next incremental backup needs is left alone."""
+    cutoff = time.time() - max_age_h * 3600
+    restoring = bool(RestoreJournal().session())
+
+    index = FileIndex(addon_profile("cache/fileindex.db"))
+    try:
+        prev_archive = index.previous_archive()
+    finally:
+        index.close()
+    base_zip = delta_base if delta_base.lower().endswith(".zip") else f"{delta_base}.zip"
+
+    candidates = []
+    for sub in ("staging", "out"):
+        root = temp(f"profiler/{sub}")
+        if os.path.isdir(root):
+            candidates += [e.path for e in os.scandir(root)]
+    if not restoring:
+        candidates += [temp("profiler/restore_staging"), temp("profiler/incoming")]
+
+    actions = []
+    for path in candidates:
+        if not os.path.exists(path) or path == prev_archive:
+            continue
+        if delta_base and os.path.basename(path) == base_zip:
+            continue
+        if os.path.getmtime(path) > cutoff:
+            continue
+        actions.append({"kind": "temp", "name": path, "path": path, "size": _tree_size(path)})
+    return actions
+
+
+# --- running ---
+
+def run_gc(policy: dict, dry_run: bool = True, b2=None, bucket_id: str = "", prefix: str = "",
+           delta_base: str = "") -> dict:
+    """
+    Plan and (unless dry_run) apply retention. b2/bucket_id enable the remote
+    part. Returns {"actions", "bytes", "deleted", "failed", "dry_run"}.
+    """
+    actions = plan_local(policy) + plan_temp(policy.get("temp_max_age_h", 24), delta_base)
+    if b2 is not None and bucket_id:
+        actions += plan_remote(b2, bucket_id, prefix, policy)
+
+    report = {"actions": actions, "bytes": sum(a["size"] for a in actions),
+              "deleted": 0, "failed": 0, "dry_run": dry_run}
+    if dry_run:
+        return report
+
+    remote = [a for a in actions if a["kind"] == "remote"]
+    for a in actions:
+        if a["kind"] == "remote":
+            continue
+        try:
+            if os.path.isdir(a["path"]):
+                shutil.rmtree(a["path"])
+            else:
+                os.remove(a["path"])
+            report["deleted"] += 1
+        except OSError as e:
+            report["failed"] += 1
+            warn(f"Retention: could not delete {a['path']} ({e})")
+
+    for i in range(0, len(remote), DELETE_BATCH):
+        for a in remote[i:i + DELETE_BATCH]:
+            try:
+                b2.delete_file_version(a["name"], a["file_id"])
+                report["deleted"] += 1
+            except Exception as e:
+                report["failed"] += 1
+                warn(f"Retention: could not delete b2:{a['name']} ({e})")
+        info(f"Retention: remote deletes {min(i + DELETE_BATCH, len(remote))}/{len(remote)}")
+
+    info(f"Retention: deleted {report['deleted']}, failed {report['failed']}, reclaimed ~{report['bytes']} bytes")
+    return report
+
+
+def format_report(report: dict) -> str:
+    verb = "Would delete" if report["dry_run"] else "Deleted"
+    lines = [f"{verb} {len(report['actions'])} item(s), {report['bytes'] / 1048576:.1f} MB", ""]
+    for kind, title in (("local", "Local backups"), ("remote", "Cloud (B2) versions"), ("temp", "Temp files")):
+        rows = [a for a in report["actions"] if a["kind"] == kind]
+        if rows:
+            lines.append(f"{title} ({len(rows)}):")
+            lines += [f"  {a['name']}  ({a['size'] / 1048576:.1f} MB)" for a in rows]
+            lines.append("")
+    if not report["dry_run"] and report["failed"]:
+        lines.append(f"Failed: {report['failed']} (see log)")
+    return "\n".join(lines)
+
+
+def run_after_backup(addon, b2=None) -> None:
+    """Post-backup hook: apply the policy if automatic cleanup is enabled. Never raises."""
+    if addon.getSetting("retention_auto") != "true":
+        return
+    try:
+        bucket_id = addon.getSetting("b2_bucket_id").strip() if addon.getSetting("retention_remote") == "true" else ""
+        if bucket_id and b2 is None:
+            b2 = B2Client(addon.getSetting("b2_key_id").strip(), addon.getSetting("b2_app_key").strip(),
+                          api_base=addon.getSetting("b2_api_url").strip())
+            b2.authorize()
+        run_gc(policy_from_settings(addon), dry_run=False, b2=b2, bucket_id=bucket_id,
+               prefix=addon.getSetting("b2_prefix").strip(), delta_base=addon.getSetting("delta_base").strip())
+    except Exception as e:
+        warn(f"Retention after backup failed: {e}")
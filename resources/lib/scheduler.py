@@ -0,0 +1,95 @@
+import threading
+from typing import Callable, Iterable, List
+
+from resources.lib.log import info, exc
+from resources.lib.jobs import Cancelled
+
+
+class Stage:
+    """
+    One node of a restore DAG.
+    - deps: names of stages that must finish first
+    - background: run on a worker thread instead of the calling (UI) thread
+    """
+
+    def __init__(self, name: str, fn: Callable[[], None], deps: Iterable[str] = (), background: bool = False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.background = background
+
+
+def _toposort(stages: List[Stage]) -> List[Stage]:
+    by_name = {s.name: s for s in stages}
+    for s in stages:
+        for d in s.deps:
+            if d not in by_name:
+                raise RuntimeError(f"Stage {s.name} depends on unknown stage {d}")
+
+    ordered, state = [], {}
+
+    def visit(s: Stage):
+        if state.get(s.name) == "done":
+            return
+        if state.get(s.name) == "visiting":
+            raise RuntimeError(f"Stage dependency cycle at {s.name}")
+        state[s.name] = "visiting"
+        for d in s.deps:
+            visit(by_name[d])
+        state[s.name] = "done"
+        ordered.append(s)
+
+    for s in stages:
+        visit(s)
+    return ordered
+
+
+def run_stages(stages: List[Stage]) -> None:
+    """
+    Run stages as soon as their dependencies are done. Background stages
+    run concurrently on worker threads; foreground stages run in dependency
+    order on the calling thread. That is usually a job's worker thread
+    (jobs.run_with_progress), so stages must not open dialogs: ask first.
+    A failed stage skips everything that depends on it; the first error
+    (in dependency order) is re-raised once all threads have finished.
+    """
+    ordered = _toposort(stages)
+    finished = {s.name: threading.Event() for s in ordered}
+    errors = {}
+
+    def runner(stage: Stage):
+        try:
+            for d in stage.deps:
+                finished[d].wait()
+                if d in errors:
+                    raise RuntimeError(f"skipped: {d} failed")
+            info(f"[Pipeline] start {stage.name}")
+            stage.fn()
+            info(f"[Pipeline] done {stage.name}")
+        except Cancelled as e:
+            info(f"[Pipeline] stage {stage.name} cancelled")
+            errors[stage.name] = e
+        except Exception as e:
+            if not str(e).startswith("skipped:"):
+                exc(f"[Pipeline] stage {stage.name} failed: {e}", notify=False)
+            errors[stage.name] = e
+        finally:
+            finished[stage.name].set()
+
+    threads = []
+    for s in ordered:
+        if s.background:
+            t = threading.Thread(target=runner, args=(s,), name=f"profiler-{s.name}", daemon=True)
+            t.start()
+            threads.append(t)
+
+    for s in ordered:
+        if not s.background:
+            runner(s)
+
+    for t in threads:
+        t.join()
+
+    for s in ordered:
+        if s.name in errors and not str(errors[s.name]).startswith("skipped:"):
+            raise errors[s.name]
@@ -7,27 +7,103 @@ import xbmcgui
 
 ADDON = xbmcaddon.Addon()
 
-# Ensure this add-on's lib folder is on sys.path
-LIB_PATH = os.path.join(ADDON.getAddonInfo("path"), "resources", "lib")
-if LIB_PATH not in sys.path:
-    sys.path.insert(0, LIB_PATH)
+# Ensure this add-on's lib folder (and root, for resources.lib.*) is on sys.path
+ADDON_PATH = ADDON.getAddonInfo("path")
+LIB_PATH = os.path.join(ADDON_PATH, "resources", "lib")
+for p in (LIB_PATH, ADDON_PATH):
+    if p not in sys.path:
+        sys.path.insert(0, p)
 
-from jsonrpc import JsonRpc
+from resources.lib.paths import addon_profile
+
+# Let the skin and start-up add-ons settle before background restore work
+DEFERRED_START_DELAY_S = 30
+
+# Same files as journal.JOURNAL_DB and deferred_restore.PLAN_FILE; checked
+# here without importing those modules (sqlite3, zip and workflow imports)
+_PENDING_FILES = ("cache/restore_journal.db", "cache/deferred_restore.json")
+
+def has_work() -> bool:
+    """
+    Cheap start-up check: settings flags and file existence only. Kodi runs
+    the service on every start, and most starts have nothing to do.
+    """
+    if ADDON.getSettingBool("pending_finalize") or ADDON.getSettingBool("restore_in_progress"):
+        return True
+    if ADDON.getSetting("auto_backup") == "true" or ADDON.getSetting("peer_serve") == "true":
+        return True
+    return any(os.path.exists(addon_profile(f)) for f in _PENDING_FILES)
 
 def run():
+    if not has_work():
+        return
+
     xbmc.log("[ProfilerService] starting", xbmc.LOGINFO)
-    
+
+    from resources.lib.journal import RestoreJournal
+    from resources.lib.deferred_restore import has_plan, run_deferred
+    from resources.lib import backup_scheduler
+
     monitor = xbmc.Monitor()
     for _ in range(10):  # ~3s
         if monitor.abortRequested():
             return
         xbmc.sleep(300)
 
+    # Nothing can be restoring this early in startup: a journal means the
+    # previous session was killed mid-restore, and its restore_in_progress
+    # flag is stale (the journal keeps what resuming needs).
+    session = RestoreJournal().session()
+    if session:
+        label = session.get("remote_name") or session.get("zip") or ""
+        xbmc.log(f"[ProfilerService] interrupted restore found: {label}", xbmc.LOGINFO)
+        ADDON.setSettingBool("restore_in_progress", False)
+        msg = (
+            "A restore was interrupted before it finished.\n\n"
+            f"{label}\n\n"
+            "Open Profiler to resume it now?"
+        )
+        if xbmcgui.Dialog().yesno("Profiler", msg):
+            xbmc.executebuiltin("RunScript(script.kodi.profiler)")
+
     # Do NOT run during an active restore session
     if ADDON.getSettingBool("restore_in_progress"):
         xbmc.log("[ProfilerService] restore_in_progress=True, skipping", xbmc.LOGINFO)
         return
 
+    finalize_skin()
+
+    # LAN sharing runs on its own thread for as long as the service does
+    server = None
+    if ADDON.getSetting("peer_serve") == "true":
+        from resources.lib import peer
+        server = peer.start_from_settings(ADDON)
+
+    try:
+        # Tier 2 of a fast restore: finish the bulky part now that Kodi is usable
+        if has_plan():
+            xbmc.log("[ProfilerService] deferred restore pending; starting after settle delay", xbmc.LOGINFO)
+            if monitor.waitForAbort(DEFERRED_START_DELAY_S):
+                return
+            if ADDON.getSettingBool("restore_in_progress") or RestoreJournal().session():
+                # A (resumed) restore is running; it replaces this plan's files anyway
+                xbmc.log("[ProfilerService] restore running; deferred restore left for next start", xbmc.LOGINFO)
+            else:
+                try:
+                    run_deferred(monitor)
+                except Exception as e:
+                    xbmc.log(f"[ProfilerService] deferred restore failed: {e}", xbmc.LOGERROR)
+
+        # Scheduled idle-time backups (long-running until Kodi exits)
+        if backup_scheduler.enabled():
+            backup_scheduler.run_scheduler(monitor)
+        elif server:
+            monitor.waitForAbort()
+    finally:
+        if server:
+            server.stop()
+
+def finalize_skin():
     pending = ADDON.getSettingBool("pending_finalize")
     skin = ADDON.getSettingString("pending_skin")
     xbmc.log(f"[ProfilerService] pending_finalize={pending} pending_skin={skin}", xbmc.LOGINFO)
@@ -42,6 +118,7 @@ def run():
     )
 
     if xbmcgui.Dialog().yesno("Profiler", msg):
+        from resources.lib.jsonrpc import JsonRpc
         JsonRpc().set_setting("lookandfeel.skin", skin)
 
     ADDON.setSettingBool("pending_finalize", False)
@@ -49,4 +126,9 @@ def run():
     xbmc.log("[ProfilerService] cleared pending flags", xbmc.LOGINFO)
 
 if __name__ == "__main__":
-    run()
+    try:
+        run()
+    finally:
+        # Flush queued log lines if anything loaded the logger
+        if "resources.lib.log" in sys.modules:
+            sys.modules["resources.lib.log"].flush()
@@ -0,0 +1,119 @@
+import os
+import pathlib
+import sqlite3
+
+from resources.lib.fileops import ensure_dir, copy_file
+from resources.lib.log import warn
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# Only sniff files that look like databases; reading a header from every
+# file in addon_data would cost an extra open() per file.
+DB_EXTENSIONS = (".db", ".sqlite", ".sqlite3", ".db3")
+
+SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def readonly_uri(path: str) -> str:
+    """SQLite URI opening path read-only; ?, # and % in the path are percent-encoded."""
+    return pathlib.Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+
+
+def is_sqlite_db(path: str) -> bool:
+    if not path.lower().endswith(DB_EXTENSIONS):
+        return False
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def sidecar_of(path: str, dbs) -> bool:
+    """True if path is a -wal/-shm/-journal file belonging to one of dbs."""
+    for sfx in SIDECAR_SUFFIXES:
+        if path.endswith(sfx) and path[:-len(sfx)] in dbs:
+            return True
+    return False
+
+
+def has_pending_wal(path: str) -> bool:
+    try:
+        return os.path.getsize(path + "-wal") > 0
+    except OSError:
+        return False
+
+
+def snapshot_db(src: str, dst: str) -> None:
+    """
+    Write a consistent, compacted copy of a (possibly live) database to dst
+    using the online backup API, then VACUUM it to drop free pages.
+    The snapshot is a standalone rollback-journal file with no sidecars.
+    """
+    ensure_dir(os.path.dirname(dst))
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    source = sqlite3.connect(readonly_uri(src), uri=True, timeout=10)
+    try:
+        target = sqlite3.connect(dst)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+            target.execute("VACUUM")
+            target.commit()
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def quick_check(path: str) -> str:
+    """Run PRAGMA quick_check. Returns "ok" or the first problem reported."""
+    try:
+        conn = sqlite3.connect(readonly_uri(path), uri=True)
+        try:
+            row = conn.execute("PRAGMA quick_check").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else "no result"
+    except sqlite3.Error as e:
+        return str(e)
+
+
+def restore_db_file(src: str, dst: str) -> str:
+    """
+    Verify a restored database before it replaces the live one.
+    Stale sidecars at the destination are removed so SQLite doesn't replay an
+    old WAL/journal over the restored file. Returns "ok" or the check error
+    (in which case dst is left untouched).
+    """
+    result = quick_check(src)
+    if result != "ok":
+        return result
+
+    for sfx in SIDECAR_SUFFIXES:
+        try:
+            if os.path.exists(dst + sfx):
+                os.remove(dst + sfx)
+        except OSError:
+            pass
+
+    copy_file(src, dst)
+    return "ok"
+
+
+def restore_file(src: str, dst: str) -> bool:
+    """
+    copy_file for restore loops: databases go through restore_db_file.
+    Returns False if a database failed its check and was not restored.
+    """
+    if is_sqlite_db(src):
+        result = restore_db_file(src, dst)
+        if result != "ok":
+            warn(f"Skipping corrupt database from backup: {src} ({result})", notify=True)
+            return False
+        return True
+
+    copy_file(src, dst)
+    return True
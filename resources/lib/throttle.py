@@ -0,0 +1,175 @@
+"""
+Token-bucket limits for network and disk bytes, shared by every upload,
+download and copy path. Rates come from the add-on settings (KB/s, 0 = no
+limit) and switch to the "during playback" profile while xbmc.Player is
+playing, so a backup doesn't make a stream buffer.
+"""
+
+import os
+import threading
+import time
+
+import xbmc
+import xbmcaddon
+
+from resources.lib.log import info
+
+# How often the playback state / settings are re-read
+PROFILE_REFRESH_S = 2.0
+
+# Reads/writes are split into pieces this big so waits stay short and smooth
+CHUNK = 64 * 1024
+
+
+class TokenBucket:
+    """Allows `rate` bytes/s on average with bursts of up to `burst_s` seconds. rate <= 0 disables it."""
+
+    def __init__(self, rate: int = 0, burst_s: float = 1.0):
+        self._lock = threading.Lock()
+        self.burst_s = burst_s
+        self.rate = 0
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: int) -> None:
+        with self._lock:
+            self.rate = max(0, int(rate))
+            self.capacity = max(CHUNK, self.rate * self.burst_s)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def consume(self, n: int) -> None:
+        """Block until n bytes may pass."""
+        while n > 0:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                take = min(n, self.capacity)
+                if self.tokens >= take:
+                    self.tokens -= take
+                    n -= take
+                    continue
+                wait = (take - self.tokens) / self.rate
+            time.sleep(min(wait, 0.5))
+
+
+NET = TokenBucket()
+DISK = TokenBucket()
+
+_state = {"checked": 0.0, "profile": None}
+_state_lock = threading.Lock()
+
+
+def _kbps(addon, key: str) -> int:
+    try:
+        return max(0, int(addon.getSetting(key) or 0)) * 1024
+    except ValueError:
+        return 0
+
+
+def refresh(force: bool = False) -> None:
+    """Pick the normal or playback profile. Cheap; rate-limited internally."""
+    now = time.monotonic()
+    with _state_lock:
+        if not force and now - _state["checked"] < PROFILE_REFRESH_S:
+            return
+        _state["checked"] = now
+
+    playing = xbmc.Player().isPlaying()
+    addon = xbmcaddon.Addon()
+    sfx = "_playing" if playing else ""
+    net, disk = _kbps(addon, "throttle_net_kbps" + sfx), _kbps(addon, "throttle_disk_kbps" + sfx)
+    NET.set_rate(net)
+    DISK.set_rate(disk)
+
+    profile = (playing, net, disk)
+    if profile != _state["profile"]:
+        _state["profile"] = profile
+        info(f"Throttle: {'playback' if playing else 'normal'} profile, net={net // 1024} KB/s disk={disk // 1024} KB/s (0 = unlimited)")
+
+
+def net(n: int) -> None:
+    refresh()
+    NET.consume(n)
+
+
+def disk(n: int) -> None:
+    refresh()
+    DISK.consume(n)
+
+
+class ThrottledReader:
+    """
+    File-like wrapper for urllib request bodies: reads are charged to NET.
+    data is bytes or a binary file opened at the start of the body.
+    on_read(n): optional, called after each read (progress; may raise to abort).
+    """
+
+    def __init__(self, data, on_read=None):
+        if hasattr(data, "read"):
+            self._file = data
+            self._len = os.fstat(data.fileno()).st_size - data.tell()
+        else:
+            self._file = None
+            self._data = memoryview(data)
+            self._len = len(data)
+        self._pos = 0
+        self._on_read = on_read
+
+    def __len__(self):
+        return self._len
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._len - self._pos
+        size = min(size, CHUNK)
+        if self._file is not None:
+            out = self._file.read(size)
+        else:
+            out = self._data[self._pos:self._pos + size].tobytes()
+        self._pos += len(out)
+        if out:
+            net(len(out))
+            if self._on_read:
+                self._on_read(len(out))
+        return out
+
+
+class DiskReader:
+    """Seekable binary file wrapper whose reads are charged to DISK (for ZipFile over an open archive)."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def read(self, size: int = -1) -> bytes:
+        out = self._f.read(size)
+        if out:
+            disk(len(out))
+        return out
+
+    def seek(self, *args) -> int:
+        return self._f.seek(*args)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def read_response(resp) -> bytes:
+    """resp.read() charged to NET in CHUNK pieces."""
+    parts = []
+    while True:
+        buf = resp.read(CHUNK)
+        if not buf:
+            break
+        net(len(buf))
+        parts.append(buf)
+    return b"".join(parts)
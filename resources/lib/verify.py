@@ -0,0 +1,121 @@
+"""
+Archive integrity check run after a backup is built and before a restore
+extracts anything: every member is decompressed and CRC-checked on a pool
+of threads (each with its own file handle; zlib releases the GIL), and the
+manifest must parse and point at members that exist.
+"""
+
+import json
+import os
+import threading
+import time
+import zipfile
+
+from resources.lib import throttle
+from resources.lib.delta import delta_member
+from resources.lib.log import info
+
+READ_CHUNK = 1024 * 1024
+MAX_WORKERS = 8
+
+
+def _check_manifest(z: zipfile.ZipFile, errors: list) -> None:
+    names = set(z.namelist())
+    try:
+        manifest = json.loads(z.read("manifest.json").decode("utf-8"))
+    except KeyError:
+        errors.append("manifest.json missing")
+        return
+    except ValueError as e:
+        errors.append(f"manifest.json does not parse: {e}")
+        return
+    if not isinstance(manifest, dict):
+        errors.append("manifest.json is not an object")
+        return
+
+    for repo in manifest.get("repos") or []:
+        rel = (repo.get("zip_in_backup") or "").strip() if isinstance(repo, dict) else ""
+        if rel and rel not in names:
+            errors.append(f"repo zip missing: {rel}")
+    for arc in ((manifest.get("deltas") or {}).get("files") or {}):
+        if delta_member(arc) not in names:
+            errors.append(f"delta missing: {delta_member(arc)}")
+
+
+def verify_archive(zip_path: str, workers: int = 0) -> dict:
+    """
+    CRC-check every member of zip_path in parallel and validate the manifest.
+    Stops at the first corrupt member. Returns a report
+    {"ok", "members", "bytes", "seconds", "errors"}.
+    """
+    started = time.monotonic()
+    errors = []
+    try:
+        with zipfile.ZipFile(zip_path, "r") as z:
+            members = [m for m in z.infolist() if not m.is_dir()]
+            _check_manifest(z, errors)
+    except (zipfile.BadZipFile, OSError) as e:
+        return {"ok": False, "members": 0, "bytes": 0, "seconds": 0.0, "errors": [f"not a readable zip: {e}"]}
+
+    # Biggest first so one large member doesn't finish last on its own
+    members.sort(key=lambda m: m.file_size, reverse=True)
+    workers = workers or min(MAX_WORKERS, os.cpu_count() or 2)
+    lock = threading.Lock()
+    failed = threading.Event()
+    state = {"next": 0, "bytes": 0}
+
+    def worker():
+        # Reads go through throttle.disk, so a verify doesn't starve playback
+        with open(zip_path, "rb") as raw, zipfile.ZipFile(throttle.DiskReader(raw), "r") as z:
+            while not failed.is_set():
+                with lock:
+                    i = state["next"]
+                    state["next"] += 1
+                if i >= len(members):
+                    return
+                m = members[i]
+                try:
+                    # ZipExtFile checks the CRC when the member is read to the end
+                    with z.open(m) as f:
+                        while f.read(READ_CHUNK):
+                            if failed.is_set():
+                                return
+                except Exception as e:
+                    with lock:
+                        errors.append(f"{m.filename}: {e}")
+                    failed.set()
+                    return
+                with lock:
+                    state["bytes"] += m.file_size
+
+    threads = [threading.Thread(target=worker, name=f"profiler-verify-{n}", daemon=True)
+               for n in range(min(workers, len(members)) or 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report = {
+        "ok": not errors,
+        "members": len(members),
+        "bytes": state["bytes"],
+        "seconds": round(time.monotonic() - started, 2),
+        "errors": errors,
+    }
+    info(f"Verify {os.path.basename(zip_path)}: {'OK' if report['ok'] else 'FAILED'} "
+         f"({report['members']} members, {report['bytes']} bytes, {report['seconds']}s, {len(threads)} threads)")
+    return report
+
+
+def ensure_verified(zip_path: str, journal=None) -> dict:
+    """verify_archive that raises on failure; a journalled restore only verifies once."""
+    if journal and journal.done("step", "verify"):
+        return {}
+    report = verify_archive(zip_path)
+    if not report["ok"]:
+        shown = "; ".join(report["errors"][:5])
+        raise RuntimeError(f"Backup archive failed verification: {shown}")
+    if journal:
+        journal.mark("step", "verify")
+        journal.commit()
+    return report
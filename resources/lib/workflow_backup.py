@@ -1,16 +1,26 @@
 import xbmc
 import xbmcvfs
+import hashlib
 import json
 import os
-import glob
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
-from resources.lib.fileops import ensure_dir, copy_file
+from resources.lib.fileops import ensure_dir
 from resources.lib.manifest import build_manifest
-from resources.lib.zipops import zip_from_dir
+from resources.lib.zipops import zip_entries, write_member
+from resources.lib.fileindex import FileIndex
+from resources.lib.packages import get_packages_index
+from resources.lib.delta import encode as delta_encode, materialize, chain_depth, delta_member
+from resources.lib.sqliteops import is_sqlite_db, sidecar_of, has_pending_wal, snapshot_db
 from resources.lib.b2 import B2Client
-from resources.lib.log import info, warn, err, exc
-from resources.lib.paths import profile, temp, home
+from resources.lib.catalog import make_entry, update_catalog
+from resources.lib.verify import ensure_verified
+from resources.lib.memprofile import phase
+from resources.lib import jobs
+from resources.lib.log import debug, info, warn, err, exc
+from resources.lib.paths import profile, temp, home, addon_profile, master
+from resources.lib.profiles import list_profiles, arc_root, profile_of, PROFILES_XML
 
 
 PORTABLE_FILES = [
@@ -25,53 +35,128 @@ PORTABLE_DIRS = [
 
 SKIP_REPOS = {"repository.xbmc.org"}
 
+# Our own state under addon_data: never back these up
+SKIP_DIRS = {
+    "addon_data/script.kodi.profiler/backups",
+    "addon_data/script.kodi.profiler/cache",
+}
 
-def backup_to_b2(build_name: str, b2_key_id: str, b2_app_key: str, b2_bucket: str, b2_prefix: str, b2_bucket_id: str, include_keymaps: bool, include_adv: bool, do_upload: bool = True):
-    # 1) staging dir
+FILE_INDEX_DB = "cache/fileindex.db"
+
+# Multi-profile backups: profiles are walked/hashed on this many threads, and
+# files at least this big that are byte-identical across profiles are stored once
+PROFILE_WORKERS = 4
+DEDUPE_MIN_SIZE = 64 * 1024
+
+
+def cloud_backup_settings(addon) -> dict:
+    """backup_to_b2 keyword arguments (everything but build_name) from add-on settings."""
+    s = addon.getSetting
+    return {
+        "b2_key_id": s("b2_key_id").strip(),
+        "b2_app_key": s("b2_app_key").strip(),
+        "b2_bucket": s("b2_bucket_name").strip(),
+        "b2_prefix": s("b2_prefix").strip(),
+        "b2_bucket_id": s("b2_bucket_id").strip(),
+        "b2_api_url": s("b2_api_url").strip(),
+        "include_keymaps": s("include_keymaps") == "true",
+        "include_adv": s("include_advancedsettings") == "true",
+        "delta_base": s("delta_base").strip(),
+        "delta_min_size_mb": int(s("delta_min_size_mb") or 4),
+        "delta_max_chain": int(s("delta_max_chain") or 3),
+        "all_profiles": s("all_profiles") == "true",
+    }
+
+
+def backup_to_b2(build_name: str, b2_key_id: str, b2_app_key: str, b2_bucket: str, b2_prefix: str, b2_bucket_id: str, include_keymaps: bool, include_adv: bool, do_upload: bool = True, delta_base: str = "", delta_min_size_mb: int = 4, delta_max_chain: int = 3, tick=None, b2_api_url: str = "", all_profiles: bool = False):
+    """
+    tick: optional callable run between files (and every MB of delta
+    encoding); may block (to yield to playback) or raise to abort. Used by
+    scheduled backups.
+    all_profiles: also capture every additional Kodi profile (see profiles.py);
+    the master profile is then read from special://masterprofile.
+    """
+    # 1) staging dir (generated files only: manifest, report, rebuilt repo zips)
     staging = temp(f"profiler/staging/{build_name}")
     ensure_dir(staging)
 
-    # 2) copy portable files
-    user_stage = os.path.join(staging, "userdata")
-    ensure_dir(user_stage)
+    # (abs source path, path inside the zip)
+    entries = []
+    # with all profiles the master is always the one at userdata/, whoever is logged in
+    src_of = master if all_profiles else profile
 
+    # 2) portable files
     for f in PORTABLE_FILES:
-        src = profile(f)
-        info(f"FILE src={src} exists={os.path.exists(src)}")
+        src = src_of(f)
+        debug("FILE src=%s", src)
         if xbmcvfs.exists(src):
-            dst = os.path.join(user_stage, f)
-            copy_file(src, dst)
+            entries.append((src, f"userdata/{f}"))
 
     # keymaps optional
-    if include_keymaps and xbmcvfs.exists(profile("keymaps")):
+    if include_keymaps and xbmcvfs.exists(src_of("keymaps")):
         PORTABLE_DIRS_LOCAL = PORTABLE_DIRS + ["keymaps"]
     else:
         PORTABLE_DIRS_LOCAL = PORTABLE_DIRS
 
     # advancedsettings optional
-    if include_adv and xbmcvfs.exists(profile("advancedsettings.xml")):
-        copy_file(profile("advancedsettings.xml"), os.path.join(user_stage, "advancedsettings.xml"))
+    if include_adv and xbmcvfs.exists(src_of("advancedsettings.xml")):
+        entries.append((src_of("advancedsettings.xml"), "userdata/advancedsettings.xml"))
 
-    # 3) copy portable dirs (merge into staging)
+    # 3) portable dirs (read straight from the profile, no staging copy)
     for d in PORTABLE_DIRS_LOCAL:
-        src_root = profile(d)
-        info(f"DIR src={src_root} exists={os.path.exists(src_root)}")
+        src_root = src_of(d)
+        debug("DIR src=%s", src_root)
         if not os.path.isdir(src_root):
             continue
-        dst_root = os.path.join(user_stage, d)
-        ensure_dir(dst_root)
-        
-        for root, _, files in os.walk(src_root):
-            rel = os.path.relpath(root, src_root)
-            out_dir = dst_root if rel == "." else os.path.join(dst_root, rel)
-            ensure_dir(out_dir)
-            for fn in files:
-                copy_file(os.path.join(root, fn), os.path.join(out_dir, fn))
+        entries.extend(_collect_dir_entries(src_root, d))
+
+    # 3a) additional profiles, walked in parallel
+    profile_list = []
+    if all_profiles:
+        profile_list = list_profiles()
+        others = [p["dir"] for p in profile_list if p["dir"]]
+        with phase("collect_profiles"), ThreadPoolExecutor(max_workers=PROFILE_WORKERS) as pool:
+            for found in pool.map(_collect_profile, others):
+                entries.extend(found)
+        if os.path.isfile(master(PROFILES_XML)):
+            entries.append((master(PROFILES_XML), f"userdata/{PROFILES_XML}"))
+        info(f"Profiles: {len(profile_list)} ({', '.join(p['name'] for p in profile_list)})")
+
+    index = FileIndex(addon_profile(FILE_INDEX_DB))
+
+    # 3b) SQLite: consistent snapshots instead of byte copies of live DBs
+    with phase("snapshot_databases"), jobs.phase("Snapshotting databases"):
+        entries = _snapshot_databases(entries, os.path.join(staging, "sqlite"), index, tick=tick)
+
+    # 3b') files the profiles share byte-for-byte are stored once
+    dedupe = {}
+    if len(profile_list) > 1:
+        with phase("dedupe_profiles"), jobs.phase("Finding shared files"):
+            entries, dedupe = _dedupe_profiles(entries, tick=tick)
+
+    # 3c) large files: store rsync-style deltas against a base backup
+    deltas = {}
+    if delta_base:
+        if os.path.splitext(delta_base)[0] == build_name:
+            warn(f"Delta base cannot be the backup being written ({build_name}); storing full files")
+        else:
+            with phase("delta_encode"), jobs.phase("Encoding deltas"):
+                entries, deltas = _delta_encode(
+                    entries, os.path.join(staging, "deltas"), delta_base,
+                    min_size=max(1, int(delta_min_size_mb)) * 1024 * 1024, max_chain=int(delta_max_chain),
+                    tick=tick,
+                )
 
     # 4) manifest + report
-    manifest = build_manifest()
+    with phase("manifest"), jobs.phase("Reading installed add-ons"):
+        manifest = build_manifest()
+    if deltas:
+        manifest["deltas"] = deltas
+    if all_profiles:
+        manifest["profiles"] = {"list": profile_list, "dedupe": dedupe}
     repos_stage = os.path.join(staging, "repos")
     ensure_dir(repos_stage)
+    packages = get_packages_index()
 
     for repo in manifest.get("repos", []):
         rid = repo["id"]
@@ -84,13 +169,12 @@ def backup_to_b2(build_name: str, b2_key_id: str, b2_app_key: str, b2_bucket: st
             continue
 
         # Try C1: grab the zip Kodi originally downloaded
-        src_zip = _find_latest_repo_zip_in_packages(rid)
+        src_zip = packages.latest(rid)
 
         if src_zip and os.path.isfile(src_zip):
             out_name = os.path.basename(src_zip)
-            dst_zip = os.path.join(repos_stage, out_name)
-            info(f"Repo zip (packages) {rid}: {src_zip} -> {dst_zip}")
-            copy_file(src_zip, dst_zip)
+            info(f"Repo zip (packages) {rid}: {src_zip}")
+            entries.append((src_zip, f"repos/{out_name}"))
             repo["zip_in_backup"] = f"repos/{out_name}"
             repo["zip_url"] = ""
             repo["zip_path"] = ""
@@ -103,6 +187,7 @@ def backup_to_b2(build_name: str, b2_key_id: str, b2_app_key: str, b2_bucket: st
 
         try:
             _zip_installed_repo_folder(rid, dst_zip)
+            entries.append((dst_zip, f"repos/{out_name}"))
             repo["zip_in_backup"] = f"repos/{out_name}"
             repo["zip_url"] = ""
             repo["zip_path"] = ""
@@ -113,36 +198,251 @@ def backup_to_b2(build_name: str, b2_key_id: str, b2_app_key: str, b2_bucket: st
             repo["zip_url"] = ""
             repo["zip_path"] = ""
 
-    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+    manifest_path = os.path.join(staging, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
         json.dump(manifest, f, indent=2)
+    entries.append((manifest_path, "manifest.json"))
 
     report = {"notes": ["Debrid services will usually require re-authorization on the new device."]}
-    with open(os.path.join(staging, "report.json"), "w", encoding="utf-8") as f:
+    report_path = os.path.join(staging, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
         json.dump(report, f, indent=2)
+    entries.append((report_path, "report.json"))
 
-    # 5) zip
+    # 5) zip (unchanged files are copied raw from the previous archive)
     out_zip = temp(f"profiler/out/{build_name}.zip")
     ensure_dir(os.path.dirname(out_zip))
-    zip_from_dir(staging, out_zip)
+    try:
+        total = sum(os.path.getsize(e[2] if len(e) > 2 else e[0]) for e in entries) if jobs.active() else 0
+        with phase("zip"), jobs.phase("Compressing", files_total=len(entries), bytes_total=total):
+            stats = zip_entries(out_zip, entries, index=index, tick=tick)
+    finally:
+        index.close()
+    info(f"Archive built: {stats['files']} files ({stats['reused']} reused, {stats['compressed']} compressed)")
+    with phase("verify"), jobs.phase("Verifying archive"):
+        ensure_verified(out_zip)
 
     # 6) upload to B2
     if do_upload:
-        b2 = B2Client(b2_key_id, b2_app_key)
+        b2 = B2Client(b2_key_id, b2_app_key, api_base=b2_api_url)
         b2.authorize()
         if not b2_bucket_id:
             raise RuntimeError("B2 Bucket ID is required (your key cannot list buckets). Add it in Profiler settings.")
 
-        up = b2.get_upload_url(b2_bucket_id)
-        with open(out_zip, "rb") as f:
-            data = f.read()
-
         remote_name = (b2_prefix or "").rstrip("/") + f"/{build_name}.zip"
         remote_name = remote_name.lstrip("/")
-        b2.upload_file(up["uploadUrl"], up["authorizationToken"], remote_name, data)
-        return {"zip": out_zip, "remote_name": remote_name, "manifest": manifest}
+
+        # Archives are deterministic: same SHA-1 as the remote copy = nothing changed
+        try:
+            remote_sha1 = b2.latest_sha1(b2_bucket_id, remote_name)
+        except Exception as e:
+            warn(f"Could not check remote version of {remote_name}: {e}")
+            remote_sha1 = ""
+        if remote_sha1 and remote_sha1 == stats["sha1"]:
+            info(f"Backup unchanged (sha1 {stats['sha1']}); skipping upload of {remote_name}")
+            return {"zip": out_zip, "remote_name": remote_name, "manifest": manifest, "uploaded": False}
+
+        with phase("upload"), jobs.phase("Uploading", bytes_total=os.path.getsize(out_zip)):
+            b2.upload_path(b2_bucket_id, remote_name, out_zip, sha1=stats["sha1"])
+
+        # Catalog failures never fail the backup; the picker falls back to listing
+        try:
+            entry = make_entry(build_name, remote_name, out_zip, stats["sha1"], manifest)
+            update_catalog(b2, b2_bucket_id, b2_prefix, entry)
+        except Exception as e:
+            warn(f"Could not update backup catalog: {e}")
+        return {"zip": out_zip, "remote_name": remote_name, "manifest": manifest, "uploaded": True}
 
     # local-only return
-    return {"zip": out_zip, "remote_name": "", "manifest": manifest}
+    return {"zip": out_zip, "remote_name": "", "manifest": manifest, "uploaded": False}
+
+def _collect_dir_entries(src_root: str, rel_root: str, arc_base: str = "userdata"):
+    """
+    Walk src_root and return (abs_path, arcname) pairs under <arc_base>/<rel_root>/,
+    pruning SKIP_DIRS.
+    """
+    out = []
+    for root, dirs, files in os.walk(src_root):
+        rel = os.path.relpath(root, src_root)
+        rel_dir = rel_root if rel == "." else f"{rel_root}/{rel.replace(os.sep, '/')}"
+        dirs[:] = sorted(d for d in dirs if f"{rel_dir}/{d}" not in SKIP_DIRS)
+        for fn in sorted(files):
+            out.append((os.path.join(root, fn), f"{arc_base}/{rel_dir}/{fn}"))
+    return out
+
+def _collect_profile(profile_dir: str):
+    """
+    Entries of one additional profile (portable files + addon_data) under
+    userdata/<profile_dir>/. Keymaps and advancedsettings.xml are global in
+    Kodi, so they only come from the master profile.
+    """
+    base = arc_root(profile_dir)
+    out = []
+    for f in PORTABLE_FILES:
+        src = master(f"{profile_dir}/{f}")
+        if os.path.isfile(src):
+            out.append((src, f"{base}/{f}"))
+    for d in PORTABLE_DIRS:
+        src_root = master(f"{profile_dir}/{d}")
+        if os.path.isdir(src_root):
+            out.extend(_collect_dir_entries(src_root, d, base))
+    return out
+
+def _sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+def _dedupe_profiles(entries, min_size: int = DEDUPE_MIN_SIZE, tick=None):
+    """
+    Drop additional-profile files that are byte-identical to another file in
+    the backup. Only same-size candidates are hashed (in parallel; tick runs
+    before each). Returns (entries, {dropped arcname: arcname of the stored copy}).
+    """
+    by_size = {}
+    for entry in entries:
+        size = os.path.getsize(entry[0])
+        if size >= min_size:
+            by_size.setdefault(size, []).append(entry)
+    candidates = [g for g in by_size.values() if len(g) > 1 and any(profile_of(e[1]) for e in g)]
+    if not candidates:
+        return entries, {}
+
+    flat = [e for g in candidates for e in g]
+    def digest(e):
+        if tick:
+            tick()
+        return _sha1_file(e[0])
+
+    with ThreadPoolExecutor(max_workers=PROFILE_WORKERS) as pool:
+        digests = dict(zip((e[1] for e in flat), pool.map(digest, flat)))
+
+    groups = {}
+    for e in flat:
+        groups.setdefault((os.path.getsize(e[0]), digests[e[1]]), []).append(e[1])
+    dedupe = {}
+    for arcs in groups.values():
+        # the master's copy (or the first by name) is the one stored
+        keep = min(arcs, key=lambda a: (profile_of(a) is not None, a))
+        for arc in arcs:
+            if arc != keep and profile_of(arc):
+                dedupe[arc] = keep
+
+    if dedupe:
+        info(f"Profiles: {len(dedupe)} shared file(s) stored once")
+    return [e for e in entries if e[1] not in dedupe], dedupe
+
+def _snapshot_databases(entries, snap_dir: str, index=None, tick=None):
+    """
+    Replace live SQLite files with consistent, vacuumed snapshots and drop
+    their -wal/-shm/-journal sidecars. A DB with no pending WAL that the file
+    index says is unchanged is left as-is so its bytes are reused.
+    """
+    dbs = {src for src, arc in entries if is_sqlite_db(src)}
+    if not dbs:
+        return entries
+
+    out = []
+    snapped = 0
+    for src, arc in entries:
+        if sidecar_of(src, dbs):
+            continue
+
+        if src in dbs:
+            if index and not has_pending_wal(src) and index.lookup(arc, os.stat(src)):
+                out.append((src, arc))
+                continue
+
+            if tick:
+                tick()
+            snap = os.path.join(snap_dir, *arc.split("/"))
+            try:
+                snapshot_db(src, snap)
+                # stat the live DB for the index; the snapshot itself is always new
+                out.append((snap, arc, src))
+                snapped += 1
+                continue
+            except Exception as e:
+                warn(f"SQLite snapshot failed, copying raw: {src} ({e})")
+
+        out.append((src, arc))
+
+    info(f"SQLite: {len(dbs)} database(s), {snapped} snapshotted")
+    return out
+
+def find_base_backup(name: str) -> str:
+    """Locate a delta base backup on this device (local backups, then recent cloud builds)."""
+    if not name.lower().endswith(".zip"):
+        name += ".zip"
+    for cand in (addon_profile(f"backups/{name}"), temp(f"profiler/out/{name}")):
+        if os.path.isfile(cand):
+            return cand
+    raise RuntimeError(f"Delta base backup not found: {name}")
+
+def _delta_encode(entries, delta_dir: str, base_name: str, min_size: int, max_chain: int, tick=None):
+    """
+    Replace large userdata files with deltas against the same path in the
+    base backup. tick runs per file and inside the encoder. Returns
+    (entries, manifest "deltas" dict or {}).
+    """
+    try:
+        base_zip = find_base_backup(base_name)
+    except RuntimeError as e:
+        warn(f"{e}; storing full files", notify=True)
+        return entries, {}
+
+    depth = chain_depth(base_zip) + 1
+    if depth > max_chain:
+        info(f"Delta chain depth {depth} exceeds cap {max_chain}; storing full files")
+        return entries, {}
+
+    ensure_dir(delta_dir)
+    base_tmp = os.path.join(delta_dir, "base.tmp")
+    out = []
+    files = {}
+
+    # An abort from tick inside the encoder must not read as a failed encode
+    aborted = []
+
+    def encode_tick():
+        try:
+            tick()
+        except BaseException:
+            aborted.append(True)
+            raise
+
+    for entry in entries:
+        src, arc = entry[0], entry[1]
+        if not arc.startswith("userdata/") or os.path.getsize(src) < min_size:
+            out.append(entry)
+            continue
+
+        if tick:
+            tick()
+        try:
+            if materialize(base_zip, arc, base_tmp, find_base_backup):
+                d_path = os.path.join(delta_dir, *delta_member(arc).split("/"))
+                res = delta_encode(base_tmp, src, d_path, tick=encode_tick if tick else None)
+                if res:
+                    info(f"Delta {arc}: {res['size']} -> {res['delta_size']} bytes")
+                    files[arc] = {"size": res["size"], "sha1": res["sha1"], "crc": res["crc"]}
+                    out.append((d_path, delta_member(arc)))
+                    continue
+        except Exception as e:
+            if aborted:
+                raise
+            warn(f"Delta encode failed, storing full file: {arc} ({e})")
+        finally:
+            if os.path.exists(base_tmp):
+                os.remove(base_tmp)
+
+        out.append(entry)
+
+    if not files:
+        return out, {}
+    return out, {"base": os.path.basename(base_zip), "depth": depth, "files": files}
 
 def _zip_installed_repo_folder(repo_id: str, out_zip: str):
     """
@@ -156,18 +456,17 @@ def _zip_installed_repo_folder(repo_id: str, out_zip: str):
     ensure_dir(os.path.dirname(out_zip))
 
     # Create zip with proper top-level folder: repo_id/...
+    # Deterministic (sorted, fixed timestamps) so an unchanged repo doesn't change the backup
     with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for root, _, files in os.walk(src_dir):
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
             rel_root = os.path.relpath(root, src_dir)
-            rel_root = "" if rel_root == "." else rel_root
+            rel_root = "" if rel_root == "." else rel_root.replace(os.sep, "/")
 
-            for fn in files:
+            for fn in sorted(files):
                 full_path = os.path.join(root, fn)
                 arc_path = f"{repo_id}/" + (f"{rel_root}/" if rel_root else "") + fn
-                z.write(full_path, arc_path)
+                write_member(z, full_path, arc_path)
 
 def _find_latest_repo_zip_in_packages(repo_id: str) -> str:
-    pkg_dir = home("addons/packages")
-    pattern = os.path.join(pkg_dir, f"{repo_id}-*.zip")
-    matches = sorted(glob.glob(pattern), key=lambda p: os.path.getmtime(p), reverse=True)
-    return matches[0] if matches else ""
+    return get_packages_index().latest(repo_id)
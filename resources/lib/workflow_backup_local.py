@@ -5,16 +5,23 @@ import xbmcgui
 import os
 from resources.lib.workflow_backup import backup_to_b2  # reuse logic
 from resources.lib.paths import profile
-from resources.lib.fileops import ensure_dir
+from resources.lib.fileops import copy_file, ensure_dir
 
-def backup_local():
-    build_name = xbmcgui.Dialog().input("Build name", type=xbmcgui.INPUT_ALPHANUM)
+def backup_local(build_name: str = "", tick=None):
+    """
+    build_name: asked for when empty (menu). tick: see backup_to_b2.
+    """
+    if not build_name:
+        build_name = xbmcgui.Dialog().input("Build name", type=xbmcgui.INPUT_ALPHANUM)
     if not build_name:
         return
-        
+
     backup_dir = profile("addon_data/script.kodi.profiler/backups")
     ensure_dir(backup_dir)
 
+    # Read now, not at import: the service keeps this module loaded across setting changes
+    addon = xbmcaddon.Addon()
+
     # reuse backup logic but stop before upload
     result = backup_to_b2(
         build_name=build_name,
@@ -26,14 +33,17 @@ def backup_local():
         include_keymaps=True,
         include_adv=False,
         do_upload=False,   # <-- IMPORTANT
+        delta_base=addon.getSetting("delta_base").strip(),
+        delta_min_size_mb=int(addon.getSetting("delta_min_size_mb") or 4),
+        delta_max_chain=int(addon.getSetting("delta_max_chain") or 3),
+        tick=tick,
+        all_profiles=addon.getSetting("all_profiles") == "true",
     )
 
 
-    # move zip into local backup dir
+    # copy zip into local backup dir (charged to the disk throttle)
     src_zip = result["zip"]
     dst_zip = os.path.join(backup_dir, f"{build_name}.zip")
-
-    import xbmcvfs
-    xbmcvfs.copy(src_zip, dst_zip)
+    copy_file(src_zip, dst_zip)
 
     return dst_zip
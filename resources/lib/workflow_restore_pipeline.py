@@ -0,0 +1,312 @@
+import glob
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from resources.lib.paths import profile, master
+from resources.lib.fileops import ensure_dir, copy_file
+from resources.lib.zipops import unzip_to_dir
+from resources.lib.sqliteops import restore_file
+from resources.lib.delta import restore_deltas
+from resources.lib.verify import ensure_verified
+from resources.lib.memprofile import phase
+from resources.lib.addon_installer import new_report, install_repos_phase, install_addons_phase, log_summary, plan_installs
+from resources.lib.install_plan import SKIP
+from resources.lib.scheduler import Stage, run_stages
+from resources.lib.workflow_restore import _validate_manifest
+from resources.lib.deferred_restore import tier1_prefixes, save_plan
+from resources.lib.profiles import arc_root, profile_of, merge_profiles_xml, PROFILES_XML
+from resources.lib.log import info, warn
+from resources.lib import jobs
+
+XML_FILES = ["sources.xml", "guisettings.xml", "favourites.xml", "advancedsettings.xml"]
+
+PORTABLE_DIRS = ["addon_data", "keymaps"]
+
+# Additional profiles of a multi-profile backup are copied on this many threads
+PROFILE_WORKERS = 4
+
+
+def clear_gui_cache():
+    db_dir = profile("Database")
+    if not os.path.isdir(db_dir):
+        return
+
+    for pattern in ("Addons*.db", "ViewModes*.db"):
+        for path in glob.glob(os.path.join(db_dir, pattern)):
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+
+def _is_control_member(name: str) -> bool:
+    # Everything installs need, plus the top-level XMLs: small and needed first
+    if name in ("manifest.json", "report.json") or name.startswith("repos/"):
+        return True
+    return name.startswith("userdata/") and name.count("/") == 1
+
+
+def _copy_tree(src_root: str, dst_root: str, journal=None, skip_top=()):
+    ensure_dir(dst_root)
+    for root, dirs, files in os.walk(src_root):
+        rel = os.path.relpath(root, src_root)
+        if rel == ".":
+            dirs[:] = [d for d in dirs if d not in skip_top]
+        out_dir = dst_root if rel == "." else os.path.join(dst_root, rel)
+        ensure_dir(out_dir)
+        for fn in files:
+            jobs.checkpoint()
+            jobs.advance(files=1)
+            dst = os.path.join(out_dir, fn)
+            if journal and journal.done("file", dst):
+                continue
+            restore_file(os.path.join(root, fn), dst)
+            if journal:
+                journal.mark("file", dst)
+    if journal:
+        journal.commit()
+
+
+def pick_tier1(manifest: dict, priority_addons=(), top_addons: int = 5) -> list:
+    """Skin + the first few priority add-ons that are actually in the backup."""
+    wanted = set(manifest.get("addons") or [])
+    skin = manifest.get("active_skin") or ""
+    top = [a for a in dict.fromkeys(priority_addons) if a in wanted and a != skin][:max(0, top_addons)]
+    return ([skin] if skin in wanted else []) + top
+
+
+def restore_pipelined(zip_path: str, staging: str, overwrite_xml: bool, journal=None, find_base=None,
+                      fast: bool = False, priority_addons=(), top_addons: int = 5, keep_zip: bool = True,
+                      profiles=None):
+    """
+    Restore a downloaded/local backup zip with independent work overlapped:
+    repo + add-on installs start as soon as manifest.json and the repo zips
+    are out, while addon_data extracts and copies on a background thread.
+
+        control ─┬─ xml ── gui_cache ── repos ── addons ─┐
+                 └─ userdata_extract ─┬─ userdata_copy ──┴─ skin_settings
+                                      └─ profiles_copy
+
+    fast: tiered restore. Only the XMLs, keymaps, the skin and the top
+    priority add-ons (data + installs) are restored now; the rest is saved as
+    a deferred plan for the service to finish after restart (keep_zip=False
+    moves a temp zip somewhere that survives the restart).
+
+    profiles: for multi-profile backups, the profile dirs to restore ("" is
+    the master profile); all of them when None. A resumed restore keeps the
+    first choice. Add-on installs are shared, so they always run. Callers
+    ask any questions (profiles, install plan) before starting: this may run
+    on a job's worker thread, where no dialogs are opened.
+
+    Returns (manifest, install_report).
+    """
+    # Nothing touches the live profile until the archive checks out
+    with phase("verify"):
+        ensure_verified(zip_path, journal)
+
+    resuming = bool(journal and journal.get("extract_started"))
+    if os.path.isdir(staging) and not resuming:
+        try:
+            shutil.rmtree(staging)
+        except Exception:
+            warn("Could not fully wipe staging dir; continuing")
+    ensure_dir(staging)
+    if journal:
+        journal.set("extract_started", "1")
+        journal.commit()
+
+    user_stage = os.path.join(staging, "userdata")
+    state = {"manifest": {}, "report": new_report(), "tier1": None, "prefixes": (),
+             "profiles": None, "needed": frozenset(), "plan": {}}
+
+    def in_scope(name: str) -> bool:
+        chosen = state["profiles"]
+        if chosen is not None:
+            # deltas/<arc>.pdelta stands for <arc>
+            arc = name[len("deltas/"):-len(".pdelta")] if name.startswith("deltas/") and name.endswith(".pdelta") else name
+            if arc in state["needed"]:
+                return True
+            owner = profile_of(name)
+            if owner is not None:
+                return owner in chosen
+            if "" not in chosen and arc.startswith("userdata/"):
+                return False
+        return state["tier1"] is None or name.startswith(state["prefixes"])
+
+    def master_chosen() -> bool:
+        return state["profiles"] is None or "" in state["profiles"]
+
+    def dst_of(rel: str) -> str:
+        # a multi-profile backup's userdata/ is the master profile, whoever is logged in
+        return master(rel) if state["profiles"] is not None else profile(rel)
+
+    def choose_profiles(manifest: dict):
+        listed = (manifest.get("profiles") or {}).get("list") or []
+        saved = journal.get("profiles") if journal else ""
+        if saved:
+            chosen = json.loads(saved)
+        else:
+            chosen = list(profiles) if profiles is not None else [p["dir"] for p in listed]
+            if not chosen:
+                raise jobs.Cancelled("No profiles selected")
+            if journal:
+                journal.set("profiles", json.dumps(chosen))
+                journal.commit()
+        dedupe = manifest["profiles"].get("dedupe") or {}
+        state["profiles"] = set(chosen)
+        state["needed"] = frozenset(keep for dup, keep in dedupe.items() if profile_of(dup) in state["profiles"])
+        info(f"Restoring profiles: {', '.join(d or 'master' for d in chosen)}")
+
+    def control():
+        unzip_to_dir(zip_path, staging, journal=journal, only=_is_control_member)
+
+        manifest_path = os.path.join(staging, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise RuntimeError("manifest.json missing from backup zip")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        _validate_manifest(manifest)
+
+        for repo in manifest.get("repos", []):
+            rel = (repo.get("zip_in_backup") or "").strip()
+            abs_zip = os.path.join(staging, rel.replace("/", os.sep)) if rel else ""
+            repo["zip_path"] = abs_zip if abs_zip and os.path.isfile(abs_zip) else ""
+            if rel and not repo["zip_path"]:
+                warn(f"Repo zip missing in backup for {repo['id']}: expected {abs_zip}", notify=True)
+
+        state["manifest"] = manifest
+        if manifest.get("profiles"):
+            choose_profiles(manifest)
+
+        state["plan"] = plan_installs(manifest)
+        if fast and master_chosen():
+            state["tier1"] = pick_tier1(manifest, priority_addons, top_addons)
+            state["prefixes"] = tier1_prefixes(state["tier1"])
+            info(f"Fast restore tier 1: {state['tier1']}")
+
+    def xml():
+        if not master_chosen():
+            return
+        for name in XML_FILES:
+            src = os.path.join(user_stage, name)
+            dst = dst_of(name)
+            if not os.path.exists(src) or (journal and journal.done("file", dst)):
+                continue
+            if overwrite_xml or not os.path.exists(dst):
+                info(f"Restore file: {name}")
+                copy_file(src, dst)
+                if journal:
+                    journal.mark("file", dst)
+        if journal:
+            journal.commit()
+
+    def repos():
+        install_repos_phase(state["manifest"], state["report"], journal)
+
+    def addons():
+        manifest = state["manifest"]
+        if state["tier1"] is not None:
+            manifest = {**manifest, "addons": [a for a in manifest["addons"] if a in state["tier1"]]}
+        install_addons_phase(manifest, state["report"], journal, plan=state["plan"])
+
+    def userdata_extract():
+        with jobs.phase("Extracting files"):
+            unzip_to_dir(zip_path, staging, journal=journal, only=lambda n: not _is_control_member(n) and in_scope(n))
+        manifest = state["manifest"]
+        if (state["tier1"] is not None or state["profiles"] is not None) and manifest.get("deltas"):
+            deltas = manifest["deltas"]
+            files = {k: v for k, v in (deltas.get("files") or {}).items() if in_scope(k)}
+            manifest = {**manifest, "deltas": {**deltas, "files": files}}
+        if manifest.get("deltas") and not (journal and journal.done("step", "deltas")):
+            if find_base is None:
+                raise RuntimeError("Backup contains deltas but no base backup source was given")
+            n = restore_deltas(staging, manifest, find_base)
+            info(f"Rebuilt {n} delta-encoded file(s)")
+            if journal:
+                journal.mark("step", "deltas")
+                journal.commit()
+
+    def skin_dirs():
+        skin = state["manifest"].get("active_skin") or ""
+        return (skin,) if skin and master_chosen() else ()
+
+    def userdata_copy():
+        if not master_chosen():
+            return
+        with jobs.phase("Restoring files"):
+            for d in PORTABLE_DIRS:
+                src_root = os.path.join(user_stage, d)
+                if os.path.isdir(src_root):
+                    info(f"Restore dir: {d}")
+                    skip = skin_dirs() if d == "addon_data" else ()
+                    _copy_tree(src_root, dst_of(d), journal, skip_top=skip)
+
+    def profiles_copy():
+        chosen = sorted(d for d in (state["profiles"] or ()) if d)
+        if not chosen:
+            return
+        # files stored once for several profiles go back to each of them
+        for dup, keep in (state["manifest"]["profiles"].get("dedupe") or {}).items():
+            dst = os.path.join(staging, *dup.split("/"))
+            if profile_of(dup) in state["profiles"] and not os.path.exists(dst):
+                ensure_dir(os.path.dirname(dst))
+                shutil.copyfile(os.path.join(staging, *keep.split("/")), dst)
+
+        def copy_one(d):
+            src_root = os.path.join(staging, *arc_root(d).split("/"))
+            if os.path.isdir(src_root):
+                info(f"Restore profile: {d}")
+                _copy_tree(src_root, master(d), journal)
+
+        with jobs.phase("Restoring profiles"), ThreadPoolExecutor(max_workers=PROFILE_WORKERS) as pool:
+            list(pool.map(copy_one, chosen))
+
+        # register them with Kodi; profiles it already knows are left alone
+        src_xml = os.path.join(user_stage, PROFILES_XML)
+        if os.path.isfile(src_xml) and not (journal and journal.done("step", "profiles_xml")):
+            added = merge_profiles_xml(src_xml, master(PROFILES_XML), chosen)
+            info(f"profiles.xml: {added} profile(s) added")
+            if journal:
+                journal.mark("step", "profiles_xml")
+                journal.commit()
+
+    def skin_settings():
+        # Last, so installing the skin can't overwrite its restored settings
+        for skin in skin_dirs():
+            src_root = os.path.join(user_stage, "addon_data", skin)
+            if os.path.isdir(src_root):
+                info(f"Restore skin settings: {skin}")
+                _copy_tree(src_root, dst_of(f"addon_data/{skin}"), journal)
+
+    def gui_cache():
+        if journal and journal.done("step", "gui_cache"):
+            return
+        clear_gui_cache()
+        if journal:
+            journal.mark("step", "gui_cache")
+            journal.commit()
+
+    with phase("pipeline"):
+        run_stages([
+            Stage("control", control),
+            Stage("xml", xml, deps=["control"]),
+            Stage("gui_cache", gui_cache, deps=["xml"]),
+            Stage("repos", repos, deps=["gui_cache"]),
+            Stage("addons", addons, deps=["repos"]),
+            Stage("userdata_extract", userdata_extract, deps=["control"], background=True),
+            Stage("userdata_copy", userdata_copy, deps=["userdata_extract"], background=True),
+            Stage("profiles_copy", profiles_copy, deps=["userdata_extract"], background=True),
+            Stage("skin_settings", skin_settings, deps=["userdata_copy", "addons"]),
+        ])
+
+    log_summary(state["report"])
+
+    if state["tier1"] is not None:
+        plan = state["plan"]
+        deferred = [a for a in state["manifest"].get("addons", [])
+                    if a not in state["tier1"] and plan.get(a, {}).get("action") != SKIP]
+        save_plan(zip_path, deferred, state["prefixes"], keep_zip=keep_zip, steps=plan, find_base=find_base)
+
+    return state["manifest"], state["report"]
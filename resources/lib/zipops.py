@@ -1,7 +1,66 @@
+import hashlib
 import os
+import struct
 import zipfile
 import xbmcvfs
 
+from resources.lib import jobs, throttle
+
+# Local file header: 30 fixed bytes, name/extra lengths at offset 26
+_LOCAL_HEADER_SIZE = 30
+_LOCAL_HEADER_SIG = b"PK\x03\x04"
+_FLAG_DATA_DESCRIPTOR = 0x08
+_DATA_DESCRIPTOR_SIG = 0x08074B50
+_COPY_CHUNK = 1024 * 1024
+
+# Deterministic archives: every member gets the same timestamp and mode, so
+# identical inputs give byte-identical zips (and an identical SHA-1)
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FIXED_FILE_ATTR = 0o100644 << 16
+
+
+class _HashingWriter:
+    """
+    Append-only file wrapper that SHA-1s everything written. Having no seek
+    makes ZipFile stream members with data descriptors instead of going back
+    to patch headers, so the hash covers the final bytes.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._pos = 0
+        self.sha1 = hashlib.sha1()
+
+    def write(self, b) -> int:
+        self._f.write(b)
+        self.sha1.update(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, *args):
+        raise OSError("append-only")
+
+    def flush(self):
+        self._f.flush()
+
+
+def write_member(z: zipfile.ZipFile, src: str, arc: str) -> zipfile.ZipInfo:
+    """z.write() without the file's mtime/mode, so output only depends on content. Charged to throttle.disk."""
+    zinfo = zipfile.ZipInfo.from_file(src, arc)
+    zinfo.date_time = FIXED_DATE_TIME
+    zinfo.external_attr = FIXED_FILE_ATTR
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    with open(src, "rb") as fsrc, z.open(zinfo, "w") as fdst:
+        for chunk in iter(lambda: fsrc.read(_COPY_CHUNK), b""):
+            # charged once for the read, once for the (compressed) write
+            throttle.disk(2 * len(chunk))
+            fdst.write(chunk)
+    return zinfo
+
+
 def zip_from_dir(staging_dir: str, out_zip: str) -> None:
     # staging_dir/out_zip are real filesystem paths from translatePath
     with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as z:
@@ -11,6 +70,165 @@ def zip_from_dir(staging_dir: str, out_zip: str) -> None:
                 rel = os.path.relpath(full, staging_dir)
                 z.write(full, rel)
 
-def unzip_to_dir(zip_path: str, staging_dir: str) -> None:
-    with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(staging_dir)
+
+def zip_entries(out_zip: str, entries, index=None, tick=None) -> dict:
+    """
+    Build out_zip from a list of (abs_path, arcname) entries.
+    An optional third item names the file whose stat identifies the content
+    (e.g. the live DB behind a fresh snapshot); such entries are always
+    recompressed.
+
+    With a FileIndex, files whose size/mtime/inode are unchanged since the
+    last run have their compressed bytes copied raw from the previous archive
+    (no decompress/recompress). Everything else is deflated as usual.
+
+    Output is deterministic (entries in arcname order, fixed timestamps and
+    modes); stats["sha1"] is the archive's SHA-1, hashed while writing.
+
+    tick: optional callable run before each file (may block or raise).
+    """
+    tmp_zip = out_zip + ".part"
+    stats = {"files": 0, "reused": 0, "compressed": 0, "sha1": ""}
+    entries = sorted(entries, key=lambda e: e[1])
+
+    prev = None
+    prev_path = index.previous_archive() if index else ""
+    if prev_path:
+        try:
+            prev = zipfile.ZipFile(prev_path, "r")
+        except Exception:
+            prev = None
+
+    try:
+        with open(tmp_zip, "wb") as raw:
+            out = _HashingWriter(raw)
+            with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as z:
+                for entry in entries:
+                    if tick:
+                        tick()
+                    jobs.checkpoint()
+                    src, arc = entry[0], entry[1]
+                    stat_src = entry[2] if len(entry) > 2 else ""
+                    st = os.stat(stat_src or src)
+                    zinfo = None
+
+                    row = index.lookup(arc, st) if (index and prev and not stat_src) else None
+                    if row:
+                        zinfo = _copy_raw_member(prev, z, arc, row)
+
+                    if zinfo is None:
+                        zinfo = write_member(z, src, arc)
+                        stats["compressed"] += 1
+                    else:
+                        stats["reused"] += 1
+
+                    stats["files"] += 1
+                    jobs.advance(files=1, nbytes=st.st_size)
+                    if index:
+                        index.record(arc, st, zinfo)
+    finally:
+        if prev:
+            prev.close()
+
+    stats["sha1"] = out.sha1.hexdigest()
+    os.replace(tmp_zip, out_zip)
+    if index:
+        index.commit(out_zip)
+    return stats
+
+
+def _copy_raw_member(prev: zipfile.ZipFile, z: zipfile.ZipFile, arc: str, row: dict):
+    """
+    Copy one member's compressed bytes from prev into z without touching the
+    payload. Returns the new ZipInfo, or None if the member can't be reused.
+    """
+    try:
+        src = prev.getinfo(arc)
+    except KeyError:
+        return None
+
+    if src.header_offset != row["header_offset"] or src.CRC != row["crc"]:
+        return None
+    if src.compress_size != row["compress_size"]:
+        return None
+    if src.flag_bits & 0x01:  # encrypted
+        return None
+    # write_member switches to zip64 headers at file_size * 1.05
+    if src.file_size * 1.05 > zipfile.ZIP64_LIMIT or src.compress_size >= zipfile.ZIP64_LIMIT:
+        return None
+
+    fp = prev.fp
+    fp.seek(src.header_offset)
+    header = fp.read(_LOCAL_HEADER_SIZE)
+    if len(header) != _LOCAL_HEADER_SIZE or header[:4] != _LOCAL_HEADER_SIG:
+        return None
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    fp.seek(src.header_offset + _LOCAL_HEADER_SIZE + name_len + extra_len)
+
+    # Same layout write_member produces on a non-seekable stream: header
+    # with zeroed CRC/sizes, payload, then a data descriptor
+    zinfo = zipfile.ZipInfo(arc, date_time=FIXED_DATE_TIME)
+    zinfo.compress_type = src.compress_type
+    zinfo.flag_bits = src.flag_bits | _FLAG_DATA_DESCRIPTOR
+    zinfo.CRC = src.CRC
+    zinfo.compress_size = src.compress_size
+    zinfo.file_size = src.file_size
+    zinfo.external_attr = FIXED_FILE_ATTR
+    zinfo.create_system = src.create_system
+    zinfo.create_version = src.create_version
+    zinfo.extract_version = src.extract_version
+    zinfo.header_offset = z.fp.tell()
+
+    z.fp.write(zinfo.FileHeader(False))
+    remaining = src.compress_size
+    while remaining > 0:
+        chunk = fp.read(min(_COPY_CHUNK, remaining))
+        if not chunk:
+            raise IOError(f"Previous archive truncated while copying {arc}")
+        throttle.disk(2 * len(chunk))
+        z.fp.write(chunk)
+        remaining -= len(chunk)
+    z.fp.write(struct.pack("<LLLL", _DATA_DESCRIPTOR_SIG, zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+
+    z.filelist.append(zinfo)
+    z.NameToInfo[arc] = zinfo
+    z.start_dir = z.fp.tell()
+    z._didModify = True
+    return zinfo
+
+
+def _extract(z: zipfile.ZipFile, member: zipfile.ZipInfo, staging_dir: str) -> None:
+    """z.extract() with the write charged to throttle.disk (reads are charged by DiskReader)."""
+    root = os.path.realpath(staging_dir)
+    target = os.path.realpath(os.path.join(root, member.filename))
+    if os.path.commonpath([root, target]) != root:
+        raise RuntimeError(f"Backup member escapes the staging dir: {member.filename}")
+    if member.is_dir():
+        os.makedirs(target, exist_ok=True)
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with z.open(member) as fsrc, open(target, "wb") as fdst:
+        for chunk in iter(lambda: fsrc.read(_COPY_CHUNK), b""):
+            throttle.disk(len(chunk))
+            fdst.write(chunk)
+
+
+def unzip_to_dir(zip_path: str, staging_dir: str, journal=None, only=None) -> None:
+    """
+    only: optional predicate on member names, to extract a subset.
+    Reads and writes are charged to throttle.disk.
+    """
+    with open(zip_path, "rb") as raw, zipfile.ZipFile(throttle.DiskReader(raw), "r") as z:
+        # Resumable: skip members a previous (interrupted) run already wrote
+        for member in z.infolist():
+            if only is not None and not only(member.filename):
+                continue
+            jobs.checkpoint()
+            if journal is None:
+                _extract(z, member, staging_dir)
+            elif not (journal.done("member", member.filename) and os.path.exists(os.path.join(staging_dir, member.filename))):
+                _extract(z, member, staging_dir)
+                journal.mark("member", member.filename)
+            jobs.advance(files=1, nbytes=member.file_size)
+        if journal:
+            journal.commit()